@@ -152,6 +152,22 @@ def alter_user_activate_status(username):
         return error_response(str(e), 500)
 
 
+@admin_bp.route('/users/<username>/plan', methods=['PUT'])
+@login_required
+@check_admin_auth
+def alter_user_plan(username):
+    try:
+        data = request.get_json()
+        if not data or 'plan' not in data:
+            return error_response("Plan is required", 400)
+        msg = UserMgr.update_user_plan(username, data['plan'])
+        return success_response(None, msg)
+    except AdminException as e:
+        return error_response(e.message, e.code)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
 @admin_bp.route('/users/<username>', methods=['GET'])
 @login_required
 @check_admin_auth
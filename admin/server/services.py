@@ -25,6 +25,8 @@ from api.db.services.user_service import TenantService
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.utils.crypt import decrypt
 from api.utils import health_utils
+from api.multi_tenancy import SubscriptionPlan
+from rag.utils.fair_queue import publish_tenant_plan
 
 from api.common.exceptions import AdminException, UserAlreadyExistsError, UserNotFoundError
 from config import SERVICE_CONFIGS
@@ -227,6 +229,27 @@ class UserMgr:
         UserService.update_user(usr.id, {"is_active": target_status})
         return f"Turn {_activate_status} user activate status successfully!"
 
+    @staticmethod
+    def update_user_plan(username, plan: str):
+        # use email to find user. check exist and unique.
+        user_list = UserService.query_user_by_email(username)
+        if not user_list:
+            raise UserNotFoundError(username)
+        elif len(user_list) > 1:
+            raise AdminException(f"Exist more than 1 user: {username}!")
+        try:
+            target_plan = SubscriptionPlan(plan.lower())
+        except ValueError:
+            raise AdminException(f"Invalid plan: {plan}")
+        # the tenant owned by the user has the user's id, the tasks are queued under it
+        usr = user_list[0]
+        exist, tenant = TenantService.get_by_id(usr.id)
+        if not exist:
+            raise AdminException(f"User {username} owns no tenant!")
+        if not publish_tenant_plan(tenant.id, target_plan):
+            raise AdminException(f"Fail to publish the plan of user {username}!", 500)
+        return f"Set the plan of user {username} to {target_plan.value} successfully!"
+
 
 class UserServiceMgr:
 
@@ -18,13 +18,13 @@ import json
 import logging
 import re
 import time
-from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from functools import partial
 from typing import Any, Union, Tuple
 
 from agent.component import component_class
 from agent.component.base import ComponentBase
+from agent.scheduler import BatchScheduler, component_executor
 from api.db.services.file_service import FileService
 from common.misc_utils import get_uuid, hash_str2int
 from rag.prompts.generator import chunks_format
@@ -71,11 +71,11 @@ class Graph:
         }
         """
 
-    def __init__(self, dsl: str, tenant_id=None, task_id=None):
+    def __init__(self, dsl: Union[str, dict], tenant_id=None, task_id=None):
         self.path = []
         self.components = {}
         self.error = ""
-        self.dsl = json.loads(dsl)
+        self.dsl = json.loads(dsl) if isinstance(dsl, str) else dsl
         self._tenant_id = tenant_id
         self.task_id = task_id if task_id else get_uuid()
         self.load()
@@ -190,8 +190,10 @@ class Graph:
 
 
 class Canvas(Graph):
+    # Per-session mutable parts of the DSL; everything else comes from the agent and never changes.
+    STATE_KEYS = ("globals", "history", "path", "retrieval", "memory")
 
-    def __init__(self, dsl: str, tenant_id=None, task_id=None):
+    def __init__(self, dsl: Union[str, dict], tenant_id=None, task_id=None):
         self.globals = {
             "sys.query": "",
             "sys.user_id": tenant_id,
@@ -222,6 +224,31 @@ class Canvas(Graph):
         self.dsl["memory"] = self.memory
         return super().__str__()
 
+    def get_state(self) -> dict[str, Any]:
+        return {
+            "globals": self.globals,
+            "history": self.history,
+            "path": self.path,
+            "retrieval": self.retrieval,
+            "memory": self.memory,
+        }
+
+    def set_state(self, state: dict[str, Any]):
+        """Rebinds a compiled canvas to another session's state, clearing what the last run left in the components."""
+        for k, cpn in self.components.items():
+            cpn["obj"].reset()
+        self.error = ""
+        self.path = state.get("path", [])
+        self.history = state.get("history", [])
+        self.retrieval = state.get("retrieval", [])
+        self.memory = state.get("memory", [])
+        self.globals = state.get("globals") or {
+            "sys.query": "",
+            "sys.user_id": "",
+            "sys.conversation_turns": 0,
+            "sys.files": []
+        }
+
     def reset(self, mem=False):
         super().reset()
         if not mem:
@@ -278,17 +305,14 @@ class Canvas(Graph):
         yield decorate("workflow_started", {"inputs": kwargs.get("inputs")})
         self.retrieval.append({"chunks": {}, "doc_aggs": {}})
 
-        def _run_batch(f, t):
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                thr = []
-                for i in range(f, t):
-                    cpn = self.get_component_obj(self.path[i])
-                    if cpn.component_name.lower() in ["begin", "userfillup"]:
-                        thr.append(executor.submit(cpn.invoke, inputs=kwargs.get("inputs", {})))
-                    else:
-                        thr.append(executor.submit(cpn.invoke, **cpn.get_input()))
-                for t in thr:
-                    t.result()
+        def _invoke(cpn_id):
+            cpn = self.get_component_obj(cpn_id)
+            if cpn.component_name.lower() in ["begin", "userfillup"]:
+                cpn.invoke(inputs=kwargs.get("inputs", {}))
+            else:
+                cpn.invoke(**cpn.get_input())
+
+        timings = {}
 
         def _node_finished(cpn_obj):
             return decorate("node_finished",{
@@ -300,6 +324,7 @@ class Canvas(Graph):
                            "error": cpn_obj.error(),
                            "elapsed_time": time.perf_counter() - cpn_obj.output("_created_time"),
                            "created_at": cpn_obj.output("_created_time"),
+                           **timings.get(cpn_obj._id, {})
                        })
 
         self.error = ""
@@ -315,9 +340,10 @@ class Canvas(Graph):
                     "component_type": self.get_component_type(self.path[i]),
                     "thoughts": self.get_component_thoughts(self.path[i])
                 })
-            _run_batch(idx, to)
-            # post processing of components invocation
+            batch = BatchScheduler(self, self.path[idx:to], _invoke).start()
+            # post processing of components invocation, as soon as each one finishes
             for i in range(idx, to):
+                timings[self.path[i]] = batch.wait(i - idx)
                 cpn = self.get_component(self.path[i])
                 cpn_obj = self.get_component_obj(self.path[i])
                 if cpn_obj.component_name.lower() == "message":
@@ -473,13 +499,12 @@ class Canvas(Graph):
         def image_to_base64(file):
             return "data:{};base64,{}".format(file["mime_type"],
                                         base64.b64encode(FileService.get_blob(file["created_by"], file["id"])).decode("utf-8"))
-        exe = ThreadPoolExecutor(max_workers=5)
         threads = []
         for file in files:
             if file["mime_type"].find("image") >=0:
-                threads.append(exe.submit(image_to_base64, file))
+                threads.append(component_executor.submit(image_to_base64, file))
                 continue
-            threads.append(exe.submit(FileService.parse, file["name"], FileService.get_blob(file["created_by"], file["id"]), True, file["created_by"]))
+            threads.append(component_executor.submit(FileService.parse, file["name"], FileService.get_blob(file["created_by"], file["id"]), True, file["created_by"]))
         return [th.result() for th in threads]
 
     def tool_use_callback(self, agent_id: str, func_name: str, params: dict, result: Any, elapsed_time=None):
@@ -0,0 +1,177 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from agent.settings import MAX_CONCURRENT_COMPONENTS, MAX_CONCURRENT_TOOL_CALLS
+
+
+class SharedExecutor:
+    """
+    A process wide, bounded thread pool.
+
+    Work submitted from one of the pool's own worker threads is executed inline,
+    so nested usage (e.g. an agent used as a tool by another agent) can never
+    dead-lock on a saturated pool.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str):
+        self._max_workers = max_workers
+        self._thread_name_prefix = thread_name_prefix
+        self._local = threading.local()
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix=self._thread_name_prefix)
+        return self._pool
+
+    def _run(self, fn: Callable, *args, **kwargs):
+        self._local.in_worker = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._local.in_worker = False
+
+    def in_worker(self) -> bool:
+        """Whether the calling thread is one of the pool's workers."""
+        return getattr(self._local, "in_worker", False)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if self.in_worker():
+            fut = Future()
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                fut.set_exception(e)
+            return fut
+        return self.dispatch(fn, *args, **kwargs)
+
+    def dispatch(self, fn: Callable, *args, **kwargs) -> Future:
+        """Always enqueue, even from a worker thread. Only safe for work the caller never blocks on."""
+        return self._get_pool().submit(self._run, fn, *args, **kwargs)
+
+
+component_executor = SharedExecutor(MAX_CONCURRENT_COMPONENTS, "canvas_cpn")
+tool_executor = SharedExecutor(MAX_CONCURRENT_TOOL_CALLS, "agent_tool")
+
+
+class _Node:
+    __slots__ = ("index", "cpn_id", "deps", "dependents", "done", "ready_at", "started_at", "finished_at", "error")
+
+    def __init__(self, index: int, cpn_id: str):
+        self.index = index
+        self.cpn_id = cpn_id
+        self.deps = set()
+        self.dependents = []
+        self.done = threading.Event()
+        self.ready_at = None
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+
+
+class BatchScheduler:
+    """
+    Runs one batch of a canvas path on the shared component pool.
+
+    The components of a batch are ordered by the `upstream` links of the DSL:
+    a component starts as soon as every upstream component that belongs to the
+    same batch has finished, so independent branches overlap while dependent
+    ones see fresh outputs. Callers consume results in path order through
+    `wait()`, which lets the canvas stream a finished node while its siblings
+    are still running.
+
+    Every component is dispatched the same way: enqueued on the pool, or, for a
+    batch started from one of the pool's workers (a canvas nested in a component),
+    run inline in path order, since that worker blocks on the batch and the pool
+    may have no other worker left for it.
+    """
+
+    def __init__(self, canvas, cpn_ids: list[str], invoke: Callable[[str], Any]):
+        self._canvas = canvas
+        self._invoke = invoke
+        self._lock = threading.Lock()
+        self._nodes = [_Node(i, cid) for i, cid in enumerate(cpn_ids)]
+        self._inline = False
+        self._build_graph()
+
+    def _build_graph(self):
+        for node in self._nodes:
+            upstream = set(self._canvas.get_component(node.cpn_id).get("upstream", []))
+            for prev in self._nodes[:node.index]:
+                # Same component twice in a batch is serialized to avoid racing on its outputs.
+                if prev.cpn_id in upstream or prev.cpn_id == node.cpn_id:
+                    node.deps.add(prev.index)
+                    prev.dependents.append(node)
+
+    def start(self):
+        self._inline = component_executor.in_worker()
+        for node in [n for n in self._nodes if not n.deps]:
+            self._schedule(node)
+        return self
+
+    def _schedule(self, node: _Node):
+        node.ready_at = time.perf_counter()
+        if self._inline:
+            self._execute(node)
+        else:
+            component_executor.dispatch(self._execute, node)
+
+    def _execute(self, node: _Node):
+        node.started_at = time.perf_counter()
+        try:
+            self._invoke(node.cpn_id)
+        except BaseException as e:
+            node.error = e
+        finally:
+            node.finished_at = time.perf_counter()
+            ready = []
+            with self._lock:
+                for dep in node.dependents:
+                    dep.deps.discard(node.index)
+                    if not dep.deps:
+                        ready.append(dep)
+            node.done.set()
+            for dep in ready:
+                # Dispatched from the finishing worker, which frees its slot right after.
+                self._schedule(dep)
+
+    def wait(self, index: int) -> dict[str, float]:
+        node = self._nodes[index]
+        node.done.wait()
+        if node.error is not None:
+            raise node.error
+        return self.timing(index)
+
+    def timing(self, index: int) -> dict[str, float]:
+        node = self._nodes[index]
+        if node.finished_at is None:
+            return {}
+        return {
+            "queue_time": max(0.0, node.started_at - node.ready_at),
+            "run_time": node.finished_at - node.started_at,
+        }
+
+    def join(self):
+        for node in self._nodes:
+            node.done.wait()
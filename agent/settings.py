@@ -13,6 +13,9 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import os
 
 FLOAT_ZERO = 1e-8
 PARAM_MAXDEPTH = 5
+MAX_CONCURRENT_COMPONENTS = int(os.environ.get("MAX_CONCURRENT_CANVAS_COMPONENTS", 16))
+MAX_CONCURRENT_TOOL_CALLS = int(os.environ.get("MAX_CONCURRENT_AGENT_TOOL_CALLS", 16))
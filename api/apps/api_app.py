@@ -889,7 +889,7 @@ def retrieval():
         ranks = settings.retriever.retrieval(question, embd_mdl, kbs[0].tenant_id, kb_ids, page, size,
                                                similarity_threshold, vector_similarity_weight, top,
                                                doc_ids, rerank_mdl=rerank_mdl, highlight= highlight,
-                                               rank_feature=label_question(question, kbs))
+                                               rank_feature=label_question(question, kbs), return_vector=False)
         for c in ranks["chunks"]:
             c.pop("vector", None)
         return get_json_result(data=ranks)
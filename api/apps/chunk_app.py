@@ -143,7 +143,7 @@ def set():
     if "tag_kwd" in req:
         d["tag_kwd"] = req["tag_kwd"]
     if "tag_feas" in req:
-        d["tag_feas"] = req["tag_feas"]
+        search.set_tag_features(d, req["tag_feas"])
     if "available_int" in req:
         d["available_int"] = req["available_int"]
 
@@ -242,9 +242,7 @@ def create():
     d["create_time"] = str(datetime.datetime.now()).replace("T", " ")[:19]
     d["create_timestamp_flt"] = datetime.datetime.now().timestamp()
     if "tag_feas" in req:
-        d["tag_feas"] = req["tag_feas"]
-    if "tag_feas" in req:
-        d["tag_feas"] = req["tag_feas"]
+        search.set_tag_features(d, req["tag_feas"])
 
     try:
         e, doc = DocumentService.get_by_id(req["doc_id"])
@@ -353,7 +351,8 @@ def retrieval_test():
                                top,
                                doc_ids, rerank_mdl=rerank_mdl,
                                              highlight=req.get("highlight", False),
-                               rank_feature=labels
+                               rank_feature=labels,
+                               return_vector=False
                                )
         if use_kg:
             ck = settings.kg_retriever.retrieval(question,
@@ -28,6 +28,7 @@ from api.db.services.search_service import SearchService
 from api.db.services.tenant_llm_service import TenantLLMService
 from api.db.services.user_service import TenantService, UserTenantService
 from api.utils.api_utils import get_data_error_result, get_json_result, server_error_response, validate_request
+from api.utils.stream_utils import DeltaEncoder, sse_frame
 from rag.prompts.template import load_prompt
 from rag.prompts.generator import chunks_format
 from common.constants import RetCode
@@ -217,12 +218,18 @@ def completion():
             dia.llm_setting = chat_model_config
 
         is_embedded = bool(chat_model_id)
+        delta_encoder = DeltaEncoder() if req.pop("delta", False) else None
         def stream():
             nonlocal dia, msg, req, conv
             try:
+                last = None
                 for ans in chat(dia, msg, True, **req):
-                    ans = structure_answer(conv, ans, message_id, conv.id)
-                    yield "data:" + json.dumps({"code": 0, "message": "", "data": ans}, ensure_ascii=False) + "\n\n"
+                    ans = last = structure_answer(conv, ans, message_id, conv.id)
+                    if delta_encoder:
+                        ans = delta_encoder.encode(ans)
+                    yield sse_frame({"code": 0, "message": "", "data": ans})
+                if delta_encoder and last is not None:
+                    yield sse_frame({"code": 0, "message": "", "data": delta_encoder.finish(last)})
                 if not is_embedded:
                     ConversationService.update_by_id(conv.id, conv.to_dict())
             except Exception as e:
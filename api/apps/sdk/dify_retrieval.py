@@ -149,7 +149,8 @@ def retrieval(tenant_id):
             vector_similarity_weight=0.3,
             top=top,
             doc_ids=doc_ids,
-            rank_feature=label_question(question, [kb])
+            rank_feature=label_question(question, [kb]),
+            return_vector=False
         )
 
         if use_kg:
@@ -94,6 +94,11 @@ def upload(dataset_id, tenant_id):
         type: file
         required: true
         description: Document files to upload.
+      - in: formData
+        name: bulk
+        type: boolean
+        required: false
+        description: Bulk mode for large uploads. Returns a result per file instead of failing the whole request.
     responses:
       200:
         description: Successfully uploaded documents.
@@ -152,26 +157,30 @@ def upload(dataset_id, tenant_id):
     e, kb = KnowledgebaseService.get_by_id(dataset_id)
     if not e:
         raise LookupError(f"Can't find the dataset with ID {dataset_id}!")
-    err, files = FileService.upload_document(kb, file_objs, tenant_id)
-    if err:
-        return get_result(message="\n".join(err), code=RetCode.SERVER_ERROR)
-    # rename key's name
-    renamed_doc_list = []
-    for file in files:
-        doc = file[0]
-        key_mapping = {
-            "chunk_num": "chunk_count",
-            "kb_id": "dataset_id",
-            "token_num": "token_count",
-            "parser_id": "chunk_method",
-        }
+    key_mapping = {
+        "chunk_num": "chunk_count",
+        "kb_id": "dataset_id",
+        "token_num": "token_count",
+        "parser_id": "chunk_method",
+    }
+
+    def rename(doc):
         renamed_doc = {}
         for key, value in doc.items():
             new_key = key_mapping.get(key, key)
             renamed_doc[new_key] = value
         renamed_doc["run"] = "UNSTART"
-        renamed_doc_list.append(renamed_doc)
-    return get_result(data=renamed_doc_list)
+        return renamed_doc
+
+    if request.form.get("bulk", "").lower() == "true":
+        results = FileService.upload_documents_bulk(kb, file_objs, tenant_id)
+        return get_result(data=[{"name": r["name"], "document": rename(r["doc"]) if r["doc"] else None, "error": r["error"]} for r in results])
+
+    err, files = FileService.upload_document(kb, file_objs, tenant_id)
+    if err:
+        return get_result(message="\n".join(err), code=RetCode.SERVER_ERROR)
+    # rename key's name
+    return get_result(data=[rename(file[0]) for file in files])
 
 
 @manager.route("/datasets/<dataset_id>/documents/<document_id>", methods=["PUT"])  # noqa: F821
@@ -1478,6 +1487,7 @@ def retrieval_test(tenant_id):
             rerank_mdl=rerank_mdl,
             highlight=highlight,
             rank_feature=label_question(question, kbs),
+            return_vector=False,
         )
         if use_kg:
             ck = settings.kg_retriever.retrieval(question, [k.tenant_id for k in kbs], kb_ids, embd_mdl, LLMBundle(kb.tenant_id, LLMType.CHAT))
@@ -289,7 +289,7 @@ def chat_completion_openai_like(tenant_id, chat_id):
                     reasoning_incremental = ""
                     if reasoning_part:
                         if reasoning_part.startswith(reasoning_cache):
-                            reasoning_incremental = reasoning_part.replace(reasoning_cache, "", 1)
+                            reasoning_incremental = reasoning_part[len(reasoning_cache):]
                         else:
                             reasoning_incremental = reasoning_part
                         reasoning_cache = reasoning_part
@@ -297,7 +297,7 @@ def chat_completion_openai_like(tenant_id, chat_id):
                     content_incremental = ""
                     if content_part:
                         if content_part.startswith(answer_cache):
-                            content_incremental = content_part.replace(answer_cache, "", 1)
+                            content_incremental = content_part[len(answer_cache):]
                     else:
                         content_incremental = content_part
                     answer_cache = content_part
@@ -1018,7 +1018,8 @@ def retrieval_test_embedded():
         labels = label_question(question, [kb])
         ranks = settings.retriever.retrieval(
             question, embd_mdl, tenant_ids, kb_ids, page, size, similarity_threshold, vector_similarity_weight, top,
-            doc_ids, rerank_mdl=rerank_mdl, highlight=req.get("highlight"), rank_feature=labels
+            doc_ids, rerank_mdl=rerank_mdl, highlight=req.get("highlight"), rank_feature=labels,
+            return_vector=False
         )
         if use_kg:
             ck = settings.kg_retriever.retrieval(question, tenant_ids, kb_ids, embd_mdl,
@@ -785,6 +785,7 @@ class Document(DataBaseModel):
     process_duration = FloatField(default=0)
     meta_fields = JSONField(null=True, default={})
     suffix = CharField(max_length=32, null=False, help_text="The real file extension suffix", index=True)
+    content_hash = CharField(max_length=32, null=True, help_text="xxh128 of the file content", index=True)
 
     run = CharField(max_length=1, null=True, help_text="start to run processing or cancel.(1: run it; 2: cancel)", default="0", index=True)
     status = CharField(max_length=1, null=True, help_text="is it validate(0: wasted, 1: validate)", default="1", index=True)
@@ -833,6 +834,7 @@ class Task(DataBaseModel):
     retry_count = IntegerField(default=0)
     digest = TextField(null=True, help_text="task digest", default="")
     chunk_ids = LongTextField(null=True, help_text="chunk ids", default="")
+    content_digest = CharField(max_length=32, null=True, help_text="digest of content hash and parsing config", index=True)
 
 
 class Dialog(DataBaseModel):
@@ -912,6 +914,16 @@ class API4Conversation(DataBaseModel):
         db_table = "api_4_conversation"
 
 
+class API4ConversationTurn(DataBaseModel):
+    id = CharField(max_length=32, primary_key=True)
+    conversation_id = CharField(max_length=32, null=False, index=True)
+    turn = IntegerField(default=0, index=True)
+    state = JSONField(null=True, default={}, help_text="checkpoint or per-turn delta of the canvas session state")
+
+    class Meta:
+        db_table = "api_4_conversation_turn"
+
+
 class UserCanvas(DataBaseModel):
     id = CharField(max_length=32, primary_key=True)
     avatar = TextField(null=True, help_text="avatar base64 string")
@@ -1326,6 +1338,14 @@ def migrate_db():
         migrate(migrator.add_column("tenant_llm", "status", CharField(max_length=1, null=False, help_text="is it validate(0: wasted, 1: validate)", default="1", index=True)))
     except Exception:
         pass
+    try:
+        migrate(migrator.add_column("document", "content_hash", CharField(max_length=32, null=True, help_text="xxh128 of the file content", index=True)))
+    except Exception:
+        pass
+    try:
+        migrate(migrator.add_column("task", "content_digest", CharField(max_length=32, null=True, help_text="digest of content hash and parsing config", index=True)))
+    except Exception:
+        pass
     
     # Enterprise RBAC Tables Migration
     try:
@@ -13,11 +13,12 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import json
 from datetime import datetime
 
 import peewee
 
-from api.db.db_models import DB, API4Conversation, APIToken, Dialog
+from api.db.db_models import DB, API4Conversation, API4ConversationTurn, APIToken, Dialog
 from api.db.services.common_service import CommonService
 from common.time_utils import current_timestamp, datetime_format
 
@@ -71,9 +72,16 @@ class API4ConversationService(CommonService):
         else:
             sessions = sessions.order_by(cls.model.getter_by(orderby).asc())
         count = sessions.count()
-        sessions = sessions.paginate(page_number, items_per_page)
+        sessions = list(sessions.paginate(page_number, items_per_page).dicts())
+        if include_dsl and sessions:
+            # Agent sessions keep their state in turn records, the dsl column only holds it as of creation.
+            states = API4ConversationTurnService.get_states([s["id"] for s in sessions])
+            for session in sessions:
+                if session["id"] in states and session["dsl"]:
+                    dsl = json.loads(session["dsl"]) if isinstance(session["dsl"], str) else session["dsl"]
+                    session["dsl"] = dict(dsl, **states[session["id"]])
 
-        return count, list(sessions.dicts())
+        return count, sessions
 
     @classmethod
     @DB.connection_context()
@@ -81,6 +89,21 @@ class API4ConversationService(CommonService):
         cls.update_by_id(id, conversation)
         return cls.model.update(round=cls.model.round + 1).where(cls.model.id == id).execute()
 
+    @classmethod
+    @DB.connection_context()
+    def get_without_dsl(cls, id):
+        fields = [field for field in cls.model._meta.fields.values() if field.name != "dsl"]
+        conv = cls.model.select(*fields).where(cls.model.id == id).first()
+        if not conv:
+            return False, None
+        return True, conv
+
+    @classmethod
+    @DB.connection_context()
+    def get_dsl(cls, id):
+        conv = cls.model.select(cls.model.dsl).where(cls.model.id == id).first()
+        return conv.dsl if conv else None
+
     @classmethod
     @DB.connection_context()
     def stats(cls, tenant_id, from_date, to_date, source=None):
@@ -109,4 +132,72 @@ class API4ConversationService(CommonService):
     @classmethod
     @DB.connection_context()
     def delete_by_dialog_ids(cls, dialog_ids):
+        convs = cls.model.select(cls.model.id).where(cls.model.dialog_id.in_(dialog_ids))
+        API4ConversationTurn.delete().where(API4ConversationTurn.conversation_id.in_(convs)).execute()
         return cls.model.delete().where(cls.model.dialog_id.in_(dialog_ids)).execute()
+
+    @classmethod
+    @DB.connection_context()
+    def delete_by_id(cls, pid):
+        API4ConversationTurnService.delete_by_conversation_id(pid)
+        return super().delete_by_id(pid)
+
+
+class API4ConversationTurnService(CommonService):
+    """
+    Incremental records of an agent session's mutable canvas state.
+
+    The records of a session are a checkpoint holding the whole state, followed by
+    one delta per turn. Writing a new checkpoint drops everything before it, so a
+    session never has more than `checkpoint interval` records to replay. In a delta,
+    `key+` extends a list and `key~` updates a dict; any other key replaces the value.
+    """
+    model = API4ConversationTurn
+
+    @staticmethod
+    def replay(records):
+        state = {}
+        for r in records:
+            for k, v in r["state"].items():
+                if k.endswith("+"):
+                    state.setdefault(k[:-1], []).extend(v)
+                elif k.endswith("~"):
+                    state.setdefault(k[:-1], {}).update(v)
+                else:
+                    state[k] = v
+        return state
+
+    @classmethod
+    @DB.connection_context()
+    def get_records(cls, conversation_id):
+        return list(cls.model.select(cls.model.turn, cls.model.state)
+                    .where(cls.model.conversation_id == conversation_id)
+                    .order_by(cls.model.turn.asc()).dicts())
+
+    @classmethod
+    @DB.connection_context()
+    def get_states(cls, conversation_ids):
+        records = {}
+        for r in (cls.model.select(cls.model.conversation_id, cls.model.turn, cls.model.state)
+                  .where(cls.model.conversation_id.in_(conversation_ids))
+                  .order_by(cls.model.conversation_id, cls.model.turn.asc()).dicts()):
+            records.setdefault(r["conversation_id"], []).append(r)
+        states = {}
+        for conversation_id, rs in records.items():
+            state = cls.replay(rs)
+            state.pop("dsl_digest", None)
+            states[conversation_id] = state
+        return states
+
+    @classmethod
+    @DB.connection_context()
+    def append(cls, conversation_id, turn, state, checkpoint=False):
+        with DB.atomic():
+            cls.insert(conversation_id=conversation_id, turn=turn, state=state)
+            if checkpoint:
+                cls.model.delete().where((cls.model.conversation_id == conversation_id) & (cls.model.turn < turn)).execute()
+
+    @classmethod
+    @DB.connection_context()
+    def delete_by_conversation_id(cls, conversation_id):
+        return cls.model.delete().where(cls.model.conversation_id == conversation_id).execute()
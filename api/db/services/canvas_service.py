@@ -15,12 +15,19 @@
 #
 import json
 import logging
+import os
+import threading
 import time
+from copy import deepcopy
 from uuid import uuid4
+
+import xxhash
+from cachetools import LRUCache
+
 from agent.canvas import Canvas
 from api.db import CanvasCategory, TenantPermission
 from api.db.db_models import DB, CanvasTemplate, User, UserCanvas, API4Conversation
-from api.db.services.api_service import API4ConversationService
+from api.db.services.api_service import API4ConversationService, API4ConversationTurnService
 from api.db.services.common_service import CommonService
 from common.misc_utils import get_uuid
 from api.utils.api_utils import get_data_openai
@@ -176,6 +183,125 @@ class UserCanvasService(CommonService):
         return True
 
 
+CANVAS_SESSION_CHECKPOINT_TURNS = int(os.environ.get("CANVAS_SESSION_CHECKPOINT_TURNS", 16))
+CANVAS_POOL_IDLE_PER_AGENT = int(os.environ.get("CANVAS_POOL_IDLE_PER_AGENT", 8))
+
+
+class CanvasSession:
+    """
+    The canvas of an agent conversation, kept as the immutable agent DSL plus per-session state.
+
+    Compiled canvases are pooled per (DSL digest, tenant, agent), so a turn neither parses the DSL
+    nor instantiates its components again. The session state (globals, history, path, retrieval,
+    memory) is persisted by API4ConversationTurnService as a delta per turn with a checkpoint every
+    CANVAS_SESSION_CHECKPOINT_TURNS turns, so loading and saving a turn no longer rewrites the
+    whole conversation. A delta holds what the turn added to the lists and the globals it changed.
+    """
+    APPEND_ONLY_KEYS = ("history", "retrieval", "memory")
+
+    _pool = LRUCache(maxsize=int(os.environ.get("CANVAS_POOL_SIZE", 256)))
+    _pool_lock = threading.Lock()
+
+    def __init__(self, conv_id, key, canvas, turn, deltas):
+        self.conv_id = conv_id
+        self.canvas = canvas
+        self._key = key
+        self._turn = turn
+        # Deltas written since the last checkpoint, None if the next save has to write one.
+        self._deltas = deltas
+        self._mark()
+
+    def _mark(self):
+        state = self.canvas.get_state()
+        self._lists = {k: (state[k], len(state[k])) for k in self.APPEND_ONLY_KEYS}
+        # The path is rebuilt by every run and the globals are updated in place: keep copies to diff with.
+        self._path = list(state["path"])
+        self._globals = deepcopy(state["globals"])
+
+    @staticmethod
+    def _split(dsl):
+        if isinstance(dsl, str):
+            dsl = json.loads(dsl)
+        agent_dsl = {k: v for k, v in dsl.items() if k not in Canvas.STATE_KEYS and k != "task_id"}
+        state = {k: dsl[k] for k in Canvas.STATE_KEYS if k in dsl}
+        return agent_dsl, state
+
+    @staticmethod
+    def _digest(agent_dsl):
+        return xxhash.xxh64(json.dumps(agent_dsl, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def _acquire(cls, key, load_agent_dsl):
+        _, tenant_id, agent_id = key
+        with cls._pool_lock:
+            entry = cls._pool.get(key)
+            if entry and entry[1]:
+                return entry[1].pop()
+        agent_dsl = entry[0] if entry else load_agent_dsl()
+        with cls._pool_lock:
+            if key not in cls._pool:
+                cls._pool[key] = (agent_dsl, [])
+        dsl = dict(agent_dsl, components=deepcopy(agent_dsl["components"]), history=[], path=[], retrieval=[])
+        return Canvas(dsl, tenant_id, agent_id)
+
+    @classmethod
+    def open(cls, conv_id, tenant_id, agent_id, dsl=None):
+        records = API4ConversationTurnService.get_records(conv_id) if dsl is None else []
+        if records and records[0]["state"].get("dsl_digest"):
+            state = API4ConversationTurnService.replay(records)
+            key = (state.pop("dsl_digest"), tenant_id, agent_id)
+            canvas = cls._acquire(key, lambda: cls._split(API4ConversationService.get_dsl(conv_id))[0])
+            canvas.set_state(state)
+            return cls(conv_id, key, canvas, records[-1]["turn"], len(records) - 1)
+
+        # A new session, or one stored as a whole DSL before session records existed.
+        if dsl is None:
+            dsl = API4ConversationService.get_dsl(conv_id)
+        agent_dsl, state = cls._split(dsl)
+        key = (cls._digest(agent_dsl), tenant_id, agent_id)
+        canvas = cls._acquire(key, lambda: agent_dsl)
+        canvas.set_state(state)
+        return cls(conv_id, key, canvas, records[-1]["turn"] if records else 0, None)
+
+    def save(self):
+        state = self.canvas.get_state()
+        self._turn += 1
+        checkpoint = self._deltas is None or self._deltas + 1 >= CANVAS_SESSION_CHECKPOINT_TURNS
+        if checkpoint:
+            record = dict(state, dsl_digest=self._key[0])
+            self._deltas = 0
+        else:
+            record = {}
+            for k in self.APPEND_ONLY_KEYS:
+                lst, n = self._lists[k]
+                if state[k] is not lst or len(lst) < n:
+                    record[k] = state[k]
+                elif len(lst) > n:
+                    record[k + "+"] = lst[n:]
+            path, n = state["path"], len(self._path)
+            if path[:n] != self._path:
+                record["path"] = path
+            elif len(path) > n:
+                record["path+"] = path[n:]
+            globs = state["globals"]
+            if any(k not in globs for k in self._globals):
+                record["globals"] = globs
+            else:
+                changed = {k: v for k, v in globs.items() if k not in self._globals or self._globals[k] != v}
+                if changed:
+                    record["globals~"] = changed
+            self._deltas += 1
+        API4ConversationTurnService.append(self.conv_id, self._turn, record, checkpoint)
+        self._mark()
+
+    def close(self):
+        # Only called after a turn ran to completion: an abandoned run may still own component threads.
+        with self._pool_lock:
+            entry = self._pool.get(self._key)
+            if entry is not None and len(entry[1]) < CANVAS_POOL_IDLE_PER_AGENT:
+                entry[1].append(self.canvas)
+
+
 def completion(tenant_id, agent_id, session_id=None, **kwargs):
     query = kwargs.get("query", "") or kwargs.get("question", "")
     files = kwargs.get("files", [])
@@ -183,13 +309,11 @@ def completion(tenant_id, agent_id, session_id=None, **kwargs):
     user_id = kwargs.get("user_id", "")
 
     if session_id:
-        e, conv = API4ConversationService.get_by_id(session_id)
+        e, conv = API4ConversationService.get_without_dsl(session_id)
         assert e, "Session not found!"
         if not conv.message:
             conv.message = []
-        if not isinstance(conv.dsl, str):
-            conv.dsl = json.dumps(conv.dsl, ensure_ascii=False)
-        canvas = Canvas(conv.dsl, tenant_id, agent_id)
+        session = CanvasSession.open(session_id, tenant_id, agent_id)
     else:
         e, cvs = UserCanvasService.get_by_id(agent_id)
         assert e, "Agent not found."
@@ -197,8 +321,6 @@ def completion(tenant_id, agent_id, session_id=None, **kwargs):
         if not isinstance(cvs.dsl, str):
             cvs.dsl = json.dumps(cvs.dsl, ensure_ascii=False)
         session_id=get_uuid()
-        canvas = Canvas(cvs.dsl, tenant_id, agent_id)
-        canvas.reset()
         conv = {
             "id": session_id,
             "dialog_id": cvs.id,
@@ -210,6 +332,9 @@ def completion(tenant_id, agent_id, session_id=None, **kwargs):
         }
         API4ConversationService.save(**conv)
         conv = API4Conversation(**conv)
+        session = CanvasSession.open(session_id, tenant_id, agent_id, dsl=cvs.dsl)
+        session.canvas.reset()
+    canvas = session.canvas
 
     message_id = str(uuid4())
     conv.message.append({
@@ -227,9 +352,9 @@ def completion(tenant_id, agent_id, session_id=None, **kwargs):
     conv.message.append({"role": "assistant", "content": txt, "created_at": time.time(), "id": message_id})
     conv.reference = canvas.get_reference()
     conv.errors = canvas.error
-    conv.dsl = str(canvas)
-    conv = conv.to_dict()
-    API4ConversationService.append_message(conv["id"], conv)
+    session.save()
+    API4ConversationService.append_message(session_id, {"message": conv.message, "reference": conv.reference, "errors": conv.errors})
+    session.close()
 
 
 def completion_openai(tenant_id, agent_id, question, session_id=None, stream=True, **kwargs):
@@ -14,18 +14,24 @@
 #  limitations under the License.
 #
 import logging
+import os
 from datetime import datetime
+from pathlib import Path
 
-from anthropic import BaseModel
+import xxhash
 from peewee import SQL, fn
 
-from api.db import InputType, TaskStatus
-from api.db.db_models import Connector, SyncLogs, Connector2Kb, Knowledgebase
+from api.constants import FILE_NAME_LEN_LIMIT
+from api.db import FileType, InputType, TaskStatus
+from api.db.db_models import DB, Connector, SyncLogs, Connector2Kb, Knowledgebase
+from api.db.services import duplicate_name
 from api.db.services.common_service import CommonService
 from api.db.services.document_service import DocumentService
 from api.db.services.file_service import FileService
+from api.utils.file_utils import filename_type, thumbnail_img
 from common.misc_utils import get_uuid
 from common.time_utils import current_timestamp, timestamp_to_date
+from rag.utils.storage_factory import STORAGE_IMPL
 
 
 class ConnectorService(CommonService):
@@ -67,6 +73,10 @@ class SyncLogsService(CommonService):
 
     @classmethod
     def list_sync_tasks(cls, connector_id=None, page_number=None, items_per_page=15):
+        """
+        The sync tasks of a connector or, without `connector_id`, every task waiting for the next poll of its
+        connector, with `due_in`: the seconds left before it's due, negative once it is.
+        """
         fields = [
             cls.model.id,
             cls.model.connector_id,
@@ -86,7 +96,9 @@ class SyncLogsService(CommonService):
         ]
         if not connector_id:
             fields.append(Connector.config)
-            
+            due_at = SQL("`t1`.`update_date` + INTERVAL `t2`.`refresh_freq` MINUTE")
+            fields.append(fn.TIMESTAMPDIFF(SQL("SECOND"), fn.NOW(), due_at).alias("due_in"))
+
         query = cls.model.select(*fields)\
             .join(Connector, on=(cls.model.connector_id==Connector.id))\
             .join(Connector2Kb, on=(cls.model.kb_id==Connector2Kb.kb_id))\
@@ -95,12 +107,10 @@ class SyncLogsService(CommonService):
         if connector_id:
             query = query.where(cls.model.connector_id == connector_id)
         else:
-            interval_expr = SQL("INTERVAL `t2`.`refresh_freq` MINUTE")
             query = query.where(
                 Connector.input_type == InputType.POLL,
                 Connector.status == TaskStatus.SCHEDULE,
-                cls.model.status == TaskStatus.SCHEDULE,
-                cls.model.update_date < (fn.NOW() - interval_expr)
+                cls.model.status == TaskStatus.SCHEDULE
             )
 
         query = query.distinct().order_by(cls.model.update_time.desc())
@@ -156,29 +166,80 @@ class SyncLogsService(CommonService):
             .where(cls.model.id == id).execute()
 
     @classmethod
-    def duplicate_and_parse(cls, kb, docs, tenant_id, src):
-        if not docs:
-            return None
-
-        class FileObj(BaseModel):
-            filename: str
-            blob: bytes
+    def store_document(cls, kb, doc):
+        """
+        Put the blob of a synchronized document, and its thumbnail, in the storage of the KB.
+        Returns what `insert_documents` needs to add the document, the blob can be dropped.
+        """
+        filename = doc["semantic_identifier"] + f".{doc['extension']}"
+        if len(filename.encode("utf-8")) > FILE_NAME_LEN_LIMIT:
+            raise RuntimeError("Exceed the maximum length of file name!")
+        filetype = filename_type(filename)
+        if filetype == FileType.OTHER.value:
+            raise RuntimeError("This type of file has not been supported yet!")
+        doc_id = get_uuid()
+        # Stored concurrently and before the document names are deduplicated, so under a location of its own.
+        location, blob = FileService.store_blob(kb.id, f"{doc_id}_{filename}", filetype, doc["blob"])
+        thumbnail_location = ""
+        try:
+            img = thumbnail_img(filename, blob)
+            if img is not None:
+                thumbnail_location = f"thumbnail_{doc_id}.png"
+                STORAGE_IMPL.put(kb.id, thumbnail_location, img)
+        except Exception:
+            logging.exception(f"Fail to generate thumbnail for {filename}")
+        return {"id": doc_id, "name": filename, "type": filetype, "location": location, "size": len(blob),
+                "thumbnail": thumbnail_location, "content_hash": xxhash.xxh128(blob).hexdigest()}
 
-            def read(self) -> bytes:
-                return self.blob
+    @classmethod
+    @DB.connection_context()
+    def insert_documents(cls, kb, stored, tenant_id, src):
+        """Add the documents stored by `store_document` to the KB in bulk and queue their parsing."""
+        if not stored:
+            return [], []
+        root_folder = FileService.get_root_folder(tenant_id)
+        FileService.init_knowledgebase_docs(root_folder["id"], tenant_id)
+        kb_folder = FileService.new_a_file_from_kb(kb.tenant_id, kb.name, FileService.get_kb_folder(tenant_id)["id"])
+
+        errs, docs = [], []
+        quota = int(os.environ.get("MAX_FILE_NUM_PER_USER", 0))
+        remaining = quota - DocumentService.get_doc_count(kb.tenant_id) if quota > 0 else len(stored)
+        taken = DocumentService.get_taken_names(kb.id, [s["name"] for s in stored])
+        for s in stored:
+            if remaining <= 0:
+                errs.append(s["name"] + ": Exceed the maximum file number of a free user!")
+                STORAGE_IMPL.rm(kb.id, s["location"])
+                continue
+            remaining -= 1
+            filename = duplicate_name(lambda name, **_: name in taken, name=s["name"])
+            taken.add(filename)
+            docs.append({
+                "id": s["id"],
+                "kb_id": kb.id,
+                "parser_id": FileService.get_parser(s["type"], filename, kb.parser_id),
+                "pipeline_id": kb.pipeline_id,
+                "parser_config": kb.parser_config,
+                "created_by": tenant_id,
+                "type": s["type"],
+                "name": filename,
+                "source_type": src,
+                "suffix": Path(filename).suffix.lstrip("."),
+                "location": s["location"],
+                "size": s["size"],
+                "thumbnail": s["thumbnail"],
+                "content_hash": s["content_hash"],
+            })
+        try:
+            DocumentService.insert_many_docs(docs)
+            FileService.add_files_from_kb(docs, kb_folder["id"], kb.tenant_id)
+        except Exception as e:
+            logging.exception("SyncLogsService.insert_documents")
+            return errs + [d["name"] + ": " + str(e) for d in docs], []
 
-        errs = []
-        files = [FileObj(filename=d["semantic_identifier"]+f".{d['extension']}", blob=d["blob"]) for d in docs]
-        doc_ids = []
-        err, doc_blob_pairs = FileService.upload_document(kb, files, tenant_id, src)
-        errs.extend(err)
-        if not err:
-            kb_table_num_map = {}
-            for doc, _ in doc_blob_pairs:
-                DocumentService.run(tenant_id, doc, kb_table_num_map)
-                doc_ids.append(doc["id"])
-
-        return errs, doc_ids
+        kb_table_num_map = {}
+        for doc in docs:
+            DocumentService.run(tenant_id, doc, kb_table_num_map)
+        return errs, [d["id"] for d in docs]
 
     @classmethod
     def get_latest_task(cls, connector_id, kb_id):
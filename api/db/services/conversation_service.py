@@ -20,6 +20,7 @@ from api.db.db_models import Conversation, DB
 from api.db.services.api_service import API4ConversationService
 from api.db.services.common_service import CommonService
 from api.db.services.dialog_service import DialogService, chat
+from api.utils.stream_utils import DeltaEncoder, sse_frame
 from common.misc_utils import get_uuid
 import json
 
@@ -90,7 +91,7 @@ def structure_answer(conv, ans, message_id, session_id):
     return ans
 
 
-def completion(tenant_id, chat_id, question, name="New session", session_id=None, stream=True, **kwargs):
+def completion(tenant_id, chat_id, question, name="New session", session_id=None, stream=True, delta=False, **kwargs):
     assert name, "`name` can not be empty."
     dia = DialogService.query(id=chat_id, tenant_id=tenant_id, status=StatusEnum.VALID.value)
     assert dia, "You do not own the chat."
@@ -147,10 +148,16 @@ def completion(tenant_id, chat_id, question, name="New session", session_id=None
     conv.reference.append({"chunks": [], "doc_aggs": []})
 
     if stream:
+        delta_encoder = DeltaEncoder() if delta else None
         try:
+            last = None
             for ans in chat(dia, msg, True, **kwargs):
-                ans = structure_answer(conv, ans, message_id, session_id)
-                yield "data:" + json.dumps({"code": 0, "data": ans}, ensure_ascii=False) + "\n\n"
+                ans = last = structure_answer(conv, ans, message_id, session_id)
+                if delta_encoder:
+                    ans = delta_encoder.encode(ans)
+                yield sse_frame({"code": 0, "data": ans})
+            if delta_encoder and last is not None:
+                yield sse_frame({"code": 0, "data": delta_encoder.finish(last)})
             ConversationService.update_by_id(conv.id, conv.to_dict())
         except Exception as e:
             yield "data:" + json.dumps({"code": 500, "message": str(e),
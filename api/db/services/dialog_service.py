@@ -15,8 +15,11 @@
 #
 import binascii
 import logging
+import os
 import re
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from datetime import datetime
 from functools import partial
@@ -36,7 +39,6 @@ from api.db.services.llm_service import LLMBundle
 from api.db.services.tenant_llm_service import TenantLLMService
 from common.time_utils import current_timestamp, datetime_format
 from graphrag.general.mind_map_extractor import MindMapExtractor
-from rag.app.resume import forbidden_select_fields4resume
 from rag.app.tag import label_question
 from rag.nlp.search import index_name
 from rag.prompts.generator import chunks_format, citation_prompt, cross_languages, full_question, kb_prompt, keyword_extraction, message_fit_in, \
@@ -191,16 +193,19 @@ def chat_solo(dialog, messages, stream=True):
     if stream:
         last_ans = ""
         delta_ans = ""
+        audio = TTSStream(tts_mdl)
         for ans in chat_mdl.chat_streamly(prompt_config.get("system", ""), msg, dialog.llm_setting):
             answer = ans
             delta_ans = ans[len(last_ans):]
-            if num_tokens_from_string(delta_ans) < 16:
+            if not enough_to_flush(delta_ans):
                 continue
             last_ans = answer
-            yield {"answer": answer, "reference": {}, "audio_binary": tts(tts_mdl, delta_ans), "prompt": "", "created_at": time.time()}
+            audio.feed(delta_ans)
+            yield {"answer": answer, "reference": {}, "audio_binary": audio.collect(), "prompt": "", "created_at": time.time()}
             delta_ans = ""
-        if delta_ans:
-            yield {"answer": answer, "reference": {}, "audio_binary": tts(tts_mdl, delta_ans), "prompt": "", "created_at": time.time()}
+        audio.feed(delta_ans)
+        if delta_ans or audio.pending():
+            yield {"answer": answer, "reference": {}, "audio_binary": audio.collect(wait=True), "prompt": "", "created_at": time.time()}
     else:
         answer = chat_mdl.chat(prompt_config.get("system", ""), msg, dialog.llm_setting)
         user_content = msg[-1].get("content", "[content not available]")
@@ -595,18 +600,21 @@ def chat(dialog, messages, stream=True, **kwargs):
     if stream:
         last_ans = ""
         answer = ""
+        audio = TTSStream(tts_mdl)
         for ans in chat_mdl.chat_streamly(prompt + prompt4citation, msg[1:], gen_conf):
             if thought:
                 ans = re.sub(r"^.*</think>", "", ans, flags=re.DOTALL)
             answer = ans
             delta_ans = ans[len(last_ans):]
-            if num_tokens_from_string(delta_ans) < 16:
+            if not enough_to_flush(delta_ans):
                 continue
             last_ans = answer
-            yield {"answer": thought + answer, "reference": {}, "audio_binary": tts(tts_mdl, delta_ans)}
+            audio.feed(delta_ans)
+            yield {"answer": thought + answer, "reference": {}, "audio_binary": audio.collect()}
         delta_ans = answer[len(last_ans):]
-        if delta_ans:
-            yield {"answer": thought + answer, "reference": {}, "audio_binary": tts(tts_mdl, delta_ans)}
+        audio.feed(delta_ans)
+        if delta_ans or audio.pending():
+            yield {"answer": thought + answer, "reference": {}, "audio_binary": audio.collect(wait=True)}
         yield decorate_answer(thought + answer)
     else:
         answer = chat_mdl.chat(prompt + prompt4citation, msg[1:], gen_conf)
@@ -645,6 +653,8 @@ Please write the SQL, only SQL, without any other explanations or text.
             if sql[: len("select *")] != "select *":
                 sql = "select doc_id,docnm_kwd," + sql[6:]
             else:
+                from rag.app.resume import forbidden_select_fields4resume
+
                 flds = []
                 for k in field_map.keys():
                     if k in forbidden_select_fields4resume:
@@ -745,6 +755,45 @@ def tts(tts_mdl, text):
     return binascii.hexlify(bin).decode("utf-8")
 
 
+STREAM_FLUSH_TOKENS = 16
+tts_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("MAX_CONCURRENT_TTS", 4)), thread_name_prefix="tts")
+
+
+def enough_to_flush(delta_ans):
+    # Tokenizing every streamed update is costly; the length alone decides most cases.
+    if len(delta_ans) < STREAM_FLUSH_TOKENS:
+        return False
+    if len(delta_ans) >= STREAM_FLUSH_TOKENS * 4:
+        return True
+    return num_tokens_from_string(delta_ans) >= STREAM_FLUSH_TOKENS
+
+
+class TTSStream:
+    """
+    Synthesizes streamed deltas on `tts_executor` so the answer text is never held back by TTS.
+    Audio is handed out in order, attached to whichever frame is yielded once it is ready.
+    """
+
+    def __init__(self, tts_mdl):
+        self._tts_mdl = tts_mdl
+        self._pending = deque()
+
+    def feed(self, text):
+        if self._tts_mdl and text:
+            self._pending.append(tts_executor.submit(tts, self._tts_mdl, text))
+
+    def pending(self):
+        return bool(self._pending)
+
+    def collect(self, wait=False):
+        parts = []
+        while self._pending and (wait or self._pending[0].done()):
+            audio = self._pending.popleft().result()
+            if audio:
+                parts.append(audio)
+        return "".join(parts) if parts else None
+
+
 def ask(question, kb_ids, tenant_id, chat_llm_name=None, search_config={}):
     doc_ids = search_config.get("doc_ids", [])
     rerank_mdl = None
@@ -21,6 +21,7 @@ from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from datetime import datetime
 from io import BytesIO
+from pathlib import PurePath
 
 import trio
 import xxhash
@@ -32,12 +33,14 @@ from api.db import FileType, LLMType, ParserType, StatusEnum, TaskStatus, UserTe
 from api.db.db_models import DB, Document, Knowledgebase, Task, Tenant, UserTenant, File2Document, File, UserCanvas, \
     User
 from api.db.db_utils import bulk_insert_into_db
+from api.db.services import _split_name_counter
 from api.db.services.common_service import CommonService
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from common.misc_utils import get_uuid
 from common.time_utils import current_timestamp, get_format_time
 from rag.nlp import rag_tokenizer, search
 from rag.settings import get_svr_queue_name, SVR_CONSUMER_GROUP_NAME
+from rag.utils.fair_queue import FAIR_SCHEDULING, tenant_queue_name
 from rag.utils.redis_conn import REDIS_CONN
 from rag.utils.storage_factory import STORAGE_IMPL
 from rag.utils.doc_store_conn import OrderByExpr
@@ -297,6 +300,34 @@ class DocumentService(CommonService):
             raise RuntimeError("Database error (Knowledgebase)!")
         return Document(**doc)
 
+    @classmethod
+    @DB.connection_context()
+    def insert_many_docs(cls, docs):
+        if not docs:
+            return
+        bulk_insert_into_db(cls.model, docs)
+        if not KnowledgebaseService.atomic_increase_doc_num_by_id(docs[0]["kb_id"], len(docs)):
+            raise RuntimeError("Database error (Knowledgebase)!")
+
+    @classmethod
+    @DB.connection_context()
+    def get_taken_names(cls, kb_id, names, batch_size=200):
+        """
+        Document names of `kb_id` that `duplicate_name` could run into for `names`:
+        the names themselves and their `stem(n).suffix` variants.
+        """
+        taken = set()
+        names = list(set(names))
+        for i in range(0, len(names), batch_size):
+            batch = names[i:i + batch_size]
+            cond = cls.model.name.in_(batch)
+            for nm in batch:
+                path = PurePath(nm)
+                main_part, _ = _split_name_counter(path.stem)
+                cond |= cls.model.name.startswith(main_part + "(") & cls.model.name.endswith(")" + path.suffix)
+            taken.update(d.name for d in cls.model.select(cls.model.name).where((cls.model.kb_id == kb_id) & cond))
+        return taken
+
     @classmethod
     @DB.connection_context()
     def remove_document(cls, doc, tenant_id):
@@ -714,9 +745,9 @@ class DocumentService(CommonService):
                 if msg:
                     info["progress_msg"] = msg
                     if msg.endswith("created task graphrag") or msg.endswith("created task raptor") or msg.endswith("created task mindmap"):
-                        info["progress_msg"] += "\n%d tasks are ahead in the queue..."%get_queue_length(priority)
+                        info["progress_msg"] += "\n%d tasks are ahead in the queue..."%get_queue_length(priority, doc.kb_id)
                 else:
-                    info["progress_msg"] = "%d tasks are ahead in the queue..."%get_queue_length(priority)
+                    info["progress_msg"] = "%d tasks are ahead in the queue..."%get_queue_length(priority, doc.kb_id)
                 cls.update_by_id(d["id"], info)
             except Exception as e:
                 if str(e).find("'0'") < 0:
@@ -855,11 +886,15 @@ def queue_raptor_o_graphrag_tasks(sample_doc_id, ty, priority, fake_doc_id="", d
     return task["id"]
 
 
-def get_queue_length(priority):
-    group_info = REDIS_CONN.queue_info(get_svr_queue_name(priority), SVR_CONSUMER_GROUP_NAME)
-    if not group_info:
-        return 0
-    return int(group_info.get("lag", 0) or 0)
+def get_queue_length(priority, kb_id=None):
+    queue_names = [get_svr_queue_name(priority)]
+    if FAIR_SCHEDULING and priority == 0 and kb_id:
+        # The normal priority tasks of the tenant wait on its own queue, served in turn with the shared one.
+        e, kb = KnowledgebaseService.get_by_id(kb_id)
+        if e:
+            queue_names.append(tenant_queue_name(kb.tenant_id))
+    lags = REDIS_CONN.queue_lags(queue_names, SVR_CONSUMER_GROUP_NAME)
+    return sum(int(lag or 0) for lag in lags.values())
 
 
 def doc_upload_and_parse(conversation_id, file_objs, user_id):
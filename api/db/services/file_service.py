@@ -14,15 +14,19 @@
 #  limitations under the License.
 #
 import logging
+import os
 import re
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import xxhash
 from flask_login import current_user
 from peewee import fn
 
 from api.db import KNOWLEDGEBASE_FOLDER_NAME, FileSource, FileType, ParserType, TaskStatus
+from api.constants import FILE_NAME_LEN_LIMIT
 from api.db.db_models import DB, Document, File, File2Document, Knowledgebase, Task
+from api.db.db_utils import bulk_insert_into_db
 from api.db.services import duplicate_name
 from api.db.services.common_service import CommonService
 from api.db.services.document_service import DocumentService
@@ -30,10 +34,13 @@ from api.db.services.file2document_service import File2DocumentService
 from common.misc_utils import get_uuid
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.task_service import TaskService
-from api.utils.file_utils import filename_type, read_potential_broken_pdf, thumbnail_img
+from api.utils.file_utils import filename_type, has_thumbnail, read_potential_broken_pdf, thumbnail_img
 from rag.llm.cv_model import GptV4
 from rag.utils.storage_factory import STORAGE_IMPL
 
+BULK_UPLOAD_WORKERS = int(os.environ.get("BULK_UPLOAD_WORKERS", 8))
+thumbnail_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("MAX_CONCURRENT_THUMBNAILS", 4)), thread_name_prefix="thumbnail")
+
 
 class FileService(CommonService):
     # Service class for managing file operations and storage
@@ -469,6 +476,7 @@ class FileService(CommonService):
                     "location": location,
                     "size": len(blob),
                     "thumbnail": thumbnail_location,
+                    "content_hash": xxhash.xxh128(blob).hexdigest(),
                 }
                 DocumentService.insert(doc)
 
@@ -479,6 +487,140 @@ class FileService(CommonService):
 
         return err, files
 
+    @classmethod
+    @DB.connection_context()
+    def add_files_from_kb(cls, docs, kb_folder_id, tenant_id):
+        files, links = [], []
+        for doc in docs:
+            file_id = get_uuid()
+            files.append({
+                "id": file_id,
+                "parent_id": kb_folder_id,
+                "tenant_id": tenant_id,
+                "created_by": tenant_id,
+                "name": doc["name"],
+                "type": doc["type"],
+                "size": doc["size"],
+                "location": doc["location"],
+                "source_type": FileSource.KNOWLEDGEBASE,
+            })
+            links.append({"id": get_uuid(), "file_id": file_id, "document_id": doc["id"]})
+        if not files:
+            return
+        bulk_insert_into_db(File, files)
+        bulk_insert_into_db(File2Document, links)
+
+    @staticmethod
+    def _store_thumbnail(kb_id, doc_id, filename, blob):
+        try:
+            img = thumbnail_img(filename, blob)
+            if img is None:
+                return
+            thumbnail_location = f"thumbnail_{doc_id}.png"
+            STORAGE_IMPL.put(kb_id, thumbnail_location, img)
+            DocumentService.update_by_id(doc_id, {"thumbnail": thumbnail_location})
+        except Exception:
+            logging.exception(f"Fail to generate thumbnail for {filename}")
+
+    @staticmethod
+    def store_blob(kb_id, filename, filetype, blob):
+        """Put `blob` in the storage of `kb_id` at a free location named after `filename`. Returns the location and the blob as stored."""
+        if filetype == FileType.PDF.value:
+            blob = read_potential_broken_pdf(blob)
+        location = filename
+        while STORAGE_IMPL.obj_exist(kb_id, location):
+            location += "_"
+        STORAGE_IMPL.put(kb_id, location, blob)
+        return location, blob
+
+    @classmethod
+    @DB.connection_context()
+    def upload_documents_bulk(cls, kb, file_objs, user_id, src="local"):
+        """
+        Bulk variant of `upload_document` for large uploads.
+
+        Names are resolved against the KB in batched queries, blobs are stored concurrently and
+        dropped as soon as they are written, document and file rows are inserted in bulk, and
+        thumbnails are rendered by `thumbnail_executor` after the response is built.
+        Returns one `{"name", "doc", "error"}` result per file, in input order.
+        """
+        root_folder = cls.get_root_folder(user_id)
+        cls.init_knowledgebase_docs(root_folder["id"], user_id)
+        kb_root_folder = cls.get_kb_folder(user_id)
+        kb_folder = cls.new_a_file_from_kb(kb.tenant_id, kb.name, kb_root_folder["id"])
+
+        results = [{"name": file.filename, "doc": None, "error": None} for file in file_objs]
+        quota = int(os.environ.get("MAX_FILE_NUM_PER_USER", 0))
+        remaining = quota - DocumentService.get_doc_count(kb.tenant_id) if quota > 0 else len(file_objs)
+        taken = DocumentService.get_taken_names(kb.id, [file.filename for file in file_objs])
+
+        pending = []
+        for res, file in zip(results, file_objs):
+            try:
+                if remaining <= 0:
+                    raise RuntimeError("Exceed the maximum file number of a free user!")
+                if len(file.filename.encode("utf-8")) > FILE_NAME_LEN_LIMIT:
+                    raise RuntimeError("Exceed the maximum length of file name!")
+                filename = duplicate_name(lambda name, **_: name in taken, name=file.filename)
+                filetype = filename_type(filename)
+                if filetype == FileType.OTHER.value:
+                    raise RuntimeError("This type of file has not been supported yet!")
+                taken.add(filename)
+                remaining -= 1
+                pending.append((res, file, filename, filetype))
+            except Exception as e:
+                res["error"] = str(e)
+
+        def store(file, filename, filetype):
+            location, blob = cls.store_blob(kb.id, filename, filetype, file.read())
+            # Keep the blob only for the thumbnail, everything else is done with it.
+            return location, len(blob), xxhash.xxh128(blob).hexdigest(), blob if has_thumbnail(filename) else None
+
+        with ThreadPoolExecutor(max_workers=BULK_UPLOAD_WORKERS) as exe:
+            futures = [exe.submit(store, file, filename, filetype) for _, file, filename, filetype in pending]
+
+        docs, thumbnails = [], []
+        for (res, _, filename, filetype), fut in zip(pending, futures):
+            try:
+                location, size, content_hash, blob = fut.result()
+            except Exception as e:
+                res["error"] = str(e)
+                continue
+            doc = {
+                "id": get_uuid(),
+                "kb_id": kb.id,
+                "parser_id": cls.get_parser(filetype, filename, kb.parser_id),
+                "pipeline_id": kb.pipeline_id,
+                "parser_config": kb.parser_config,
+                "created_by": user_id,
+                "type": filetype,
+                "name": filename,
+                "source_type": src,
+                "suffix": Path(filename).suffix.lstrip("."),
+                "location": location,
+                "size": size,
+                "thumbnail": "",
+                "content_hash": content_hash,
+            }
+            res["doc"] = doc
+            docs.append(doc)
+            if blob is not None:
+                thumbnails.append((doc["id"], filename, blob))
+
+        try:
+            DocumentService.insert_many_docs(docs)
+            cls.add_files_from_kb(docs, kb_folder["id"], kb.tenant_id)
+        except Exception as e:
+            logging.exception("upload_documents_bulk")
+            for res in results:
+                if res["doc"]:
+                    res["doc"], res["error"] = None, str(e)
+            return results
+
+        for doc_id, filename, blob in thumbnails:
+            thumbnail_executor.submit(cls._store_thumbnail, kb.id, doc_id, filename, blob)
+        return results
+
     @classmethod
     @DB.connection_context()
     def list_all_files_by_parent_id(cls, parent_id):
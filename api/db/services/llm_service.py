@@ -16,12 +16,14 @@
 import inspect
 import logging
 import re
+import xxhash
 from common.token_utils import num_tokens_from_string
 from functools import partial
 from typing import Generator
 from api.db.db_models import LLM
 from api.db.services.common_service import CommonService
 from api.db.services.tenant_llm_service import LLM4Tenant, TenantLLMService
+from rag.utils.redis_conn import REDIS_CONN
 
 
 class LLMService(CommonService):
@@ -68,10 +70,41 @@ def get_init_tenant_llm(user_id):
     return list(unique.values())
 
 
+EMBEDDING_DIMENSION_TTL = 30 * 24 * 3600
+
+
 class LLMBundle(LLM4Tenant):
+    # Embedding dimension by model configuration, see embedding_dimension().
+    _embedding_dimensions = {}
+
     def __init__(self, tenant_id, llm_type, llm_name=None, lang="Chinese", **kwargs):
         super().__init__(tenant_id, llm_type, llm_name, lang, **kwargs)
 
+    def embedding_dimension(self) -> int:
+        """
+        Dimension of the vectors of this embedding model. It's probed with one encode the first time the
+        tenant's configuration of the model is seen, then kept in the process and in Redis. Editing the
+        configuration of the model changes its update time, hence the key.
+        """
+        hasher = xxhash.xxh64()
+        hasher.update(str(self.tenant_id).encode("utf-8"))
+        for field in ["llm_factory", "llm_name", "api_base", "api_key", "update_time"]:
+            hasher.update(str(self.model_config.get(field, "")).encode("utf-8"))
+        key = "embd_dim_" + hasher.hexdigest()
+
+        dim = LLMBundle._embedding_dimensions.get(key)
+        if dim:
+            return dim
+        cached = REDIS_CONN.get(key)
+        if cached:
+            dim = int(cached)
+        else:
+            vts, _ = self.encode(["ok"])
+            dim = len(vts[0])
+            REDIS_CONN.set(key, dim, EMBEDDING_DIMENSION_TTL)
+        LLMBundle._embedding_dimensions[key] = dim
+        return dim
+
     def bind_tools(self, toolcall_session, tools):
         if not self.is_tools:
             logging.warning(f"Model {self.llm_name} does not support tool call, but you have assigned one or more tools to it!")
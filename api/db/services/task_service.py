@@ -30,7 +30,7 @@ from api.db.services.document_service import DocumentService
 from common.misc_utils import get_uuid
 from common.time_utils import current_timestamp
 from deepdoc.parser.excel_parser import RAGFlowExcelParser
-from rag.settings import get_svr_queue_name
+from rag.utils.fair_queue import queue_svr_tasks
 from rag.utils.storage_factory import STORAGE_IMPL
 from rag.utils.redis_conn import REDIS_CONN
 from api import settings
@@ -97,6 +97,7 @@ class TaskService(CommonService):
             cls.model.from_page,
             cls.model.to_page,
             cls.model.retry_count,
+            cls.model.content_digest,
             Document.kb_id,
             Document.parser_id,
             Document.parser_config,
@@ -173,6 +174,35 @@ class TaskService(CommonService):
             return None
         return tasks
 
+    @classmethod
+    @DB.connection_context()
+    def get_reusable_task(cls, content_digest: str, doc_id: str):
+        """Find a finished task of another document that parsed the same content the same way.
+
+        Args:
+            content_digest (str): The content digest of the task looking for a parse result.
+            doc_id (str): The document of that task, excluded from the lookup.
+
+        Returns:
+            dict: The chunk ids of the finished task together with its document and the knowledge base
+                  and tenant its chunks are stored under. Returns None if there is no such task.
+        """
+        tasks = (
+            cls.model.select(cls.model.id, cls.model.doc_id, cls.model.chunk_ids, Document.kb_id, Knowledgebase.tenant_id)
+            .join(Document, on=(cls.model.doc_id == Document.id))
+            .join(Knowledgebase, on=(Document.kb_id == Knowledgebase.id))
+            .where(
+                cls.model.content_digest == content_digest,
+                cls.model.doc_id != doc_id,
+                cls.model.progress == 1,
+                cls.model.chunk_ids != "",
+            )
+            .order_by(cls.model.update_time.desc())
+            .limit(1)
+        )
+        tasks = list(tasks.dicts())
+        return tasks[0] if tasks else None
+
     @classmethod
     @DB.connection_context()
     def update_chunk_ids(cls, id: str, chunk_ids: str):
@@ -403,6 +433,7 @@ def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
             hasher.update(str(task.get(field, "")).encode("utf-8"))
         task_digest = hasher.hexdigest()
         task["digest"] = task_digest
+        task["content_digest"] = content_digest(doc.get("content_hash"), chunking_config, task)
         task["progress"] = 0.0
         task["priority"] = priority
 
@@ -425,10 +456,29 @@ def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
     DocumentService.begin2parse(doc["id"])
 
     unfinished_task_array = [task for task in parse_task_array if task["progress"] < 1.0]
-    for unfinished_task in unfinished_task_array:
-        assert REDIS_CONN.queue_product(
-            get_svr_queue_name(priority), message=unfinished_task
-        ), "Can't access Redis. Please check the Redis' status."
+    assert queue_svr_tasks(unfinished_task_array, priority, chunking_config["tenant_id"]), "Can't access Redis. Please check the Redis' status."
+
+
+def content_digest(content_hash: str | None, chunking_config: dict, task: dict):
+    """Digest identifying the parse result of a page range of some file content.
+
+    Unlike the task digest it leaves out the document and knowledge base ids, so two documents
+    uploaded with the same bytes and parsed with the same configuration share it. The tenant id
+    stays in, chunks are never shared across tenants.
+
+    Returns:
+        str | None: The digest, or None when the content hash of the document is unknown.
+    """
+    if not content_hash:
+        return None
+    hasher = xxhash.xxh128(content_hash.encode("utf-8"))
+    for field in sorted(chunking_config.keys()):
+        if field in ["id", "kb_id"]:
+            continue
+        hasher.update(str(chunking_config[field]).encode("utf-8"))
+    for field in ["from_page", "to_page"]:
+        hasher.update(str(task.get(field, "")).encode("utf-8"))
+    return hasher.hexdigest()
 
 
 def reuse_prev_task_chunks(task: dict, prev_tasks: list[dict], chunking_config: dict):
@@ -516,9 +566,7 @@ def queue_dataflow(tenant_id:str, flow_id:str, task_id:str, doc_id:str=CANVAS_DE
     task["dataflow_id"] = flow_id
     task["file"] = file
 
-    if not REDIS_CONN.queue_product(
-            get_svr_queue_name(priority), message=task
-    ):
+    if not queue_svr_tasks([task], priority, tenant_id):
         return False, "Can't access Redis. Please check the Redis' status."
 
     return True, ""
@@ -37,7 +37,12 @@ class ResourceQuota:
     max_storage_gb: int = 10
     max_api_calls_per_day: int = 10000
     max_concurrent_requests: int = 10
-    
+
+    @property
+    def scheduling_weight(self) -> float:
+        """Share of the document parsing workers, relative to the default quota"""
+        return max(self.max_concurrent_requests / ResourceQuota.max_concurrent_requests, 0.1)
+
     def to_dict(self) -> Dict[str, Any]:
         return {
             'max_users': self.max_users,
@@ -54,6 +54,10 @@ def filename_type(filename):
     return FileType.OTHER.value
 
 
+def has_thumbnail(filename):
+    return re.match(r".*\.(pdf|jpg|jpeg|png|tif|gif|icon|ico|webp|ppt|pptx)$", filename.lower()) is not None
+
+
 def thumbnail_img(filename, blob):
     """
     MySQL LongText max length is 65535
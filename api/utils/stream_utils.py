@@ -0,0 +1,71 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import json
+
+
+def sse_frame(payload) -> str:
+    return "data:" + json.dumps(payload, ensure_ascii=False) + "\n\n"
+
+
+class DeltaEncoder:
+    """
+    Turns the cumulative answers yielded by `dialog_service.chat` into incremental frames.
+
+    Frames carry only the newly generated text in `delta` (no `answer`), so the bytes sent and
+    JSON encoded per answer grow linearly with its length. An answer that does not extend what
+    was already sent (e.g. citations were inserted) is sent in full with `answer` set and
+    `resync: true`, more frames may follow. Once the stream is over, `finish` marks it with
+    `final: true`, along with whatever of the last answer was not sent yet.
+    """
+
+    def __init__(self):
+        self._sent = ""
+        self._fields = {}
+
+    def _remember(self, frame: dict) -> dict:
+        for k, v in frame.items():
+            self._fields[k] = v
+        return frame
+
+    def encode(self, ans: dict) -> dict:
+        answer = ans.get("answer") or ""
+        if not answer.startswith(self._sent):
+            self._sent = answer
+            return self._remember(dict(ans, delta=None, resync=True))
+
+        frame = {k: v for k, v in ans.items() if k != "answer"}
+        frame["delta"] = answer[len(self._sent):]
+        self._sent = answer
+        return self._remember(frame)
+
+    def finish(self, ans: dict) -> dict:
+        """
+        The frame ending the stream of `ans`, its last answer: the rest of the answer and the fields that
+        differ from those already sent. Audio is never sent again, clients would play it twice.
+        """
+        answer = ans.get("answer") or ""
+        if answer.startswith(self._sent):
+            frame = {"delta": answer[len(self._sent):]}
+        else:
+            frame = {"answer": answer, "delta": None, "resync": True}
+        self._sent = answer
+        for k, v in ans.items():
+            if k in ("answer", "audio_binary"):
+                continue
+            if k not in self._fields or (self._fields[k] is not v and self._fields[k] != v):
+                frame[k] = v
+        frame["final"] = True
+        return self._remember(frame)
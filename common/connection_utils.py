@@ -14,8 +14,10 @@
 #  limitations under the License.
 #
 
+import concurrent.futures
+import contextvars
+import logging
 import os
-import queue
 import threading
 from typing import Any, Callable, Coroutine, Optional, Type, Union
 import asyncio
@@ -27,6 +29,123 @@ from common.constants import RetCode
 TimeoutException = Union[Type[BaseException], BaseException]
 OnTimeoutCallback = Union[Callable[..., Any], Coroutine[Any, Any, Any]]
 
+TIMEOUT_EXECUTOR_WORKERS = int(os.environ.get("TIMEOUT_EXECUTOR_WORKERS", 32))
+
+
+class CancellationToken:
+    """
+    Cancelled when the timed call it belongs to runs out of time.
+
+    A thread can not be killed, so a timed out sync call keeps running until it
+    returns by itself. Long running work can poll `current_cancellation_token()`
+    and give up early instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._finished = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def raise_if_cancelled(self):
+        if self._cancelled:
+            raise TimeoutError("Operation was cancelled after it timed out.")
+
+    def cancel(self) -> bool:
+        """Returns True if the work is still running, i.e. it leaks until it returns."""
+        with self._lock:
+            self._cancelled = True
+            return not self._finished
+
+    def finish(self) -> bool:
+        """Returns True if the work had been cancelled before it returned."""
+        with self._lock:
+            self._finished = True
+            return self._cancelled
+
+
+_current_token = contextvars.ContextVar("timeout_cancellation_token", default=None)
+_stats_lock = threading.Lock()
+_stats = {"timed_out": 0, "leaked": 0}
+_executor = None
+_executor_lock = threading.Lock()
+_worker = threading.local()
+
+
+def current_cancellation_token() -> Optional[CancellationToken]:
+    """The token of the innermost timed call running in this thread, if any."""
+    return _current_token.get()
+
+
+def timeout_stats() -> dict:
+    """
+    timed_out: calls that ran out of time since start-up.
+    leaked: timed out sync calls whose thread is still busy with them.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _timeout_enabled(seconds) -> bool:
+    return seconds is not None and bool(os.environ.get("ENABLE_TIMEOUT_ASSERTION"))
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(max_workers=TIMEOUT_EXECUTOR_WORKERS,
+                                                                  thread_name_prefix="timeout")
+    return _executor
+
+
+def _run_with_token(token: CancellationToken, func, args, kwargs):
+    reset = _current_token.set(token)
+    _worker.busy = True
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _worker.busy = False
+        _current_token.reset(reset)
+        if token.finish():
+            with _stats_lock:
+                _stats["leaked"] -= 1
+
+
+def _timed_out(token: CancellationToken):
+    leaked = token.cancel()
+    with _stats_lock:
+        _stats["timed_out"] += 1
+        if leaked:
+            _stats["leaked"] += 1
+        leaked = _stats["leaked"]
+    if leaked >= TIMEOUT_EXECUTOR_WORKERS:
+        logging.warning(f"{leaked} timed out calls are still running, the timeout executor is saturated.")
+
+
+async def run_sync_with_timeout(seconds: float | int | None, func: Callable, *args) -> Any:
+    """
+    Runs the blocking `func` in a trio worker thread under `trio.fail_after`.
+
+    This is the way for async code to time a blocking call: the thread trio already
+    uses is the only one involved. On timeout the thread is abandoned, its token is
+    cancelled and TimeoutError raised. Like `timeout`, the limit only applies when
+    ENABLE_TIMEOUT_ASSERTION is set.
+    """
+    token = CancellationToken()
+    if not _timeout_enabled(seconds):
+        return await trio.to_thread.run_sync(_run_with_token, token, func, args, {})
+    try:
+        with trio.fail_after(seconds):
+            return await trio.to_thread.run_sync(_run_with_token, token, func, args, {}, abandon_on_cancel=True)
+    except trio.TooSlowError:
+        _timed_out(token)
+        raise TimeoutError(f"Function '{func.__name__}' timed out after {seconds} seconds.")
+
 
 def timeout(seconds: float | int | str = None, attempts: int = 2, *, exception: Optional[TimeoutException] = None,
             on_timeout: Optional[OnTimeoutCallback] = None):
@@ -36,30 +155,18 @@ def timeout(seconds: float | int | str = None, attempts: int = 2, *, exception:
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            result_queue = queue.Queue(maxsize=1)
-
-            def target():
-                try:
-                    result = func(*args, **kwargs)
-                    result_queue.put(result)
-                except Exception as e:
-                    result_queue.put(e)
-
-            thread = threading.Thread(target=target)
-            thread.daemon = True
-            thread.start()
-
-            for a in range(attempts):
-                try:
-                    if os.environ.get("ENABLE_TIMEOUT_ASSERTION"):
-                        result = result_queue.get(timeout=seconds)
-                    else:
-                        result = result_queue.get()
-                    if isinstance(result, Exception):
-                        raise result
-                    return result
-                except queue.Empty:
-                    pass
+            # Without a deadline there is nothing to wait for on another thread. A call made from
+            # the timeout executor itself runs inline under its caller's deadline, nested calls
+            # queueing behind their own callers could dead-lock a saturated pool.
+            if not _timeout_enabled(seconds) or getattr(_worker, "busy", False):
+                return func(*args, **kwargs)
+
+            token = CancellationToken()
+            future = _get_executor().submit(_run_with_token, token, func, args, kwargs)
+            try:
+                return future.result(timeout=seconds * attempts)
+            except concurrent.futures.TimeoutError:
+                _timed_out(token)
             raise TimeoutError(f"Function '{func.__name__}' timed out after {seconds} seconds and {attempts} attempts.")
 
         @wraps(func)
@@ -75,6 +182,8 @@ def timeout(seconds: float | int | str = None, attempts: int = 2, *, exception:
                     else:
                         return await func(*args, **kwargs)
                 except trio.TooSlowError:
+                    with _stats_lock:
+                        _stats["timed_out"] += 1
                     if a < attempts - 1:
                         continue
                     if on_timeout is not None:
@@ -162,6 +162,11 @@ CONFLUENCE_CONNECTOR_ATTACHMENT_CHAR_COUNT_THRESHOLD = int(
     os.environ.get("CONFLUENCE_CONNECTOR_ATTACHMENT_CHAR_COUNT_THRESHOLD", 200_000)
 )
 
+# Pages converted, with their comments and attachments, at the same time
+CONFLUENCE_CONNECTOR_FETCH_CONCURRENCY = int(
+    os.environ.get("CONFLUENCE_CONNECTOR_FETCH_CONCURRENCY", 4)
+)
+
 _RAW_CONFLUENCE_CONNECTOR_USER_PROFILES_OVERRIDE = os.environ.get(
     "CONFLUENCE_CONNECTOR_USER_PROFILES_OVERRIDE", ""
 )
@@ -23,7 +23,7 @@ from common.data_source.config import INDEX_BATCH_SIZE, DocumentSource, CONTINUE
     OAUTH_CONFLUENCE_CLOUD_CLIENT_ID, OAUTH_CONFLUENCE_CLOUD_CLIENT_SECRET, _DEFAULT_PAGINATION_LIMIT, \
     _PROBLEMATIC_EXPANSIONS, _REPLACEMENT_EXPANSIONS, _USER_NOT_FOUND, _COMMENT_EXPANSION_FIELDS, \
     _ATTACHMENT_EXPANSION_FIELDS, _PAGE_EXPANSION_FIELDS, ONE_DAY, ONE_HOUR, _RESTRICTIONS_EXPANSION_FIELDS, \
-    _SLIM_DOC_BATCH_SIZE, CONFLUENCE_CONNECTOR_ATTACHMENT_SIZE_THRESHOLD
+    _SLIM_DOC_BATCH_SIZE, CONFLUENCE_CONNECTOR_ATTACHMENT_SIZE_THRESHOLD, CONFLUENCE_CONNECTOR_FETCH_CONCURRENCY
 from common.data_source.exceptions import (
     ConnectorMissingCredentialError,
     ConnectorValidationError,
@@ -41,6 +41,7 @@ from common.data_source.interfaces import (
 )
 from common.data_source.models import ConnectorFailure, Document, TextSection, ImageSection, BasicExpertInfo, \
     DocumentFailure, GenerateSlimDocumentOutput, SlimDocument, ExternalAccess
+from common.http_utils import RateLimitGate, get_with_rate_limit, map_concurrently
 from common.data_source.utils import load_all_docs_from_checkpoint_connector, scoped_url, \
     process_confluence_user_profiles_override, confluence_refresh_tokens, run_with_timeout, _handle_http_error, \
     update_param_in_path, get_start_param_from_url, build_confluence_document_id, datetime_from_string, \
@@ -101,6 +102,8 @@ class OnyxConfluence:
             self.static_credentials = self._credentials_provider.get_credentials()
 
         self._confluence = Confluence(url)
+        # Shared by the threads fetching pages and attachments, see ConfluenceConnector.fetch_concurrency
+        self.rate_limit_gate = RateLimitGate()
         self.credential_key: str = (
             self.CREDENTIAL_PREFIX
             + f":credential_{self._credentials_provider.get_provider_key()}"
@@ -366,6 +369,7 @@ class OnyxConfluence:
 
                 # we're relying more on the client to rate limit itself
                 # and applying our own retries in a more specific set of circumstances
+                self.rate_limit_gate.wait()
                 try:
                     if credential_provider:
                         with credential_provider:
@@ -398,9 +402,8 @@ class OnyxConfluence:
                         f"HTTPError in confluence call. "
                         f"Retrying in {delay_until} seconds..."
                     )
-                    while time.monotonic() < delay_until:
-                        # in the future, check a signal here to exit
-                        time.sleep(1)
+                    # the other threads calling Confluence wait as well
+                    self.rate_limit_gate.close_for(delay_until - time.monotonic())
                 except AttributeError as e:
                     # Some error within the Confluence library, unclear why it fails.
                     # Users reported it to be intermittent, so just retry
@@ -524,6 +527,7 @@ class OnyxConfluence:
             except Exception as e:
                 logging.exception(f"Error in confluence call to {url_suffix}")
                 raise e
+            self.rate_limit_gate.observe(raw_response)
 
             try:
                 raw_response.raise_for_status()
@@ -1142,10 +1146,12 @@ def process_attachment(
     attachment: dict[str, Any],
     parent_content_id: str | None,
     allow_images: bool,
+    etag: str | None = None,
 ) -> AttachmentProcessingResult:
     """
     Processes a Confluence attachment. If it's a document, extracts text,
     or if it's an image, stores it for later analysis. Returns a structured result.
+    With the `etag` of a former download, an attachment still matching it isn't downloaded again.
     """
     try:
         # Get the media type from the attachment metadata
@@ -1199,7 +1205,16 @@ def process_attachment(
         )
 
         # Download the attachment
-        resp: requests.Response = confluence_client._session.get(attachment_link)
+        resp: requests.Response = get_with_rate_limit(
+            confluence_client._session,
+            attachment_link,
+            confluence_client.rate_limit_gate,
+            headers={"If-None-Match": etag} if etag else None,
+        )
+        if resp.status_code == 304:
+            return AttachmentProcessingResult(
+                text=None, file_blob=None, file_name=None, etag=etag, unchanged=True
+            )
         if resp.status_code != 200:
             logging.warning(
                 f"Failed to fetch {attachment_link} with status code {resp.status_code}"
@@ -1219,13 +1234,15 @@ def process_attachment(
 
         # Process image attachments
         if media_type.startswith("image/"):
-            return _process_image_attachment(
+            result = _process_image_attachment(
                 confluence_client, attachment, raw_bytes, media_type
             )
+            result.etag = resp.headers.get("ETag")
+            return result
 
         # Process document attachments
         try:
-            return AttachmentProcessingResult(text="",file_blob=raw_bytes, file_name=attachment.get("title", "unknown_title"), error=None)
+            return AttachmentProcessingResult(text="",file_blob=raw_bytes, file_name=attachment.get("title", "unknown_title"), error=None, etag=resp.headers.get("ETag"))
         except Exception as e:
             logging.exception(e)
             return AttachmentProcessingResult(
@@ -1243,12 +1260,14 @@ def convert_attachment_to_content(
     attachment: dict[str, Any],
     page_id: str,
     allow_images: bool,
-) -> tuple[str | None, bytes | bytearray | None] | None:
+    etag: str | None = None,
+) -> tuple[str | None, bytes | bytearray | None, str | None] | None:
     """
     Facade function which:
       1. Validates attachment type
       2. Extracts content or stores image for later processing
-      3. Returns (content_text, stored_file_name) or None if we should skip it
+      3. Returns (stored_file_name, file_blob, etag) or None if we should skip it,
+         which includes an attachment still matching `etag`
     """
     media_type = attachment.get("metadata", {}).get("mediaType", "")
     # Quick check for unsupported types:
@@ -1258,14 +1277,17 @@ def convert_attachment_to_content(
         )
         return None
 
-    result = process_attachment(confluence_client, attachment, page_id, allow_images)
+    result = process_attachment(confluence_client, attachment, page_id, allow_images, etag)
+    if result.unchanged:
+        logging.info(f"Skipping attachment {attachment['title']}, unchanged since {etag}")
+        return None
     if result.error is not None:
         logging.warning(
             f"Attachment {attachment['title']} encountered error: {result.error}"
         )
         return None
 
-    return result.file_name, result.file_blob
+    return result.file_name, result.file_blob, result.etag
 
 
 class ConfluenceConnector(
@@ -1290,6 +1312,8 @@ class ConfluenceConnector(
         labels_to_skip: list[str] = CONFLUENCE_CONNECTOR_LABELS_TO_SKIP,
         timezone_offset: float = CONFLUENCE_TIMEZONE_OFFSET,
         scoped_token: bool = False,
+        # pages converted, with their comments and attachments, at the same time
+        fetch_concurrency: int = CONFLUENCE_CONNECTOR_FETCH_CONCURRENCY,
     ) -> None:
         self.wiki_base = wiki_base
         self.is_cloud = is_cloud
@@ -1301,6 +1325,8 @@ class ConfluenceConnector(
         self.labels_to_skip = labels_to_skip
         self.timezone_offset = timezone_offset
         self.scoped_token = scoped_token
+        self.fetch_concurrency = fetch_concurrency
+        self._version_lookup: Callable[[str], str | None] | None = None
         self._confluence_client: OnyxConfluence | None = None
         self._low_timeout_confluence_client: OnyxConfluence | None = None
         self._fetched_titles: set[str] = set()
@@ -1356,6 +1382,14 @@ class ConfluenceConnector(
         logging.info(f"Setting allow_images to {value}.")
         self.allow_images = value
 
+    def set_version_lookup(self, lookup: Callable[[str], str | None]) -> None:
+        """
+        `lookup` gives the `Document.version` an attachment, by document id, was last synchronized with.
+        Attachments whose version number didn't change since are skipped, the others are downloaded
+        only if their ETag did.
+        """
+        self._version_lookup = lookup
+
     @property
     def confluence_client(self) -> OnyxConfluence:
         if self._confluence_client is None:
@@ -1607,16 +1641,29 @@ class ConfluenceConnector(
                 logging.debug(f"Error building attachment url: {e}")
                 continue
             try:
+                attachment_id = build_confluence_document_id(
+                    self.wiki_base, attachment["_links"]["webui"], self.is_cloud
+                )
+                version_number = str(attachment.get("version", {}).get("number", ""))
+                known_version = self._version_lookup(attachment_id) if self._version_lookup else None
+                known_number, _, known_etag = (known_version or "").partition("|")
+                if version_number and known_number == version_number:
+                    logging.info(
+                        f"Skipping attachment {attachment['title']}, still at version {version_number}"
+                    )
+                    continue
+
                 response = convert_attachment_to_content(
                     confluence_client=self.confluence_client,
                     attachment=attachment,
                     page_id=page["id"],
                     allow_images=self.allow_images,
+                    etag=known_etag or None,
                 )
                 if response is None:
                     continue
 
-                file_storage_name, file_blob = response
+                file_storage_name, file_blob, etag = response
 
                 if not file_blob:
                     logging.info("Skipping attachment because it is no blob fetched")
@@ -1636,9 +1683,6 @@ class ConfluenceConnector(
                     self.wiki_base, page["_links"]["webui"], self.is_cloud
                 )
                 attachment_metadata["parent_page_id"] = page_url
-                attachment_id = build_confluence_document_id(
-                    self.wiki_base, attachment["_links"]["webui"], self.is_cloud
-                )
 
                 primary_owners: list[BasicExpertInfo] | None = None
                 if "version" in attachment and "by" in attachment["version"]:
@@ -1667,6 +1711,7 @@ class ConfluenceConnector(
                         else None
                     ),
                     primary_owners=primary_owners,
+                    version=f"{version_number}|{etag or ''}",
                 )
                 attachment_docs.append(attachment_doc)
             except Exception as e:
@@ -1690,6 +1735,18 @@ class ConfluenceConnector(
 
         return attachment_docs, attachment_failures
 
+    def _convert_page_with_attachments(
+        self,
+        page: dict[str, Any],
+        start: SecondsSinceUnixEpoch | None = None,
+        end: SecondsSinceUnixEpoch | None = None,
+    ) -> tuple[Document | ConnectorFailure, list[Document]]:
+        doc_or_failure = self._convert_page_to_document(page)
+        if isinstance(doc_or_failure, ConnectorFailure):
+            return doc_or_failure, []
+        attachment_docs, _ = self._fetch_page_attachments(page, start, end)
+        return doc_or_failure, attachment_docs
+
     def _fetch_document_batches(
         self,
         checkpoint: ConfluenceCheckpoint,
@@ -1697,11 +1754,13 @@ class ConfluenceConnector(
         end: SecondsSinceUnixEpoch | None = None,
     ) -> CheckpointOutput[ConfluenceCheckpoint]:
         """
-        Yields batches of Documents. For each page:
+        Yields the Documents of one page of results of the page query. For each page:
          - Create a Document with 1 Section for the page text/comments
          - Then fetch attachments. For each attachment:
              - Attempt to convert it with convert_attachment_to_content(...)
              - If successful, create a new Section with the extracted text or summary.
+        Pages are converted, with their comments and attachments, `fetch_concurrency` at a time
+        and yielded in order, so the checkpoint returned covers all of them.
         """
         checkpoint = copy.deepcopy(checkpoint)
 
@@ -1716,34 +1775,28 @@ class ConfluenceConnector(
         def store_next_page_url(next_page_url: str) -> None:
             checkpoint.next_page_url = next_page_url
 
+        # Take a full page of results, the checkpoint is created once it's returned
+        pages: list[dict[str, Any]] = []
         for page in self.confluence_client.paginated_page_retrieval(
             cql_url=page_query_url,
             limit=self.batch_size,
             next_page_callback=store_next_page_url,
         ):
-            # Build doc from page
-            doc_or_failure = self._convert_page_to_document(page)
-
-            if isinstance(doc_or_failure, ConnectorFailure):
-                yield doc_or_failure
-                continue
+            pages.append(page)
+            if checkpoint.next_page_url and checkpoint.next_page_url != page_query_url:
+                break
+        else:
+            checkpoint.has_more = False
 
-            # yield completed document (or failure)
+        for doc_or_failure, attachment_docs in map_concurrently(
+            lambda page: self._convert_page_with_attachments(page, start, end),
+            pages,
+            self.fetch_concurrency,
+        ):
+            # yield completed document (or failure), then its attachments
             yield doc_or_failure
-
-            # Now get attachments for that page:
-            attachment_docs, attachment_failures = self._fetch_page_attachments(
-                page, start, end
-            )
-            # yield attached docs and failures
             yield from attachment_docs
-            # yield from attachment_failures
-
-            # Create checkpoint once a full page of results is returned
-            if checkpoint.next_page_url and checkpoint.next_page_url != page_query_url:
-                return checkpoint
 
-        checkpoint.has_more = False
         return checkpoint
 
     def _build_page_retrieval_url(
@@ -385,12 +385,15 @@ class AttachmentProcessingResult(BaseModel):
     'text' is the textual content of the attachment.
     'file_name' is the final file name used in FileStore to store the content.
     'error' holds an exception or string if something failed.
+    'etag' is the ETag of the download, 'unchanged' tells the ETag passed in still matches and nothing was downloaded.
     """
 
     text: str | None
     file_blob: bytes | bytearray | None
     file_name: str | None
     error: str | None = None
+    etag: str | None = None
+    unchanged: bool = False
 
     model_config = {"arbitrary_types_allowed": True}
 
@@ -94,6 +94,8 @@ class Document(BaseModel):
     blob: bytes
     doc_updated_at: datetime
     size_bytes: int
+    # Version of the source object, e.g. "<version number>|<ETag>", to skip it while unchanged
+    version: Optional[str] = None
 
 
 class BasicExpertInfo(BaseModel):
@@ -1011,6 +1011,40 @@ def load_all_docs_from_checkpoint_connector(
     )
 
 
+def iter_doc_batches_from_checkpoint_connector(
+    connector: CheckpointedConnector[CT],
+    start: SecondsSinceUnixEpoch,
+    end: SecondsSinceUnixEpoch,
+    checkpoint: CT | None = None,
+) -> Generator[tuple[list[Document], CT], None, None]:
+    """
+    Documents of a checkpointed connector, one `load_from_checkpoint` at a time, with the checkpoint to
+    resume from once they're handled. Starts from `checkpoint` if given. Failures are logged and skipped.
+    """
+    if checkpoint is None:
+        checkpoint = cast(CT, connector.build_dummy_checkpoint())
+    num_iterations = 0
+    while checkpoint.has_more:
+        documents: list[Document] = []
+        next_checkpoint = None
+        doc_batch_generator = CheckpointOutputWrapper[CT]()(
+            connector.load_from_checkpoint(start=start, end=end, checkpoint=checkpoint)
+        )
+        for document, failure, next_checkpoint_ in doc_batch_generator:
+            if failure is not None:
+                logging.warning(f"Failed to load a document: {failure.failure_message}")
+            if document is not None:
+                documents.append(document)
+            if next_checkpoint_ is not None:
+                next_checkpoint = next_checkpoint_
+        checkpoint = next_checkpoint
+        yield documents, checkpoint
+
+        num_iterations += 1
+        if num_iterations > _ITERATION_LIMIT:
+            raise RuntimeError("Too many iterations. Infinite loop?")
+
+
 def get_cloudId(base_url: str) -> str:
     tenant_info_url = urljoin(base_url, "/_edge/tenant_info")
     response = requests.get(tenant_info_url, timeout=10)
@@ -0,0 +1,141 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Concurrent fetching from rate limited HTTP APIs, for the data source connectors.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, TypeVar
+
+import requests
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Values of X-RateLimit-Reset above this are epoch seconds rather than seconds to wait.
+_EPOCH_THRESHOLD = 10 ** 9
+
+
+def parse_delay(value: str | None, now: float | None = None) -> float | None:
+    """
+    Seconds to wait according to a Retry-After or X-RateLimit-Reset header: a number of seconds, epoch
+    seconds, an HTTP date or an ISO 8601 time. None if there's no header or it can't be read.
+    """
+    if not value:
+        return None
+    now = time.time() if now is None else now
+    value = value.strip()
+    try:
+        seconds = float(value)
+        return max(seconds - now, 0) if seconds > _EPOCH_THRESHOLD else max(seconds, 0)
+    except ValueError:
+        pass
+    for parse in (parsedate_to_datetime, datetime.fromisoformat):
+        try:
+            at = parse(value)
+        except (TypeError, ValueError):
+            continue
+        if at.tzinfo is None:
+            at = at.replace(tzinfo=timezone.utc)
+        return max(at.timestamp() - now, 0)
+    return None
+
+
+class RateLimitGate:
+    """
+    Pause shared by the threads calling one API.
+
+    Once a response tells the rate limit is hit, or that no request is left before it resets, every request
+    going through the gate waits for the API to accept them again, instead of each thread being rejected in
+    turn. Rejections without a delay back off exponentially from `base_delay`, every delay is capped at
+    `max_delay` seconds.
+    """
+
+    def __init__(self, base_delay: float = 2, max_delay: float = 60):
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._lock = threading.Lock()
+        self._open_at = 0.0
+        self.pauses = 0
+
+    def wait(self):
+        while True:
+            with self._lock:
+                delay = self._open_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def close_for(self, seconds: float):
+        with self._lock:
+            open_at = time.monotonic() + min(max(seconds, 0), self._max_delay)
+            if open_at > self._open_at:
+                self._open_at = open_at
+                self.pauses += 1
+
+    def observe(self, response: requests.Response, attempt: int = 0) -> bool:
+        """Close the gate as long as `response` asks. Returns whether it's a rate limit rejection worth retrying."""
+        headers = response.headers
+        retry_after = parse_delay(headers.get("Retry-After"))
+        if response.status_code == 429 or (response.status_code == 503 and retry_after is not None):
+            self.close_for(retry_after if retry_after is not None else self._base_delay * 2 ** attempt)
+            return True
+        if headers.get("X-RateLimit-Remaining", "").strip() == "0":
+            reset = parse_delay(headers.get("X-RateLimit-Reset"))
+            self.close_for(retry_after if retry_after is not None else reset if reset is not None else self._base_delay)
+        return False
+
+
+def get_with_rate_limit(session: requests.Session, url: str, gate: RateLimitGate, max_retries: int = 5,
+                        **kwargs: Any) -> requests.Response:
+    """`session.get(url)` through `gate`, retried while the API rejects it for its rate limit."""
+    for attempt in range(max_retries + 1):
+        gate.wait()
+        response = session.get(url, **kwargs)
+        if not gate.observe(response, attempt) or attempt == max_retries:
+            return response
+        logging.warning(f"Rate limited by {url}, retrying ({attempt + 1}/{max_retries})")
+    return response
+
+
+def map_concurrently(func: Callable[[T], R], items: Iterable[T], max_workers: int) -> Iterator[R]:
+    """
+    `map(func, items)` on `max_workers` threads, in the order of `items`. At most twice as many items as
+    workers are taken from `items` ahead of the results consumed, and an exception is raised in place
+    of the result it replaces.
+    """
+    if max_workers <= 1:
+        yield from map(func, items)
+        return
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch") as executor:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= 2 * max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -16,6 +16,7 @@
 
 import base64
 import hashlib
+import importlib
 import uuid
 import requests
 import threading
@@ -98,6 +99,32 @@ def once(func):
         return result
     return wrapper
 
+class LazyModule:
+    """
+    Stands in for a module that is imported on first attribute access.
+
+    Example:
+        naive = LazyModule("rag.app.naive")
+        naive.chunk(...)  # rag.app.naive is imported here
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, item):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, item)
+
+    @property
+    def module_name(self) -> str:
+        return self._name
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+
 @once
 def pip_install_torch():
     device = os.getenv("DEVICE", "cpu")
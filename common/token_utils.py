@@ -74,3 +74,21 @@ def truncate(string: str, max_len: int) -> str:
     """Returns truncated text if the length of text exceed max_len."""
     return encoder.decode(encoder.encode(string)[:max_len])
 
+
+def pack_by_tokens(texts: list[str], max_tokens: int, max_count: int) -> list[list[int]]:
+    """
+    Groups the indices of `texts`, in order, so that each group holds at most `max_count` texts
+    of at most `max_tokens` tokens in total. A text over `max_tokens` on its own gets a group of its own.
+    """
+    groups = []
+    group, group_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = num_tokens_from_string(text)
+        if group and (len(group) >= max_count or group_tokens + tokens > max_tokens):
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(i)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
@@ -14,6 +14,7 @@
 import logging
 import re
 import sys
+import zipfile
 from io import BytesIO
 
 import pandas as pd
@@ -64,6 +65,47 @@ class RAGFlowExcelParser:
             except Exception as e_pandas:
                 raise Exception(f"pandas.read_excel error: {e_pandas}, original openpyxl error: {e}")
 
+    @staticmethod
+    def _load_excel_to_read_only_workbook(file_like_object):
+        """
+        Opens a plain xlsx workbook in read-only mode, where rows are parsed while iterated
+        instead of all cells being loaded up front. The caller closes it. The sheets are read to
+        their last row whatever the range their `<dimension>` claims, often wrong in generated files.
+
+        Returns None for anything that needs `_load_excel_to_workbook`: CSV content, legacy xls,
+        and workbooks with merged cells, which read-only worksheets do not expose.
+        """
+        if isinstance(file_like_object, bytes):
+            file_like_object = BytesIO(file_like_object)
+        if not hasattr(file_like_object, "seek"):
+            return None
+        file_like_object.seek(0)
+        if not file_like_object.read(4).startswith(b"PK\x03\x04"):
+            file_like_object.seek(0)
+            return None
+        try:
+            file_like_object.seek(0)
+            with zipfile.ZipFile(file_like_object) as zf:
+                for name in zf.namelist():
+                    if not (name.startswith("xl/worksheets/") and name.endswith(".xml")):
+                        continue
+                    with zf.open(name) as f:
+                        tail = b""
+                        while block := f.read(1 << 20):
+                            if b"mergeCell" in tail + block:
+                                return None
+                            tail = block[-16:]
+            file_like_object.seek(0)
+            wb = load_workbook(file_like_object, read_only=True, data_only=True)
+            for ws in wb.worksheets:
+                ws.reset_dimensions()
+            return wb
+        except Exception as e:
+            logging.info(f"openpyxl read-only load error: {e}, fall back to full load")
+            return None
+        finally:
+            file_like_object.seek(0)
+
     @staticmethod
     def _clean_dataframe(df: pd.DataFrame):
         def clean_string(s):
@@ -84,12 +126,9 @@ class RAGFlowExcelParser:
         ws = wb.active
         ws.title = "Data"
 
-        for col_num, column_name in enumerate(df.columns, 1):
-            ws.cell(row=1, column=col_num, value=column_name)
-
-        for row_num, row in enumerate(df.values, 2):
-            for col_num, value in enumerate(row, 1):
-                ws.cell(row=row_num, column=col_num, value=value)
+        ws.append(list(df.columns))
+        for row in df.values:
+            ws.append(list(row))
 
         return wb
     
@@ -102,11 +141,9 @@ class RAGFlowExcelParser:
         for sheet_name, df in dfs.items():
             df = RAGFlowExcelParser._clean_dataframe(df)
             ws = wb.create_sheet(title=sheet_name)
-            for col_num, column_name in enumerate(df.columns, 1):
-                ws.cell(row=1, column=col_num, value=column_name)
-            for row_num, row in enumerate(df.values, 2):
-                for col_num, value in enumerate(row, 1):
-                    ws.cell(row=row_num, column=col_num, value=value)
+            ws.append(list(df.columns))
+            for row in df.values:
+                ws.append(list(row))
         return wb
 
     def html(self, fnm, chunk_rows=256):
@@ -200,6 +237,13 @@ class RAGFlowExcelParser:
     @staticmethod
     def row_number(fnm, binary):
         if fnm.split(".")[-1].lower().find("xls") >= 0:
+            wb = RAGFlowExcelParser._load_excel_to_read_only_workbook(BytesIO(binary))
+            if wb is not None:
+                try:
+                    return sum(sum(1 for _ in wb[sheetname].iter_rows(values_only=True)) for sheetname in wb.sheetnames)
+                finally:
+                    wb.close()
+
             wb = RAGFlowExcelParser._load_excel_to_workbook(BytesIO(binary))
             total = 0
             
@@ -20,7 +20,7 @@ from PIL import Image
 from api.db import LLMType
 from api.db.services.llm_service import LLMBundle
 from common.connection_utils import timeout
-from rag.app.picture import vision_llm_chunk as picture_vision_llm_chunk
+from rag.app.picture import DescriptionCacheStats, vision_llm_chunk as picture_vision_llm_chunk
 from rag.prompts.generator import vision_llm_figure_describe_prompt
 
 
@@ -119,6 +119,7 @@ class VisionFigureParser:
 
     def __call__(self, **kwargs):
         callback = kwargs.get("callback", lambda prog, msg: None)
+        stats = DescriptionCacheStats()
 
         @timeout(30, 3)
         def process(figure_idx, figure_binary):
@@ -127,6 +128,7 @@ class VisionFigureParser:
                 vision_model=self.vision_model,
                 prompt=vision_llm_figure_describe_prompt(),
                 callback=callback,
+                stats=stats,
             )
             return figure_idx, description_text
 
@@ -138,6 +140,8 @@ class VisionFigureParser:
             figure_num, txt = future.result()
             if txt:
                 self.descriptions[figure_num] = txt + "\n".join(self.descriptions[figure_num])
+        if futures:
+            callback(0.8, f"Figure descriptions: {stats}")
 
         self._assemble()
 
@@ -23,6 +23,7 @@ import sys
 import threading
 from collections import Counter, defaultdict
 from copy import deepcopy
+from functools import cached_property
 from io import BytesIO
 from timeit import default_timer as timer
 
@@ -37,10 +38,10 @@ from pypdf import PdfReader as pdf2_read
 from common.file_utils import get_project_base_directory
 from common.misc_utils import pip_install_torch
 from deepdoc.vision import OCR, AscendLayoutRecognizer, LayoutRecognizer, Recognizer, TableStructureRecognizer
-from rag.app.picture import vision_llm_chunk as picture_vision_llm_chunk
+from rag.app.picture import DescriptionCacheStats, vision_llm_chunk as picture_vision_llm_chunk
 from rag.nlp import rag_tokenizer
 from rag.prompts.generator import vision_llm_describe_prompt
-from rag.settings import PARALLEL_DEVICES
+from rag.settings import get_parallel_devices
 
 LOCK_KEY_pdfplumber = "global_shared_lock_pdfplumber"
 if LOCK_KEY_pdfplumber not in sys.modules:
@@ -61,45 +62,58 @@ class RAGFlowPdfParser:
 
         """
 
-        self.ocr = OCR()
-        self.parallel_limiter = None
-        if PARALLEL_DEVICES > 1:
-            self.parallel_limiter = [trio.CapacityLimiter(1) for _ in range(PARALLEL_DEVICES)]
-
-        layout_recognizer_type = os.getenv("LAYOUT_RECOGNIZER_TYPE", "onnx").lower()
-        if layout_recognizer_type not in ["onnx", "ascend"]:
+        # The models are built on first use, parsers that never OCR or never recognize tables skip them.
+        self.layout_recognizer_type = os.getenv("LAYOUT_RECOGNIZER_TYPE", "onnx").lower()
+        if self.layout_recognizer_type not in ["onnx", "ascend"]:
             raise RuntimeError("Unsupported layout recognizer type.")
 
+        self.page_from = 0
+        self.column_num = 1
+
+    @cached_property
+    def ocr(self):
+        return OCR()
+
+    @cached_property
+    def parallel_limiter(self):
+        if get_parallel_devices() > 1:
+            return [trio.CapacityLimiter(1) for _ in range(get_parallel_devices())]
+        return None
+
+    @cached_property
+    def layouter(self):
         if hasattr(self, "model_speciess"):
             recognizer_domain = "layout." + self.model_speciess
         else:
             recognizer_domain = "layout"
 
-        if layout_recognizer_type == "ascend":
+        if self.layout_recognizer_type == "ascend":
             logging.debug("Using Ascend LayoutRecognizer")
-            self.layouter = AscendLayoutRecognizer(recognizer_domain)
-        else:  # onnx
-            logging.debug("Using Onnx LayoutRecognizer")
-            self.layouter = LayoutRecognizer(recognizer_domain)
-        self.tbl_det = TableStructureRecognizer()
+            return AscendLayoutRecognizer(recognizer_domain)
+        logging.debug("Using Onnx LayoutRecognizer")
+        return LayoutRecognizer(recognizer_domain)
+
+    @cached_property
+    def tbl_det(self):
+        return TableStructureRecognizer()
 
-        self.updown_cnt_mdl = xgb.Booster()
+    @cached_property
+    def updown_cnt_mdl(self):
+        updown_cnt_mdl = xgb.Booster()
         try:
             pip_install_torch()
             import torch.cuda
             if torch.cuda.is_available():
-                self.updown_cnt_mdl.set_param({"device": "cuda"})
+                updown_cnt_mdl.set_param({"device": "cuda"})
         except Exception:
             logging.info("No torch found.")
         try:
             model_dir = os.path.join(get_project_base_directory(), "rag/res/deepdoc")
-            self.updown_cnt_mdl.load_model(os.path.join(model_dir, "updown_concat_xgb.model"))
+            updown_cnt_mdl.load_model(os.path.join(model_dir, "updown_concat_xgb.model"))
         except Exception:
             model_dir = snapshot_download(repo_id="InfiniFlow/text_concat_xgb_v1.0", local_dir=os.path.join(get_project_base_directory(), "rag/res/deepdoc"), local_dir_use_symlinks=False)
-            self.updown_cnt_mdl.load_model(os.path.join(model_dir, "updown_concat_xgb.model"))
-
-        self.page_from = 0
-        self.column_num = 1
+            updown_cnt_mdl.load_model(os.path.join(model_dir, "updown_concat_xgb.model"))
+        return updown_cnt_mdl
 
     def __char_width(self, c):
         return (c["x1"] - c["x0"]) // max(len(c["text"]), 1)
@@ -1113,7 +1127,7 @@ class RAGFlowPdfParser:
                     for i, img in enumerate(self.page_images):
                         chars = __ocr_preprocess()
 
-                        nursery.start_soon(__img_ocr, i, i % PARALLEL_DEVICES, img, chars, self.parallel_limiter[i % PARALLEL_DEVICES])
+                        nursery.start_soon(__img_ocr, i, i % len(self.parallel_limiter), img, chars, self.parallel_limiter[i % len(self.parallel_limiter)])
                         await trio.sleep(0.1)
             else:
                 for i, img in enumerate(self.page_images):
@@ -1374,6 +1388,7 @@ class VisionParser(RAGFlowPdfParser):
         end_page = min(to_page, total_pdf_pages)
 
         all_docs = []
+        stats = DescriptionCacheStats()
 
         for idx, img_binary in enumerate(self.page_images or []):
             pdf_page_num = idx  # 0-based
@@ -1385,10 +1400,11 @@ class VisionParser(RAGFlowPdfParser):
                 vision_model=self.vision_model,
                 prompt=vision_llm_describe_prompt(page=pdf_page_num + 1),
                 callback=callback,
+                stats=stats,
             )
 
             if kwargs.get("callback"):
-                kwargs["callback"](idx * 1.0 / len(self.page_images), f"Processed: {idx + 1}/{len(self.page_images)}")
+                kwargs["callback"](idx * 1.0 / len(self.page_images), f"Processed: {idx + 1}/{len(self.page_images)} ({stats})")
 
             if text:
                 width, height = self.page_images[idx].size
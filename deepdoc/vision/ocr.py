@@ -23,7 +23,7 @@ from huggingface_hub import snapshot_download
 
 from common.file_utils import get_project_base_directory
 from common.misc_utils import pip_install_torch
-from rag.settings import PARALLEL_DEVICES
+from rag.settings import get_parallel_devices
 from .operators import *  # noqa: F403
 from . import operators
 import math
@@ -547,6 +547,7 @@ class OCR:
         ^_-
 
         """
+        PARALLEL_DEVICES = get_parallel_devices()
         if not model_dir:
             try:
                 model_dir = os.path.join(
@@ -74,7 +74,7 @@ class Extractor:
                 response = re.sub(r"^.*</think>", "", response, flags=re.DOTALL)
                 if response.find("**ERROR**") >= 0:
                     raise Exception(response)
-                set_llm_cache(self._llm.llm_name, system, response, history, gen_conf)
+                set_llm_cache(self._llm.llm_name, system, response, history, gen_conf, "extraction")
             except Exception as e:
                 logging.exception(e)
                 if attempt == 2:
@@ -55,8 +55,8 @@ async def run_graphrag(
     start = trio.current_time()
     tenant_id, kb_id, doc_id = row["tenant_id"], str(row["kb_id"]), row["doc_id"]
     chunks = []
-    for d in settings.retriever.chunk_list(doc_id, tenant_id, [kb_id], fields=["content_with_weight", "doc_id"], sort_by_position=True):
-        chunks.append(d["content_with_weight"])
+    for batch in settings.retriever.iter_chunks(doc_id, tenant_id, [kb_id], fields=["content_with_weight", "doc_id"], sort_by_position=True):
+        chunks.extend(d["content_with_weight"] for d in batch)
 
     with trio.fail_after(max(120, len(chunks) * 60 * 10) if enable_timeout_assertion else 10000000000):
         subgraph = await generate_subgraph(
@@ -170,20 +170,21 @@ async def run_graphrag_for_kb(
         chunks = []
         current_chunk = ""
 
-        for d in settings.retriever.chunk_list(
+        for batch in settings.retriever.iter_chunks(
             doc_id,
             tenant_id,
             [kb_id],
             fields=fields_for_chunks,
             sort_by_position=True,
         ):
-            content = d["content_with_weight"]
-            if num_tokens_from_string(current_chunk + content) < 1024:
-                current_chunk += content
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                current_chunk = content
+            for d in batch:
+                content = d["content_with_weight"]
+                if num_tokens_from_string(current_chunk + content) < 1024:
+                    current_chunk += content
+                else:
+                    if current_chunk:
+                        chunks.append(current_chunk)
+                    current_chunk = content
 
         if current_chunk:
             chunks.append(current_chunk)
@@ -28,6 +28,7 @@ from common.misc_utils import get_uuid
 from common.connection_utils import timeout
 from rag.nlp import rag_tokenizer, search
 from rag.utils.doc_store_conn import OrderByExpr
+from rag.utils.llm_cache import LLM_CACHE, llm_cache_key
 from rag.utils.redis_conn import REDIS_CONN
 
 GRAPH_FIELD_SEP = "<SEP>"
@@ -91,43 +92,49 @@ def dict_has_keys_with_types(data: dict, expected_fields: list[tuple[str, type]]
 
 
 def get_llm_cache(llmnm, txt, history, genconf):
-    hasher = xxhash.xxh64()
-    hasher.update((str(llmnm)+str(txt)+str(history)+str(genconf)).encode("utf-8"))
+    return LLM_CACHE.get(llm_cache_key(llmnm, txt, history, genconf))
 
-    k = hasher.hexdigest()
-    bin = REDIS_CONN.get(k)
-    if not bin:
-        return None
-    return bin
 
+def get_llm_cache_many(llmnm, txts, history, genconf, use_case=None):
+    return LLM_CACHE.get_many([llm_cache_key(llmnm, txt, history, genconf) for txt in txts], use_case)
 
-def set_llm_cache(llmnm, txt, v, history, genconf):
-    hasher = xxhash.xxh64()
-    hasher.update((str(llmnm)+str(txt)+str(history)+str(genconf)).encode("utf-8"))
-    k = hasher.hexdigest()
-    REDIS_CONN.set(k, v.encode("utf-8"), 24 * 3600)
 
+def set_llm_cache(llmnm, txt, v, history, genconf, use_case=None):
+    LLM_CACHE.set(llm_cache_key(llmnm, txt, history, genconf), v, use_case)
 
-def get_embed_cache(llmnm, txt):
+
+def set_llm_cache_many(llmnm, txt2v: dict, history, genconf, use_case=None):
+    LLM_CACHE.set_many({llm_cache_key(llmnm, txt, history, genconf): v for txt, v in txt2v.items()}, use_case)
+
+
+def embed_cache_key(llmnm, txt):
     hasher = xxhash.xxh64()
     hasher.update(str(llmnm).encode("utf-8"))
     hasher.update(str(txt).encode("utf-8"))
+    return hasher.hexdigest()
 
-    k = hasher.hexdigest()
-    bin = REDIS_CONN.get(k)
+
+def get_embed_cache(llmnm, txt):
+    bin = REDIS_CONN.get(embed_cache_key(llmnm, txt))
     if not bin:
         return
     return np.array(json.loads(bin))
 
 
-def set_embed_cache(llmnm, txt, arr):
-    hasher = xxhash.xxh64()
-    hasher.update(str(llmnm).encode("utf-8"))
-    hasher.update(str(txt).encode("utf-8"))
+def get_embed_cache_many(llmnm, txts):
+    return [np.array(json.loads(bin)) if bin else None for bin in REDIS_CONN.mget([embed_cache_key(llmnm, txt) for txt in txts])]
 
-    k = hasher.hexdigest()
+
+def set_embed_cache(llmnm, txt, arr):
     arr = json.dumps(arr.tolist() if isinstance(arr, np.ndarray) else arr)
-    REDIS_CONN.set(k, arr.encode("utf-8"), 24 * 3600)
+    REDIS_CONN.set(embed_cache_key(llmnm, txt), arr.encode("utf-8"), 24 * 3600)
+
+
+def set_embed_cache_many(llmnm, txt2arr: dict):
+    REDIS_CONN.mset_with_ttl({
+        embed_cache_key(llmnm, txt): json.dumps(arr.tolist() if isinstance(arr, np.ndarray) else arr)
+        for txt, arr in txt2arr.items()
+    }, 24 * 3600)
 
 
 def get_tags_from_cache(kb_ids):
@@ -15,18 +15,79 @@
 #
 
 import io
+import os
 import re
+import threading
 
 import numpy as np
+import xxhash
 from PIL import Image
 
 from api.db import LLMType
 from api.db.services.llm_service import LLMBundle
 from deepdoc.vision import OCR
 from rag.nlp import rag_tokenizer, tokenize
+from common.misc_utils import once
 from common.string_utils import clean_markdown_block
+from rag.utils.redis_conn import REDIS_CONN
+
+
+@once
+def get_ocr():
+    # Built on first use, importing this module must not load the OCR models.
+    return OCR()
+
+VISION_DESCRIPTION_CACHE_TTL = int(os.environ.get("VISION_DESCRIPTION_CACHE_TTL", 7 * 24 * 3600))
+
+
+class DescriptionCacheStats:
+    """Hits and misses of the vision description cache while parsing one document."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def __str__(self):
+        return f"{self.hits} cached, {self.misses} described"
+
+
+def describe_image(img: Image.Image, vision_model, prompt=None, stats: DescriptionCacheStats | None = None) -> str:
+    """
+    `vision_model.describe_with_prompt`, or `describe` without a prompt, of an image.
+
+    Descriptions are cached in Redis by image pixels, model and prompt, so parsing a
+    document again (other chunking settings, re-upload) does not pay the VLM again.
+    """
+    hasher = xxhash.xxh128()
+    hasher.update(f"{img.mode}{img.size}".encode("utf-8"))
+    hasher.update(img.tobytes())
+    hasher.update(str(getattr(vision_model, "tenant_id", "")).encode("utf-8"))
+    hasher.update(str(getattr(vision_model, "llm_name", None) or getattr(getattr(vision_model, "mdl", None), "model_name", "")).encode("utf-8"))
+    hasher.update(str(prompt).encode("utf-8"))
+    key = "vision_description:" + hasher.hexdigest()
+
+    ans = REDIS_CONN.get(key)
+    if stats is not None:
+        stats.add(bool(ans))
+    if ans:
+        return ans
+
+    with io.BytesIO() as img_binary:
+        img.save(img_binary, format="JPEG")
+        binary = img_binary.getvalue()
+    ans = vision_model.describe(binary) if prompt is None else vision_model.describe_with_prompt(binary, prompt)
+    if ans:
+        REDIS_CONN.set(key, ans, VISION_DESCRIPTION_CACHE_TTL)
+    return ans
 
-ocr = OCR()
 
 # Gemini supported MIME types
 VIDEO_EXTS = [".mp4", ".mov", ".avi", ".flv", ".mpeg", ".mpg", ".webm", ".wmv", ".3gp", ".3gpp", ".mkv"]
@@ -58,7 +119,7 @@ def chunk(filename, binary, tenant_id, lang, callback=None, **kwargs):
                 "doc_type_kwd": "image",
             }
         )
-        bxs = ocr(np.array(img))
+        bxs = get_ocr()(np.array(img))
         txt = "\n".join([t[0] for _, t in bxs if t[0]])
         callback(0.4, "Finish OCR: (%s ...)" % txt[:12])
         if (eng and len(txt.split()) > 32) or len(txt) > 32:
@@ -69,11 +130,9 @@ def chunk(filename, binary, tenant_id, lang, callback=None, **kwargs):
         try:
             callback(0.4, "Use CV LLM to describe the picture.")
             cv_mdl = LLMBundle(tenant_id, LLMType.IMAGE2TEXT, lang=lang)
-            img_binary = io.BytesIO()
-            img.save(img_binary, format="JPEG")
-            img_binary.seek(0)
-            ans = cv_mdl.describe(img_binary.read())
-            callback(0.8, "CV LLM respond: %s ..." % ans[:32])
+            stats = DescriptionCacheStats()
+            ans = describe_image(img, cv_mdl, stats=stats)
+            callback(0.8, "CV LLM respond%s: %s ..." % (" (cached)" if stats.hits else "", ans[:32]))
             txt += "\n" + ans
             tokenize(doc, txt, eng)
             return [doc]
@@ -83,7 +142,7 @@ def chunk(filename, binary, tenant_id, lang, callback=None, **kwargs):
     return []
 
 
-def vision_llm_chunk(binary, vision_model, prompt=None, callback=None):
+def vision_llm_chunk(binary, vision_model, prompt=None, callback=None, stats=None):
     """
     A simple wrapper to process image to markdown texts via VLM.
 
@@ -96,12 +155,9 @@ def vision_llm_chunk(binary, vision_model, prompt=None, callback=None):
     txt = ""
 
     try:
-        with io.BytesIO() as img_binary:
-            img.save(img_binary, format="JPEG")
-            img_binary.seek(0)
-            ans = clean_markdown_block(vision_model.describe_with_prompt(img_binary.read(), prompt))
-            txt += "\n" + ans
-            return txt
+        ans = clean_markdown_block(describe_image(img, vision_model, prompt, stats))
+        txt += "\n" + ans
+        return txt
 
     except Exception as e:
         callback(-1, str(e))
@@ -34,13 +34,15 @@ from deepdoc.parser import ExcelParser
 
 class Excel(ExcelParser):
     def __call__(self, fnm, binary=None, from_page=0, to_page=10000000000, callback=None):
-        if not binary:
-            wb = Excel._load_excel_to_workbook(fnm)
-        else:
-            wb = Excel._load_excel_to_workbook(BytesIO(binary))
-        total = 0
-        for sheetname in wb.sheetnames:
-            total += len(list(wb[sheetname].rows))
+        file_like_object = BytesIO(binary) if binary else fnm
+        wb = Excel._load_excel_to_read_only_workbook(file_like_object)
+        if wb is not None:
+            try:
+                return self._read_rows(wb, from_page, to_page, callback)
+            finally:
+                wb.close()
+
+        wb = Excel._load_excel_to_workbook(file_like_object)
         res, fails, done = [], [], 0
         rn = 0
         for sheetname in wb.sheetnames:
@@ -77,6 +79,37 @@ class Excel(ExcelParser):
         callback(0.3, ("Extract records: {}~{}".format(from_page + 1, min(to_page, from_page + rn)) + (f"{len(fails)} failure, line: %s..." % (",".join(fails[:3])) if fails else "")))
         return res
 
+    def _read_rows(self, wb, from_page, to_page, callback):
+        """
+        Reads the data rows in [from_page, to_page) of a read-only workbook. Rows are parsed one at a time
+        and reading stops at `to_page`, so a task never holds more than its own row range.
+        """
+        res, rn = [], 0
+        for sheetname in wb.sheetnames:
+            if rn >= to_page:
+                break
+            rows = wb[sheetname].iter_rows(values_only=True)
+            first = next(rows, None)
+            if not first:
+                continue
+            # Without merged cells headers are always the simple, single row ones.
+            headers = [str(v).strip() if v is not None and str(v).strip() else f"Column_{i + 1}" for i, v in enumerate(first)]
+            data = []
+            for r in rows:
+                rn += 1
+                if rn - 1 < from_page:
+                    continue
+                if rn - 1 >= to_page:
+                    break
+                row_data = list(r[: len(headers)]) + [None] * (len(headers) - len(r))
+                if self._is_empty_row(row_data):
+                    continue
+                data.append(row_data)
+            if data:
+                res.append(pd.DataFrame(data, columns=headers))
+        callback(0.3, "Extract records: {}~{}".format(from_page + 1, min(to_page, from_page + rn)))
+        return res
+
     def _parse_headers(self, ws, rows):
         if len(rows) == 0:
             return [], 0
@@ -330,12 +363,8 @@ def chunk(filename, binary=None, from_page=0, to_page=10000000000, lang="Chinese
         fails = []
         headers = lines[0].split(kwargs.get("delimiter", "\t"))
         rows = []
-        for i, line in enumerate(lines[1:]):
-            if i < from_page:
-                continue
-            if i >= to_page:
-                break
-            row = [field for field in line.split(kwargs.get("delimiter", "\t"))]
+        for i, line in enumerate(lines[1 + from_page: 1 + to_page], start=from_page):
+            row = line.split(kwargs.get("delimiter", "\t"))
             if len(row) != len(headers):
                 fails.append(str(i))
                 continue
@@ -374,19 +403,25 @@ def chunk(filename, binary=None, from_page=0, to_page=10000000000, lang="Chinese
         clmns_map = [(py_clmns[i].lower() + fieds_map[clmn_tys[i]], str(clmns[i]).replace("_", " ")) for i in range(len(clmns))]
 
         eng = lang.lower() == "english"  # is_english(txts)
-        for ii, row in df.iterrows():
-            d = {"docnm_kwd": filename, "title_tks": rag_tokenizer.tokenize(re.sub(r"\.[a-zA-Z]+$", "", filename))}
+        title_tks = rag_tokenizer.tokenize(re.sub(r"\.[a-zA-Z]+$", "", filename))
+        # Column at a time: per column the field name, the field values and the "header:value" texts,
+        # with None where a cell is empty.
+        columns = []
+        for j in range(len(clmns)):
+            vals = df[clmns[j]].tolist()
+            vals = [None if v is None or not str(v) or pd.isna(v) else v for v in vals]
+            flds = vals if clmn_tys[j] != "text" else [None if v is None else rag_tokenizer.tokenize(v) for v in vals]
+            texts = [None if v is None else "{}:{}".format(clmns[j], v) for v in vals]
+            columns.append((clmns_map[j][0], flds, texts))
+
+        for i in range(len(df)):
+            d = {"docnm_kwd": filename, "title_tks": title_tks}
             row_txt = []
-            for j in range(len(clmns)):
-                if row[clmns[j]] is None:
-                    continue
-                if not str(row[clmns[j]]):
-                    continue
-                if not isinstance(row[clmns[j]], pd.Series) and pd.isna(row[clmns[j]]):
+            for fld, flds, texts in columns:
+                if texts[i] is None:
                     continue
-                fld = clmns_map[j][0]
-                d[fld] = row[clmns[j]] if clmn_tys[j] != "text" else rag_tokenizer.tokenize(row[clmns[j]])
-                row_txt.append("{}:{}".format(clmns[j], row[clmns[j]]))
+                d[fld] = flds[i]
+                row_txt.append(texts[i])
             if not row_txt:
                 continue
             tokenize(d, "; ".join(row_txt), eng)
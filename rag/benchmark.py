@@ -53,7 +53,7 @@ class Benchmark:
         query_list = list(qrels.keys())
         for query in query_list:
             ranks = settings.retriever.retrieval(query, self.embd_mdl, self.tenant_id, [self.kb.id], 1, 30,
-                                            0.0, self.vector_similarity_weight)
+                                            0.0, self.vector_similarity_weight, return_vector=False)
             if len(ranks["chunks"]) == 0:
                 print(f"deleted query: {query}")
                 del qrels[query]
@@ -44,11 +44,12 @@ class Pipeline(Graph):
         from rag.svr.task_executor import TaskCanceledException
         log_key = f"{self._flow_id}-{self.task_id}-logs"
         timestamp = timer()
-        if has_canceled(self.task_id):
+        # The cancel flag and the logs in one round trip.
+        canceled, bin = REDIS_CONN.mget([f"{self.task_id}-cancel", log_key])
+        if canceled:
             progress = -1
             message += "[CANCEL]"
         try:
-            bin = REDIS_CONN.get(log_key)
             obj = json.loads(bin.encode("utf-8"))
             if obj:
                 if obj[-1]["component_id"] == component_name:
@@ -17,13 +17,12 @@ import random
 import re
 
 import numpy as np
-import trio
 
 from api.db import LLMType
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.llm_service import LLMBundle
 from api.db.services.user_service import TenantService
-from common.connection_utils import timeout
+from common.connection_utils import run_sync_with_timeout
 from rag.flow.base import ProcessBase, ProcessParamBase
 from rag.flow.tokenizer.schema import TokenizerFromUpstream
 from rag.nlp import rag_tokenizer
@@ -75,8 +74,6 @@ class Tokenizer(ProcessBase):
         vts, c = embedding_model.encode([name])
         token_count += c
         tts = np.concatenate([vts[0] for _ in range(len(texts))], axis=0)
-
-        @timeout(60)
         def batch_encode(txts):
             nonlocal embedding_model
             return embedding_model.encode([truncate(c, embedding_model.max_length - 10) for c in txts])
@@ -84,7 +81,7 @@ class Tokenizer(ProcessBase):
         cnts_ = np.array([])
         for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
             async with embed_limiter:
-                vts, c = await trio.to_thread.run_sync(lambda: batch_encode(texts[i : i + EMBEDDING_BATCH_SIZE]))
+                vts, c = await run_sync_with_timeout(120, batch_encode, texts[i : i + EMBEDDING_BATCH_SIZE])
             if len(cnts_) == 0:
                 cnts_ = vts
             else:
@@ -13,6 +13,7 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import ast
 import json
 import logging
 import re
@@ -22,10 +23,10 @@ from collections import OrderedDict
 from dataclasses import dataclass
 
 from rag.prompts.generator import relevant_chunks_with_toc
-from rag.settings import TAG_FLD, PAGERANK_FLD
+from rag.settings import TAG_FLD, TAG_NORM_FLD, PAGERANK_FLD
 from rag.nlp import rag_tokenizer, query
 import numpy as np
-from rag.utils.doc_store_conn import DocStoreConnection, MatchDenseExpr, FusionExpr, OrderByExpr
+from rag.utils.doc_store_conn import DocStoreConnection, MatchDenseExpr, FusionExpr, OrderByExpr, vector_matrix
 from common.string_utils import remove_redundant_spaces
 from common.float_utils import get_float
 
@@ -33,6 +34,29 @@ from common.float_utils import get_float
 def index_name(uid): return f"ragflow_{uid}"
 
 
+def tag_features(v) -> dict:
+    """The TAG_FLD features of a chunk, as stored (dict) or as read back from a doc store (JSON or dict string)."""
+    if not v:
+        return {}
+    if isinstance(v, dict):
+        return v
+    try:
+        return json.loads(v)
+    except ValueError:
+        try:
+            return ast.literal_eval(v)
+        except (ValueError, SyntaxError):
+            logging.warning(f"Unparsable {TAG_FLD}: {v[:128]}")
+            return {}
+
+
+def set_tag_features(d: dict, tags: dict):
+    """Sets the TAG_FLD features of chunk `d` together with their norm."""
+    d[TAG_FLD] = tags
+    if isinstance(tags, dict):
+        d[TAG_NORM_FLD] = float(np.sqrt(sum(sc * sc for sc in tags.values())))
+
+
 class Dealer:
     def __init__(self, dataStore: DocStoreConnection):
         self.qryr = query.FulltextQueryer()
@@ -91,7 +115,7 @@ class Dealer:
                       ["docnm_kwd", "content_ltks", "kb_id", "img_id", "title_tks", "important_kwd", "position_int",
                        "doc_id", "page_num_int", "top_int", "create_timestamp_flt", "knowledge_graph_kwd",
                        "question_kwd", "question_tks", "doc_type_kwd",
-                       "available_int", "content_with_weight", PAGERANK_FLD, TAG_FLD])
+                       "available_int", "content_with_weight", PAGERANK_FLD, TAG_FLD, TAG_NORM_FLD])
         kwds = set([])
 
         qst = req.get("question", "")
@@ -120,7 +144,8 @@ class Dealer:
             else:
                 matchDense = self.get_vector(qst, emb_mdl, topk, req.get("similarity", 0.1))
                 q_vec = matchDense.embedding_data
-                src.append(f"q_{len(q_vec)}_vec")
+                if req.get("vector", True):
+                    src.append(f"q_{len(q_vec)}_vec")
 
                 fusionExpr = FusionExpr("weighted_sum", topk, {"weights": "0.05,0.95"})
                 matchExprs = [matchText, matchDense, fusionExpr]
@@ -262,30 +287,26 @@ class Dealer:
 
     def _rank_feature_scores(self, query_rfea, search_res):
         ## For rank feature(tag_fea) scores.
-        rank_fea = []
-        pageranks = []
-        for chunk_id in search_res.ids:
-            pageranks.append(search_res.field[chunk_id].get(PAGERANK_FLD, 0))
-        pageranks = np.array(pageranks, dtype=float)
-
-        if not query_rfea:
-            return np.array([0 for _ in range(len(search_res.ids))]) + pageranks
-
-        q_denor = np.sqrt(np.sum([s*s for t,s in query_rfea.items() if t != PAGERANK_FLD]))
-        for i in search_res.ids:
-            nor, denor = 0, 0
-            if not search_res.field[i].get(TAG_FLD):
-                rank_fea.append(0)
+        pageranks = np.array([search_res.field[chunk_id].get(PAGERANK_FLD, 0) for chunk_id in search_res.ids], dtype=float)
+        query_tags = {t: sc for t, sc in (query_rfea or {}).items() if t != PAGERANK_FLD}
+        q_denor = np.sqrt(np.sum([sc * sc for sc in query_tags.values()]))
+        if not query_tags or q_denor == 0:
+            return np.zeros(len(search_res.ids)) + pageranks
+
+        # Cosine of the query and chunk tags: a sparse dot product over the few query tags,
+        # divided by the chunk norm computed at index time (or here for chunks indexed before).
+        rank_fea = np.zeros(len(search_res.ids))
+        for i, chunk_id in enumerate(search_res.ids):
+            fields = search_res.field[chunk_id]
+            tags = tag_features(fields.get(TAG_FLD))
+            nor = sum(sc * tags.get(t, 0) for t, sc in query_tags.items())
+            if not nor:
                 continue
-            for t, sc in eval(search_res.field[i].get(TAG_FLD, "{}")).items():
-                if t in query_rfea:
-                    nor += query_rfea[t] * sc
-                denor += sc * sc
-            if denor == 0:
-                rank_fea.append(0)
-            else:
-                rank_fea.append(nor/np.sqrt(denor)/q_denor)
-        return np.array(rank_fea)*10. + pageranks
+            denor = get_float(fields.get(TAG_NORM_FLD))
+            if denor <= 0:
+                denor = np.sqrt(np.sum([sc * sc for sc in tags.values()]))
+            rank_fea[i] = nor / denor / q_denor
+        return rank_fea * 10. + pageranks
 
     def rerank(self, sres, query, tkweight=0.3,
                vtweight=0.7, cfield="content_ltks",
@@ -294,15 +315,9 @@ class Dealer:
         _, keywords = self.qryr.question(query)
         vector_size = len(sres.query_vector)
         vector_column = f"q_{vector_size}_vec"
-        zero_vector = [0.0] * vector_size
-        ins_embd = []
-        for chunk_id in sres.ids:
-            vector = sres.field[chunk_id].get(vector_column, zero_vector)
-            if isinstance(vector, str):
-                vector = [get_float(v) for v in vector.split("\t")]
-            ins_embd.append(vector)
-        if not ins_embd:
+        if not sres.ids:
             return [], [], []
+        ins_embd = vector_matrix([sres.field[chunk_id].get(vector_column) for chunk_id in sres.ids], vector_size)
 
         for i in sres.ids:
             if isinstance(sres.field[i].get("important_kwd", []), str):
@@ -358,15 +373,22 @@ class Dealer:
     def retrieval(self, question, embd_mdl, tenant_ids, kb_ids, page, page_size, similarity_threshold=0.2,
                   vector_similarity_weight=0.3, top=1024, doc_ids=None, aggs=True,
                   rerank_mdl=None, highlight=False,
-                  rank_feature: dict | None = {PAGERANK_FLD: 10}):
+                  rank_feature: dict | None = {PAGERANK_FLD: 10},
+                  return_vector=True):
+        """
+        With `return_vector=False` the chunks come without their "vector", and the vectors are only
+        fetched from the doc store when ranking needs them.
+        """
         ranks = {"total": 0, "chunks": [], "doc_aggs": {}}
         if not question:
             return ranks
 
+        # ElasticSearch doesn't normalize each way score before fusion, so it's reranked here with the vectors.
+        rerank_by_vector = not rerank_mdl and os.getenv('DOC_ENGINE', 'elasticsearch') == "elasticsearch"
         # Ensure RERANK_LIMIT is multiple of page_size
         RERANK_LIMIT = math.ceil(64/page_size) * page_size if page_size>1 else 1
         req = {"kb_ids": kb_ids, "doc_ids": doc_ids, "page": math.ceil(page_size*page/RERANK_LIMIT), "size": RERANK_LIMIT,
-               "question": question, "vector": True, "topk": top,
+               "question": question, "vector": return_vector or rerank_by_vector, "topk": top,
                "similarity": similarity_threshold,
                "available_int": 1}
 
@@ -383,9 +405,7 @@ class Dealer:
                                                    vector_similarity_weight,
                                                    rank_feature=rank_feature)
         else:
-            lower_case_doc_engine = os.getenv('DOC_ENGINE', 'elasticsearch')
-            if lower_case_doc_engine == "elasticsearch":
-                # ElasticSearch doesn't normalize each way score before fusion.
+            if rerank_by_vector:
                 sim, tsim, vsim = self.rerank(
                     sres, question, 1 - vector_similarity_weight, vector_similarity_weight,
                     rank_feature=rank_feature)
@@ -437,10 +457,11 @@ class Dealer:
                 "similarity": sim[i],
                 "vector_similarity": vsim[i],
                 "term_similarity": tsim[i],
-                "vector": chunk.get(vector_column, zero_vector),
                 "positions": position_int,
                 "doc_type_kwd": chunk.get("doc_type_kwd", "")
             }
+            if return_vector:
+                d["vector"] = chunk.get(vector_column, zero_vector)
             if highlight and sres.highlight:
                 if id in sres.highlight:
                     d["highlight"] = remove_redundant_spaces(sres.highlight[id])
@@ -463,11 +484,13 @@ class Dealer:
         tbl = self.dataStore.sql(sql, fetch_size, format)
         return tbl
 
-    def chunk_list(self, doc_id: str, tenant_id: str,
-                   kb_ids: list[str], max_count=1024,
-                   offset=0,
-                   fields=["docnm_kwd", "content_with_weight", "img_id"],
-                   sort_by_position: bool = False):
+    def iter_chunks(self, doc_id: str, tenant_id: str, kb_ids: list[str],
+                    fields=["docnm_kwd", "content_with_weight", "img_id"],
+                    sort_by_position: bool = False, batch_size: int = 1024):
+        """
+        The chunks of a document, in lists of up to `batch_size` dicts of `fields` and "id". Chunks are
+        streamed from the doc store without offsets, so deep pages cost what the first does.
+        """
         condition = {"doc_id": doc_id}
 
         fields_set = set(fields or [])
@@ -483,17 +506,33 @@ class Dealer:
             orderBy.asc("position_int")
             orderBy.asc("top_int")
 
-        res = []
-        bs = 128
-        for p in range(offset, max_count, bs):
-            es_res = self.dataStore.search(fields, [], condition, [], orderBy, p, bs, index_name(tenant_id),
-                                           kb_ids)
-            dict_chunks = self.dataStore.getFields(es_res, fields)
+        for dict_chunks in self.dataStore.iterChunks(fields, condition, index_name(tenant_id), kb_ids, orderBy, batch_size):
             for id, doc in dict_chunks.items():
                 doc["id"] = id
-            if dict_chunks:
-                res.extend(dict_chunks.values())
-            if len(dict_chunks.values()) < bs:
+            yield list(dict_chunks.values())
+
+    def chunk_count(self, doc_id: str, tenant_id: str, kb_ids: list[str]) -> int:
+        res = self.dataStore.search(["id"], [], {"doc_id": doc_id}, [], OrderByExpr(), 0, 1, index_name(tenant_id), kb_ids)
+        return self.dataStore.getTotal(res)
+
+    def chunk_list(self, doc_id: str, tenant_id: str,
+                   kb_ids: list[str], max_count=1024,
+                   offset=0,
+                   fields=["docnm_kwd", "content_with_weight", "img_id"],
+                   sort_by_position: bool = False):
+        """The chunks of a document from the `offset`-th up to the `max_count`-th."""
+        res = []
+        count = max_count - offset
+        if count <= 0:
+            return res
+        skipped = 0
+        for batch in self.iter_chunks(doc_id, tenant_id, kb_ids, fields, sort_by_position, min(max_count, 1024)):
+            if skipped < offset:
+                skip = min(offset - skipped, len(batch))
+                skipped += skip
+                batch = batch[skip:]
+            res.extend(batch[:count - len(res)])
+            if len(res) >= count:
                 break
         return res
 
@@ -509,18 +548,30 @@ class Dealer:
         total = np.sum([c for _, c in res])
         return {t: (c + 1) / (total + S) for t, c in res}
 
-    def tag_content(self, tenant_id: str, kb_ids: list[str], doc, all_tags, topn_tags=3, keywords_topn=30, S=1000):
-        idx_nm = index_name(tenant_id)
-        match_txt = self.qryr.paragraph(doc["title_tks"] + " " + doc["content_ltks"], doc.get("important_kwd", []), keywords_topn)
-        res = self.dataStore.search([], [], {}, [match_txt], OrderByExpr(), 0, 0, idx_nm, kb_ids, ["tag_kwd"])
-        aggs = self.dataStore.getAggregation(res, "tag_kwd")
-        if not aggs:
-            return False
+    @staticmethod
+    def _tag_features(aggs, all_tags, topn_tags, S):
         cnt = np.sum([c for _, c in aggs])
-        tag_fea = sorted([(a, round(0.1*(c + 1) / (cnt + S) / max(1e-6, all_tags.get(a, 0.0001)))) for a, c in aggs],
-                         key=lambda x: x[1] * -1)[:topn_tags]
-        doc[TAG_FLD] = {a.replace(".", "_"): c for a, c in tag_fea if c > 0}
-        return True
+        return sorted([(a, round(0.1*(c + 1) / (cnt + S) / max(1e-6, all_tags.get(a, 0.0001)))) for a, c in aggs],
+                      key=lambda x: x[1] * -1)[:topn_tags]
+
+    def tag_content(self, tenant_id: str, kb_ids: list[str], doc, all_tags, topn_tags=3, keywords_topn=30, S=1000):
+        return self.tag_content_many(tenant_id, kb_ids, [doc], all_tags, topn_tags, keywords_topn, S)[0]
+
+    def tag_content_many(self, tenant_id: str, kb_ids: list[str], docs: list[dict], all_tags, topn_tags=3, keywords_topn=30, S=1000) -> list[bool]:
+        """
+        Tags `docs` from the tags of the chunks similar to each of them, with one aggregation
+        request per batch of docs instead of one per doc. Returns whether each doc got tags.
+        """
+        match_txts = [self.qryr.paragraph(d["title_tks"] + " " + d["content_ltks"], d.get("important_kwd", []), keywords_topn) for d in docs]
+        tagged = []
+        for d, aggs in zip(docs, self.dataStore.aggregateMany(match_txts, index_name(tenant_id), kb_ids, "tag_kwd")):
+            if not aggs:
+                tagged.append(False)
+                continue
+            tag_fea = self._tag_features(aggs, all_tags, topn_tags, S)
+            set_tag_features(d, {a.replace(".", "_"): c for a, c in tag_fea if c > 0})
+            tagged.append(True)
+        return tagged
 
     def tag_query(self, question: str, tenant_ids: str | list[str], kb_ids: list[str], all_tags, topn_tags=3, S=1000):
         if isinstance(tenant_ids, str):
@@ -532,9 +583,7 @@ class Dealer:
         aggs = self.dataStore.getAggregation(res, "tag_kwd")
         if not aggs:
             return {}
-        cnt = np.sum([c for _, c in aggs])
-        tag_fea = sorted([(a, round(0.1*(c + 1) / (cnt + S) / max(1e-6, all_tags.get(a, 0.0001)))) for a, c in aggs],
-                         key=lambda x: x[1] * -1)[:topn_tags]
+        tag_fea = self._tag_features(aggs, all_tags, topn_tags, S)
         return {a.replace(".", "_"): max(1, c) for a, c in tag_fea}
 
     def retrieval_by_toc(self, query:str, chunks:list[dict], tenant_ids:list[str], chat_mdl, topn: int=6):
@@ -139,11 +139,14 @@ def kb_prompt(kbinfos, max_tokens, hash_id=False):
 CITATION_PROMPT_TEMPLATE = load_prompt("citation_prompt")
 CITATION_PLUS_TEMPLATE = load_prompt("citation_plus")
 CONTENT_TAGGING_PROMPT_TEMPLATE = load_prompt("content_tagging_prompt")
+CONTENT_TAGGING_BATCH_PROMPT_TEMPLATE = load_prompt("content_tagging_batch_prompt")
 CROSS_LANGUAGES_SYS_PROMPT_TEMPLATE = load_prompt("cross_languages_sys_prompt")
 CROSS_LANGUAGES_USER_PROMPT_TEMPLATE = load_prompt("cross_languages_user_prompt")
 FULL_QUESTION_PROMPT_TEMPLATE = load_prompt("full_question_prompt")
 KEYWORD_PROMPT_TEMPLATE = load_prompt("keyword_prompt")
+KEYWORD_BATCH_PROMPT_TEMPLATE = load_prompt("keyword_batch_prompt")
 QUESTION_PROMPT_TEMPLATE = load_prompt("question_prompt")
+QUESTION_BATCH_PROMPT_TEMPLATE = load_prompt("question_batch_prompt")
 VISION_LLM_DESCRIBE_PROMPT = load_prompt("vision_llm_describe_prompt")
 VISION_LLM_FIGURE_DESCRIBE_PROMPT = load_prompt("vision_llm_figure_describe_prompt")
 STRUCTURED_OUTPUT_PROMPT = load_prompt("structured_output_prompt")
@@ -200,6 +203,53 @@ def question_proposal(chat_mdl, content, topn=3):
     return kwd
 
 
+def _chat_many(chat_mdl, rendered_prompt, n, gen_conf):
+    """The answers of a prompt over `n` numbered contents, None for the contents it gave no answer for."""
+    msg = [{"role": "system", "content": rendered_prompt}, {"role": "user", "content": "Output: "}]
+    ans = chat_mdl.chat(rendered_prompt, msg[1:], gen_conf)
+    if isinstance(ans, tuple):
+        ans = ans[0]
+    ans = re.sub(r"(^.*</think>|```json\n|```\n*$)", "", ans, flags=re.DOTALL)
+    if ans.find("**ERROR**") >= 0:
+        logging.warning(f"Batched chat over {n} contents failed: {ans}")
+        return [None] * n
+    try:
+        obj = json_repair.loads(ans)
+    except Exception:
+        logging.warning(f"Batched chat over {n} contents got no JSON: {ans}")
+        return [None] * n
+    if not isinstance(obj, dict):
+        logging.warning(f"Batched chat over {n} contents got no JSON object: {ans}")
+        return [None] * n
+    return [obj.get(str(i + 1)) for i in range(n)]
+
+
+def _join_many(answers, sep):
+    res = []
+    for ans in answers:
+        if isinstance(ans, str):
+            ans = ans.split(sep)
+        if isinstance(ans, list):
+            res.append(sep.join(str(a).strip() for a in ans if str(a).strip()))
+        else:
+            res.append(None)
+    return res
+
+
+def keyword_extraction_many(chat_mdl, contents: list[str], topn=3) -> list:
+    """`keyword_extraction` of several contents in one chat. None for the contents the answer misses."""
+    template = PROMPT_JINJA_ENV.from_string(KEYWORD_BATCH_PROMPT_TEMPLATE)
+    rendered_prompt = template.render(contents=contents, topn=topn)
+    return _join_many(_chat_many(chat_mdl, rendered_prompt, len(contents), {"temperature": 0.2}), ",")
+
+
+def question_proposal_many(chat_mdl, contents: list[str], topn=3) -> list:
+    """`question_proposal` of several contents in one chat. None for the contents the answer misses."""
+    template = PROMPT_JINJA_ENV.from_string(QUESTION_BATCH_PROMPT_TEMPLATE)
+    rendered_prompt = template.render(contents=contents, topn=topn)
+    return _join_many(_chat_many(chat_mdl, rendered_prompt, len(contents), {"temperature": 0.2}), "\n")
+
+
 def full_question(tenant_id=None, llm_id=None, messages=[], language=None, chat_mdl=None):
     from api.db import LLMType
     from api.db.services.llm_service import LLMBundle
@@ -296,6 +346,35 @@ def content_tagging(chat_mdl, content, all_tags, examples, topn=3):
     return res
 
 
+def content_tagging_many(chat_mdl, contents: list[str], all_tags, examples, topn=3) -> list:
+    """`content_tagging` of several contents in one chat. None for the contents the answer misses."""
+    template = PROMPT_JINJA_ENV.from_string(CONTENT_TAGGING_BATCH_PROMPT_TEMPLATE)
+
+    for ex in examples:
+        ex["tags_json"] = json.dumps(ex[TAG_FLD], indent=2, ensure_ascii=False)
+
+    rendered_prompt = template.render(
+        topn=topn,
+        all_tags=all_tags,
+        examples=examples,
+        contents=contents,
+    )
+    res = []
+    for obj in _chat_many(chat_mdl, rendered_prompt, len(contents), {"temperature": 0.5}):
+        if not isinstance(obj, dict):
+            res.append(None)
+            continue
+        tags = {}
+        for k, v in obj.items():
+            try:
+                if int(v) > 0:
+                    tags[str(k)] = int(v)
+            except Exception:
+                pass
+        res.append(tags)
+    return res
+
+
 def vision_llm_describe_prompt(page=None) -> str:
     template = PROMPT_JINJA_ENV.from_string(VISION_LLM_DESCRIBE_PROMPT)
 
@@ -457,7 +536,7 @@ def gen_json(system_prompt:str, user_prompt:str, chat_mdl, gen_conf = None):
     ans = re.sub(r"(^.*</think>|```json\n|```\n*$)", "", ans, flags=re.DOTALL)
     try:
         res = json_repair.loads(ans)
-        set_llm_cache(chat_mdl.llm_name, system_prompt, ans, user_prompt, gen_conf)
+        set_llm_cache(chat_mdl.llm_name, system_prompt, ans, user_prompt, gen_conf, "extraction")
         return res
     except Exception:
         logging.exception(f"Loading json failure: {ans}")
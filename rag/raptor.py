@@ -14,22 +14,39 @@
 #  limitations under the License.
 #
 import logging
+import os
 import re
 import umap
 import numpy as np
+from joblib import Parallel, delayed
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import PCA
 from sklearn.mixture import GaussianMixture
 import trio
 
 from common.connection_utils import timeout
 from graphrag.utils import (
     get_llm_cache,
-    get_embed_cache,
-    set_embed_cache,
+    get_embed_cache_many,
+    set_embed_cache_many,
     set_llm_cache,
     chat_limiter,
 )
 from common.token_utils import truncate
 
+# Threads fitting the Gaussian mixtures of the cluster count search.
+RAPTOR_BIC_JOBS = int(os.environ.get("RAPTOR_BIC_JOBS", "1"))
+# Layers of more chunks are reduced with PCA and clustered with mini-batch k-means, 0 never.
+RAPTOR_LARGE_LAYER = int(os.environ.get("RAPTOR_LARGE_LAYER", "5000"))
+# Chunks of a large layer the cluster count is searched on.
+RAPTOR_BIC_SAMPLE = int(os.environ.get("RAPTOR_BIC_SAMPLE", "2000"))
+
+
+def _bic(embeddings: np.ndarray, n_components: int, random_state: int) -> float:
+    gm = GaussianMixture(n_components=n_components, random_state=random_state)
+    gm.fit(embeddings)
+    return gm.bic(embeddings)
+
 
 class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
     def __init__(
@@ -57,34 +74,61 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
         if response.find("**ERROR**") >= 0:
             raise Exception(response)
         await trio.to_thread.run_sync(
-            lambda: set_llm_cache(self._llm_model.llm_name, system, response, history, gen_conf)
+            lambda: set_llm_cache(self._llm_model.llm_name, system, response, history, gen_conf, "extraction")
         )
         return response
 
-    @timeout(20)
-    async def _embedding_encode(self, txt):
-        response = await trio.to_thread.run_sync(
-            lambda: get_embed_cache(self._embd_model.llm_name, txt)
+    @timeout(60*5)
+    async def _embedding_encode_many(self, txts):
+        embds = await trio.to_thread.run_sync(
+            lambda: get_embed_cache_many(self._embd_model.llm_name, txts)
         )
-        if response is not None:
-            return response
-        embds, _ = await trio.to_thread.run_sync(lambda: self._embd_model.encode([txt]))
-        if len(embds) < 1 or len(embds[0]) < 1:
+        missing = [i for i, e in enumerate(embds) if e is None]
+        if not missing:
+            return embds
+        encoded, _ = await trio.to_thread.run_sync(lambda: self._embd_model.encode([txts[i] for i in missing]))
+        if len(encoded) != len(missing) or any(len(e) < 1 for e in encoded):
             raise Exception("Embedding error: ")
-        embds = embds[0]
-        await trio.to_thread.run_sync(lambda: set_embed_cache(self._embd_model.llm_name, txt, embds))
+        for i, e in zip(missing, encoded):
+            embds[i] = e
+        await trio.to_thread.run_sync(
+            lambda: set_embed_cache_many(self._embd_model.llm_name, {txts[i]: embds[i] for i in missing})
+        )
         return embds
 
     def _get_optimal_clusters(self, embeddings: np.ndarray, random_state: int):
+        """
+        The number of components, below max_cluster, of the Gaussian mixture with the lowest BIC. BIC is
+        computed every sqrt(max_cluster) components first, then only around the best of those.
+        """
         max_clusters = min(self._max_cluster, len(embeddings))
-        n_clusters = np.arange(1, max_clusters)
-        bics = []
-        for n in n_clusters:
-            gm = GaussianMixture(n_components=n, random_state=random_state)
-            gm.fit(embeddings)
-            bics.append(gm.bic(embeddings))
-        optimal_clusters = n_clusters[np.argmin(bics)]
-        return optimal_clusters
+        n_clusters = list(range(1, max_clusters))
+        if len(n_clusters) <= 1:
+            return 1
+        bics = {}
+
+        def fit(ns):
+            ns = [n for n in ns if n not in bics]
+            res = Parallel(n_jobs=RAPTOR_BIC_JOBS, prefer="threads")(delayed(_bic)(embeddings, n, random_state) for n in ns)
+            bics.update(zip(ns, res))
+
+        step = max(1, int(len(n_clusters) ** 0.5))
+        fit(n_clusters[::step] + [n_clusters[-1]])
+        best = min(bics, key=lambda n: (bics[n], n))
+        fit(range(max(1, best - step + 1), min(max_clusters, best + step)))
+        return min(bics, key=lambda n: (bics[n], n))
+
+    def _cluster_large_layer(self, embeddings: np.ndarray, random_state: int):
+        """Labels of a layer too large for UMAP and Gaussian mixtures: PCA, then mini-batch k-means."""
+        reduced = PCA(n_components=min(12, len(embeddings) - 2), random_state=random_state).fit_transform(embeddings)
+        sample = reduced
+        if len(reduced) > RAPTOR_BIC_SAMPLE:
+            sample = reduced[np.random.default_rng(random_state).choice(len(reduced), RAPTOR_BIC_SAMPLE, replace=False)]
+        n_clusters = self._get_optimal_clusters(sample, random_state)
+        if n_clusters == 1:
+            return [0 for _ in range(len(reduced))]
+        km = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, batch_size=1024, n_init=3)
+        return km.fit_predict(reduced).tolist()
 
     async def __call__(self, chunks, random_state, callback=None):
         if len(chunks) <= 1:
@@ -122,14 +166,19 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
                     cnt,
                 )
                 logging.debug(f"SUM: {cnt}")
-                embds = await self._embedding_encode(cnt)
-                chunks.append((cnt, embds))
+                chunks.append((cnt, None))
+
+        async def embed_summaries():
+            embds = await self._embedding_encode_many([cnt for cnt, _ in chunks[end:]])
+            for i, embd in enumerate(embds):
+                chunks[end + i] = (chunks[end + i][0], embd)
 
         labels = []
         while end - start > 1:
             embeddings = [embd for _, embd in chunks[start:end]]
             if len(embeddings) == 2:
                 await summarize([start, start + 1])
+                await embed_summaries()
                 if callback:
                     callback(
                         msg="Cluster one layer: {} -> {}".format(
@@ -142,27 +191,35 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
                 end = len(chunks)
                 continue
 
-            n_neighbors = int((len(embeddings) - 1) ** 0.8)
-            reduced_embeddings = umap.UMAP(
-                n_neighbors=max(2, n_neighbors),
-                n_components=min(12, len(embeddings) - 2),
-                metric="cosine",
-            ).fit_transform(embeddings)
-            n_clusters = self._get_optimal_clusters(reduced_embeddings, random_state)
-            if n_clusters == 1:
-                lbls = [0 for _ in range(len(reduced_embeddings))]
+            if RAPTOR_LARGE_LAYER and len(embeddings) > RAPTOR_LARGE_LAYER:
+                lbls = await trio.to_thread.run_sync(lambda: self._cluster_large_layer(np.array(embeddings), random_state))
             else:
-                gm = GaussianMixture(n_components=n_clusters, random_state=random_state)
-                gm.fit(reduced_embeddings)
-                probs = gm.predict_proba(reduced_embeddings)
-                lbls = [np.where(prob > self._threshold)[0] for prob in probs]
-                lbls = [lbl[0] if isinstance(lbl, np.ndarray) else lbl for lbl in lbls]
+                n_neighbors = int((len(embeddings) - 1) ** 0.8)
+                reduced_embeddings = umap.UMAP(
+                    n_neighbors=max(2, n_neighbors),
+                    n_components=min(12, len(embeddings) - 2),
+                    metric="cosine",
+                ).fit_transform(embeddings)
+                n_clusters = self._get_optimal_clusters(reduced_embeddings, random_state)
+                if n_clusters == 1:
+                    lbls = [0 for _ in range(len(reduced_embeddings))]
+                else:
+                    gm = GaussianMixture(n_components=n_clusters, random_state=random_state)
+                    gm.fit(reduced_embeddings)
+                    probs = gm.predict_proba(reduced_embeddings)
+                    lbls = [np.where(prob > self._threshold)[0] for prob in probs]
+                    lbls = [lbl[0] if isinstance(lbl, np.ndarray) else lbl for lbl in lbls]
+            # Clusters nothing was assigned to are dropped.
+            _, lbls = np.unique(lbls, return_inverse=True)
+            lbls = lbls.tolist()
+            n_clusters = max(lbls) + 1
 
             async with trio.open_nursery() as nursery:
                 for c in range(n_clusters):
                     ck_idx = [i + start for i in range(len(lbls)) if lbls[i] == c]
                     assert len(ck_idx) > 0
                     nursery.start_soon(summarize, ck_idx)
+            await embed_summaries()
 
             assert len(chunks) - end == n_clusters, "{} vs. {}".format(
                 len(chunks) - end, n_clusters
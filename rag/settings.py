@@ -17,7 +17,7 @@ import os
 import logging
 from common.config_utils import get_base_config, decrypt_database_config
 from common.file_utils import get_project_base_directory
-from common.misc_utils import pip_install_torch
+from common.misc_utils import once, pip_install_torch
 
 # Server
 RAG_CONF_PATH = os.path.join(get_project_base_directory(), "conf")
@@ -59,21 +59,37 @@ except Exception:
     except Exception:
         REDIS = {}
 DOC_MAXIMUM_SIZE = int(os.environ.get("MAX_CONTENT_LENGTH", 128 * 1024 * 1024))
-DOC_BULK_SIZE = int(os.environ.get("DOC_BULK_SIZE", 4))
+# A bulk insert is cut at DOC_BULK_SIZE chunks or DOC_BULK_MAX_BYTES of payload, whichever comes first.
+DOC_BULK_SIZE = int(os.environ.get("DOC_BULK_SIZE", 512))
+DOC_BULK_MAX_BYTES = int(os.environ.get("DOC_BULK_MAX_BYTES", 8 * 1024 * 1024))
 EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 16))
 SVR_QUEUE_NAME = "rag_flow_svr_queue"
 SVR_CONSUMER_GROUP_NAME = "rag_flow_svr_task_broker"
 PAGERANK_FLD = "pagerank_fea"
 TAG_FLD = "tag_feas"
+# L2 norm of a chunk's TAG_FLD features, so that retrieval scores tags with a sparse dot product.
+TAG_NORM_FLD = "tag_norm_flt"
+
+
+@once
+def get_parallel_devices() -> int:
+    # Probing for GPUs imports torch, which is left to the first caller rather than to whoever imports settings.
+    try:
+        pip_install_torch()
+        import torch.cuda
+        devices = torch.cuda.device_count()
+        logging.info(f"found {devices} gpus")
+        return devices
+    except Exception:
+        logging.info("can't import package 'torch'")
+        return 0
+
+
+def __getattr__(name):
+    if name == "PARALLEL_DEVICES":
+        return get_parallel_devices()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-PARALLEL_DEVICES = 0
-try:
-    pip_install_torch()
-    import torch.cuda
-    PARALLEL_DEVICES = torch.cuda.device_count()
-    logging.info(f"found {PARALLEL_DEVICES} gpus")
-except Exception:
-    logging.info("can't import package 'torch'")
 
 def print_rag_settings():
     logging.info(f"MAX_CONTENT_LENGTH: {DOC_MAXIMUM_SIZE}")
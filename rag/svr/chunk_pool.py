@@ -0,0 +1,224 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Runs the `chunk` function of the parser modules in worker processes, so that a single task executor can
+parse documents on all the cores of a node instead of one GIL.
+
+Workers are spawned on first use and reused, so the parser modules they imported and the models those
+loaded stay warm between tasks. A document reaches its worker through a temporary file rather than the
+pool's pipe, progress comes back over a queue and is relayed to the task's callback, and the images of
+the chunks come back JPEG encoded, the form they are stored in. A worker stops chunking at the first
+progress it reports once the task is canceled.
+"""
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from io import BytesIO
+
+import trio
+
+# 0 chunks in threads of the task executor.
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", "0"))
+# Tasks after which a worker is replaced by a fresh one, 0 never. Needs Python 3.11.
+CHUNK_WORKER_MAX_TASKS = int(os.environ.get("CHUNK_WORKER_MAX_TASKS", "0"))
+# Parser modules imported when a worker starts.
+CHUNK_WORKER_PRELOAD = [m.strip() for m in os.environ.get("CHUNK_WORKER_PRELOAD", "rag.app.naive").split(",") if m.strip()]
+
+_progress_queue = None
+
+
+def _init_worker(progress_queue, log_name, preload, setup):
+    global _progress_queue
+    _progress_queue = progress_queue
+    # Interrupts are for the task executor, it shuts the pool down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if setup:
+        from common.log_utils import init_root_logger
+        init_root_logger(log_name)
+        from api import settings
+        settings.init_settings()
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            logging.exception(f"Chunk worker can't preload {name}")
+
+
+class _ChunkingCanceled(Exception):
+    pass
+
+
+def _report_progress(job_id, task_id, prog=None, msg="Processing..."):
+    if task_id:
+        from api.db.services.task_service import has_canceled
+        if has_canceled(task_id):
+            raise _ChunkingCanceled(task_id)
+    _progress_queue.put((job_id, prog, msg, False))
+
+
+def _encode_images(chunks):
+    for ck in chunks:
+        img = ck.get("image")
+        if not img or isinstance(img, bytes):
+            continue
+        if img.mode in ("RGBA", "P"):
+            img = img.convert("RGB")
+        with BytesIO() as output_buffer:
+            try:
+                img.save(output_buffer, format="JPEG")
+            except OSError as e:
+                logging.warning("Saving image exception, ignore: {}".format(str(e)))
+                continue
+            ck["image"] = output_buffer.getvalue()
+    return chunks
+
+
+def _chunk(job_id, task_id, module_name, filename, path, kwargs):
+    try:
+        with open(path, "rb") as f:
+            binary = f.read()
+        chunker = importlib.import_module(module_name)
+        cks = chunker.chunk(filename, binary=binary, callback=partial(_report_progress, job_id, task_id), **kwargs)
+        return _encode_images(list(cks))
+    finally:
+        _progress_queue.put((job_id, None, None, True))
+
+
+def _set_soon(token, event):
+    try:
+        token.run_sync_soon(event.set)
+    except trio.RunFinishedError:
+        pass
+
+
+class ChunkPool:
+    def __init__(self, workers: int, log_name: str, canceled_exception: type[Exception],
+                 preload: list[str] | None = None, setup: bool = True):
+        self._workers = workers
+        self._log_name = log_name
+        self._preload = CHUNK_WORKER_PRELOAD if preload is None else preload
+        # Whether workers set up the logging and settings of RAGFlow, only parsers needing neither go without.
+        self._setup = setup
+        # Raised by the progress callbacks once their task is canceled, and by `chunk` then.
+        self._canceled_exception = canceled_exception
+        self._ctx = multiprocessing.get_context("spawn")
+        self._progress = self._ctx.Queue()
+        self._callbacks = {}
+        self._canceled = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        threading.Thread(target=self._relay_progress, name="chunk_progress", daemon=True).start()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                kwargs = {}
+                if CHUNK_WORKER_MAX_TASKS > 0 and sys.version_info >= (3, 11):
+                    kwargs["max_tasks_per_child"] = CHUNK_WORKER_MAX_TASKS
+                self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=self._ctx,
+                                                     initializer=_init_worker,
+                                                     initargs=(self._progress, self._log_name, self._preload, self._setup),
+                                                     **kwargs)
+                logging.info(f"Chunking in {self._workers} worker processes")
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _relay_progress(self):
+        while True:
+            job_id, prog, msg, last = self._progress.get()
+            if last:
+                self._callbacks.pop(job_id, None)
+                continue
+            entry = self._callbacks.get(job_id)
+            if entry is None:
+                continue
+            callback, wake = entry
+            try:
+                callback(prog=prog, msg=msg)
+            except self._canceled_exception:
+                # The rest of its progress is dropped, and its task stops waiting for the worker.
+                self._callbacks.pop(job_id, None)
+                self._canceled.add(job_id)
+                wake()
+            except Exception:
+                logging.exception(f"Relaying chunking progress {prog} {msg} got exception")
+
+    async def chunk(self, module_name: str, filename: str, binary: bytes, callback, task_id: str | None = None,
+                    **kwargs) -> list[dict]:
+        """
+        `chunk(filename, binary=binary, callback=callback, **kwargs)` of the parser module `module_name`, in a worker.
+        A worker that dies, e.g. killed for its memory, fails the tasks it was running and the pool is rebuilt.
+        Cancelling doesn't interrupt a task a worker has started, its result is dropped. Once the task `task_id` is
+        canceled, or `callback` raises the canceled exception, the pool's canceled exception is raised.
+        """
+        job_id = uuid.uuid4().hex
+        fd, path = tempfile.mkstemp(prefix="ragflow_chunk_")
+        fut = None
+        try:
+            with os.fdopen(fd, "wb") as f:
+                await trio.to_thread.run_sync(f.write, binary)
+            token = trio.lowlevel.current_trio_token()
+            done = trio.Event()
+            self._callbacks[job_id] = (callback, partial(_set_soon, token, done))
+            executor = self._pool()
+            fut = executor.submit(_chunk, job_id, task_id, module_name, filename, path, kwargs)
+            fut.add_done_callback(lambda _: _set_soon(token, done))
+            try:
+                await done.wait()
+            finally:
+                if not fut.done():
+                    fut.cancel()
+            if job_id in self._canceled:
+                raise self._canceled_exception(f"Chunking {filename} canceled")
+            try:
+                return fut.result()
+            except _ChunkingCanceled:
+                raise self._canceled_exception(f"Chunking {filename} canceled")
+            except BrokenProcessPool:
+                logging.error(f"A chunk worker died while chunking {filename}, restarting the pool")
+                self._callbacks.pop(job_id, None)
+                self._reset(executor)
+                raise
+        finally:
+            # Otherwise the worker's last message drops the callback, after the progress sent before it.
+            if fut is None or fut.cancelled():
+                self._callbacks.pop(job_id, None)
+            self._canceled.discard(job_id)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
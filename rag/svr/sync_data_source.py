@@ -19,10 +19,15 @@
 # beartype_all(conf=BeartypeConf(violation_type=UserWarning))    # <-- emit warnings from all code
 
 
+import heapq
+import json
 import sys
 import threading
 import time
 import traceback
+from contextlib import asynccontextmanager
+
+import xxhash
 
 from api.db.services.connector_service import SyncLogsService
 from api.db.services.knowledgebase_service import KnowledgebaseService
@@ -40,10 +45,62 @@ from api.db import FileSource, TaskStatus
 from api import settings
 from api.versions import get_ragflow_version
 from common.data_source.confluence_connector import ConfluenceConnector
-from common.data_source.utils import load_all_docs_from_checkpoint_connector
+from common.data_source.utils import iter_doc_batches_from_checkpoint_connector
+from rag.utils.redis_conn import REDIS_CONN
 
 MAX_CONCURRENT_TASKS = int(os.environ.get('MAX_CONCURRENT_TASKS', "5"))
 task_limiter = trio.Semaphore(MAX_CONCURRENT_TASKS)
+# Batches a connector may fetch ahead of the ones being stored.
+SYNC_PREFETCH = int(os.environ.get("SYNC_PREFETCH", "2"))
+# Blobs of a connector run put in the storage at the same time.
+SYNC_STORE_CONCURRENCY = int(os.environ.get("SYNC_STORE_CONCURRENCY", "4"))
+# Stored documents added to the KB, and counted in the sync log, at a time.
+SYNC_DB_BATCH = int(os.environ.get("SYNC_DB_BATCH", "64"))
+# How often the scheduled sync tasks are listed again, for the ones added or changed by others.
+SYNC_RESCAN_INTERVAL = int(os.environ.get("SYNC_RESCAN_INTERVAL", "30"))
+# How long the checkpoint of an interrupted sync is kept to resume from.
+SYNC_CHECKPOINT_TTL = int(os.environ.get("SYNC_CHECKPOINT_TTL", str(7 * 24 * 3600)))
+# How long the version of a synchronized document is remembered, to skip it while unchanged.
+SYNC_VERSION_TTL = int(os.environ.get("SYNC_VERSION_TTL", str(90 * 24 * 3600)))
+
+
+@asynccontextmanager
+async def iterate_in_thread(generator, prefetch: int = SYNC_PREFETCH):
+    """
+    Run a blocking generator in a thread of its own, at most `prefetch` items ahead of the receive
+    channel it yields. Its exception, if any, is raised once the items before it are received. Leaving
+    early stops the generator at its next item, without waiting for it.
+    """
+    send_channel, receive_channel = trio.open_memory_channel(prefetch)
+    token = trio.lowlevel.current_trio_token()
+    error = []
+
+    def produce():
+        try:
+            for item in generator:
+                trio.from_thread.run(send_channel.send, item, trio_token=token)
+        except (trio.BrokenResourceError, trio.ClosedResourceError, trio.RunFinishedError):
+            pass
+        except BaseException as e:
+            error.append(e)
+        finally:
+            close = getattr(generator, "close", None)
+            if close is not None:
+                close()
+            try:
+                trio.from_thread.run_sync(send_channel.close, trio_token=token)
+            except trio.RunFinishedError:
+                pass
+
+    async def receive():
+        async for item in receive_channel:
+            yield item
+        if error:
+            raise error[0]
+
+    trio.lowlevel.start_thread_soon(produce, lambda _: None)
+    async with receive_channel:
+        yield receive()
 
 
 class SyncBase:
@@ -68,6 +125,118 @@ class SyncBase:
     async def _run(self, task: dict):
         raise NotImplementedError
 
+    @staticmethod
+    def _checkpoint_key(task: dict) -> str:
+        return f"sync_checkpoint:{task['connector_id']}:{task['kb_id']}"
+
+    def _load_checkpoint(self, task: dict, connector, start: float):
+        """The checkpoint an interrupted sync of the same poll window left, None to start over."""
+        saved = REDIS_CONN.get(self._checkpoint_key(task))
+        if not saved:
+            return None
+        try:
+            saved = json.loads(saved)
+            if saved["start"] == start:
+                return connector.validate_checkpoint_json(saved["checkpoint"])
+        except Exception:
+            logging.exception(f"Can't resume the sync of connector {task['connector_id']} from its checkpoint")
+        return None
+
+    def _save_checkpoint(self, task: dict, start: float, checkpoint):
+        REDIS_CONN.set(self._checkpoint_key(task), json.dumps({"start": start, "checkpoint": checkpoint.model_dump_json()}),
+                       SYNC_CHECKPOINT_TTL)
+
+    def _clear_checkpoint(self, task: dict):
+        REDIS_CONN.delete(self._checkpoint_key(task))
+
+    @staticmethod
+    def _version_key(task: dict, doc_id: str) -> str:
+        return f"sync_version:{task['connector_id']}:{task['kb_id']}:{xxhash.xxh64(doc_id.encode('utf-8')).hexdigest()}"
+
+    def _known_version(self, task: dict, doc_id: str) -> str | None:
+        """The `Document.version` the document was last added to the KB with."""
+        return REDIS_CONN.get(self._version_key(task, doc_id))
+
+    async def _sync(self, task: dict, document_batches, source: str, save_checkpoint=None) -> datetime:
+        """
+        Add the documents of `document_batches`, a blocking generator of document lists, to the KB of the task.
+        The blobs are put in the storage as the batches come, the documents are added and counted in the
+        sync log SYNC_DB_BATCH at a time. Returns the latest update time seen, to poll from next time.
+
+        With `save_checkpoint`, `document_batches` yields `(documents, checkpoint)` pairs and the latest
+        checkpoint is passed to it once the documents before it are in the KB. The versions of the documents
+        added are remembered, see `_known_version`.
+        """
+        next_update = datetime(1970, 1, 1, tzinfo=timezone.utc)
+        if task["poll_range_start"]:
+            next_update = task["poll_range_start"]
+        e, kb = KnowledgebaseService.get_by_id(task["kb_id"])
+        if not e:
+            raise LookupError(f"Knowledgebase {task['kb_id']} not found")
+        src = f"{source}/{task['connector_id']}"
+        store_limiter = trio.CapacityLimiter(SYNC_STORE_CONCURRENCY)
+        stored, errs, versions = [], [], {}
+        pending = {"count": 0, "min_update": None, "max_update": None, "checkpoint": None}
+        doc_num = 0
+
+        async def store(doc):
+            version = doc.version
+            doc = {
+                "id": doc.id,
+                "connector_id": task["connector_id"],
+                "source": source,
+                "semantic_identifier": doc.semantic_identifier,
+                "extension": doc.extension,
+                "size_bytes": doc.size_bytes,
+                "doc_updated_at": doc.doc_updated_at,
+                "blob": doc.blob
+            }
+            try:
+                s = await trio.to_thread.run_sync(SyncLogsService.store_document, kb, doc, limiter=store_limiter)
+            except Exception as e:
+                errs.append(doc["semantic_identifier"] + f".{doc['extension']}: " + str(e))
+                return
+            stored.append(s)
+            if version:
+                versions[s["id"]] = (doc["id"], version)
+
+        async def flush():
+            if pending["count"]:
+                batch, stored[:] = stored[:], []
+                err, dids = await trio.to_thread.run_sync(SyncLogsService.insert_documents, kb, batch, task["tenant_id"], src)
+                err = errs + err
+                SyncLogsService.increase_docs(task["id"], pending["min_update"], pending["max_update"], pending["count"],
+                                              "\n".join(err), len(err))
+                added = {self._version_key(task, versions[did][0]): versions[did][1] for did in dids if did in versions}
+                if added:
+                    REDIS_CONN.mset_with_ttl(added, SYNC_VERSION_TTL)
+                errs.clear()
+                versions.clear()
+            if pending["checkpoint"] is not None:
+                save_checkpoint(pending["checkpoint"])
+            pending.update(count=0, min_update=None, max_update=None, checkpoint=None)
+
+        async with iterate_in_thread(document_batches) as batches:
+            async for document_batch in batches:
+                if save_checkpoint is not None:
+                    document_batch, pending["checkpoint"] = document_batch
+                async with trio.open_nursery() as nursery:
+                    for doc in document_batch:
+                        nursery.start_soon(store, doc)
+                for doc in document_batch:
+                    updated_at = doc.doc_updated_at if doc.doc_updated_at else next_update
+                    next_update = max(next_update, updated_at)
+                    pending["min_update"] = min(pending["min_update"] or updated_at, updated_at)
+                    pending["max_update"] = max(pending["max_update"] or updated_at, updated_at)
+                pending["count"] += len(document_batch)
+                doc_num += len(document_batch)
+                del document_batch
+                if pending["count"] >= SYNC_DB_BATCH:
+                    await flush()
+        await flush()
+        task["doc_num"] = doc_num
+        return next_update
+
 
 class S3(SyncBase):
     async def _run(self, task: dict):
@@ -85,31 +254,8 @@ class S3(SyncBase):
                                                                   self.conf["bucket_name"],
                                                                   begin_info
                                                                   ))
-        doc_num = 0
-        next_update = datetime(1970, 1, 1, tzinfo=timezone.utc)
-        if task["poll_range_start"]:
-            next_update = task["poll_range_start"]
-        for document_batch in document_batch_generator:
-            min_update = min([doc.doc_updated_at for doc in document_batch])
-            max_update = max([doc.doc_updated_at for doc in document_batch])
-            next_update = max([next_update, max_update])
-            docs = [{
-                    "id": doc.id,
-                    "connector_id": task["connector_id"],
-                    "source": FileSource.S3,
-                    "semantic_identifier": doc.semantic_identifier,
-                    "extension": doc.extension,
-                    "size_bytes": doc.size_bytes,
-                    "doc_updated_at": doc.doc_updated_at,
-                    "blob": doc.blob
-                } for doc in document_batch]
-
-            e, kb = KnowledgebaseService.get_by_id(task["kb_id"])
-            err, dids = SyncLogsService.duplicate_and_parse(kb, docs, task["tenant_id"], f"{FileSource.S3}/{task['connector_id']}")
-            SyncLogsService.increase_docs(task["id"], min_update, max_update, len(docs), "\n".join(err), len(err))
-            doc_num += len(docs)
-
-        logging.info("{} docs synchronized from {}: {} {}".format(doc_num, self.conf.get("bucket_type", "s3"),
+        next_update = await self._sync(task, document_batch_generator, FileSource.S3)
+        logging.info("{} docs synchronized from {}: {} {}".format(task["doc_num"], self.conf.get("bucket_type", "s3"),
                                                                   self.conf["bucket_name"],
                                                                   begin_info
                                                                   ))
@@ -137,7 +283,7 @@ class Confluence(SyncBase):
                 "confluence_access_token": self.conf["access_token"],
             },
         )
-        self.connector.set_credentials_provider(credentials_provider)
+        await trio.to_thread.run_sync(self.connector.set_credentials_provider, credentials_provider)
 
         # Determine the time range for synchronization based on reindex or poll_range_start
         if task["reindex"] == "1" or not task["poll_range_start"]:
@@ -149,41 +295,24 @@ class Confluence(SyncBase):
 
         end_time = datetime.now(timezone.utc).timestamp()
 
-        document_generator = load_all_docs_from_checkpoint_connector(
+        # Resume an interrupted sync of the same window, skip the attachments synchronized already unless reindexing
+        checkpoint = self._load_checkpoint(task, self.connector, start_time)
+        if checkpoint is not None:
+            begin_info += ", resuming from its checkpoint"
+        if task["reindex"] != "1":
+            self.connector.set_version_lookup(lambda doc_id: self._known_version(task, doc_id))
+        document_batches = iter_doc_batches_from_checkpoint_connector(
             connector=self.connector,
             start=start_time,
             end=end_time,
+            checkpoint=checkpoint,
         )
 
         logging.info("Connect to Confluence: {} {}".format(self.conf["wiki_base"], begin_info))
-
-        doc_num = 0
-        next_update = datetime(1970, 1, 1, tzinfo=timezone.utc)
-        if task["poll_range_start"]:
-            next_update = task["poll_range_start"]
-
-        for doc in document_generator:
-            min_update = doc.doc_updated_at if doc.doc_updated_at else next_update
-            max_update = doc.doc_updated_at if doc.doc_updated_at else next_update
-            next_update = max([next_update, max_update])
-
-            docs = [{
-                "id": doc.id,
-                "connector_id": task["connector_id"],
-                "source": FileSource.CONFLUENCE,
-                "semantic_identifier": doc.semantic_identifier,
-                "extension": doc.extension,
-                "size_bytes": doc.size_bytes,
-                "doc_updated_at": doc.doc_updated_at,
-                "blob": doc.blob
-            }]
-
-            e, kb = KnowledgebaseService.get_by_id(task["kb_id"])
-            err, dids = SyncLogsService.duplicate_and_parse(kb, docs, task["tenant_id"], f"{FileSource.CONFLUENCE}/{task['connector_id']}")
-            SyncLogsService.increase_docs(task["id"], min_update, max_update, len(docs), "\n".join(err), len(err))
-            doc_num += len(docs)
-
-        logging.info("{} docs synchronized from Confluence: {} {}".format(doc_num, self.conf["wiki_base"], begin_info))
+        next_update = await self._sync(task, document_batches, FileSource.CONFLUENCE,
+                                       save_checkpoint=lambda cp: self._save_checkpoint(task, start_time, cp))
+        self._clear_checkpoint(task)
+        logging.info("{} docs synchronized from Confluence: {} {}".format(task["doc_num"], self.conf["wiki_base"], begin_info))
         SyncLogsService.done(task["id"])
         return next_update
 
@@ -248,16 +377,55 @@ func_factory = {
     FileSource.TEAMS: Teams
 }
 
-async def dispatch_tasks():
-    async with trio.open_nursery() as nursery:
+class SyncScheduler:
+    """
+    Runs the sync tasks when their connector is due for a poll.
+
+    The tasks waiting for a poll are listed every SYNC_RESCAN_INTERVAL seconds into a heap ordered by the
+    time they're due, and the scheduler sleeps until the earliest of them or the next listing, rather than
+    listing them every second. A listing replaces the heap, so paused or rescheduled tasks drop out of it.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._running = set()
+        self._rescan_at = 0
+
+    def _rescan(self):
+        now = time.monotonic()
+        self._heap = []
         for task in SyncLogsService.list_sync_tasks():
-            if task["poll_range_start"]:
-                task["poll_range_start"] = task["poll_range_start"].astimezone(timezone.utc)
-            if task["poll_range_end"]:
-                task["poll_range_end"] = task["poll_range_end"].astimezone(timezone.utc)
-            func = func_factory[task["source"]](task["config"])
-            nursery.start_soon(func, task)
-    await trio.sleep(1)
+            if task["id"] in self._running:
+                continue
+            due_at = now + max(task.pop("due_in") or 0, 0)
+            self._heap.append((due_at, task["id"], task))
+        heapq.heapify(self._heap)
+        self._rescan_at = now + SYNC_RESCAN_INTERVAL
+
+    async def _run_task(self, task: dict):
+        try:
+            await func_factory[task["source"]](task["config"])(task)
+        except Exception:
+            logging.exception(f"Sync task {task['id']} of connector {task['connector_id']} failed")
+        finally:
+            self._running.discard(task["id"])
+
+    async def run(self):
+        async with trio.open_nursery() as nursery:
+            while not stop_event.is_set():
+                if time.monotonic() >= self._rescan_at:
+                    self._rescan()
+                while self._heap and self._heap[0][0] <= time.monotonic():
+                    _, task_id, task = heapq.heappop(self._heap)
+                    if task["poll_range_start"]:
+                        task["poll_range_start"] = task["poll_range_start"].astimezone(timezone.utc)
+                    if task["poll_range_end"]:
+                        task["poll_range_end"] = task["poll_range_end"].astimezone(timezone.utc)
+                    self._running.add(task_id)
+                    nursery.start_soon(self._run_task, task)
+                wake_at = min(self._rescan_at, self._heap[0][0]) if self._heap else self._rescan_at
+                # Wake up at least every second to notice `stop_event`.
+                await trio.sleep(min(max(wake_at - time.monotonic(), 0), 1))
 
 
 stop_event = threading.Event()
@@ -329,8 +497,7 @@ async def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
-    while not stop_event.is_set():
-        await dispatch_tasks()
+    await SyncScheduler().run()
     logging.error("BUG!!! You should not reach here!!!")
 
 
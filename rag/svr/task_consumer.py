@@ -0,0 +1,156 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Reads the messages of the task queues for one task executor.
+
+The messages delivered to the executor before it restarted are read again first. Then those left pending by
+executors whose heartbeat expired are claimed; the messages of an executor still reporting heartbeats are
+left alone however long it works on them. New messages are read by batches, the ones beyond what the
+executor can start at once are kept for its next calls, behind the high priority messages arriving meanwhile.
+"""
+import logging
+import time
+from collections import deque
+
+
+class TaskConsumer:
+    def __init__(self, redis, group_name: str, consumer_name: str, high_priority_queue: str, normal_queue: str,
+                 heartbeat_timeout: int, block_ms: int, fair_scheduler=None):
+        self._redis = redis
+        self._group_name = group_name
+        self._consumer_name = consumer_name
+        self._high_priority_queue = high_priority_queue
+        self._normal_queue = normal_queue
+        self._heartbeat_timeout = heartbeat_timeout
+        self._block_ms = block_ms
+        self._fair_scheduler = fair_scheduler
+        # Queues to read the messages delivered to this consumer before it restarted from, with the last id read.
+        self._unacked = None
+        # Messages delivered to this consumer and not handled yet.
+        self._prefetched = deque()
+        # Id -> queue of the messages delivered to this consumer and not acked yet.
+        self._inflight = {}
+        self._claimed_at = 0
+
+    def queue_names(self) -> list[str]:
+        if self._fair_scheduler is not None:
+            return [self._high_priority_queue] + self._fair_scheduler.queue_names()
+        return [self._high_priority_queue, self._normal_queue]
+
+    def _read(self, queue_names, count, block_ms=None, msg_id=">"):
+        return self._redis.queue_consumer_batch(queue_names, self._group_name, self._consumer_name, count,
+                                                block_ms, msg_id=msg_id)
+
+    def _expired_consumers(self, consumer_names) -> set:
+        """The consumers among `consumer_names` without a heartbeat for `heartbeat_timeout`."""
+        heartbeats = self._redis.last_heartbeats(consumer_names)
+        if heartbeats is None:
+            return set()
+        deadline = time.time() - self._heartbeat_timeout
+        return {c for c in consumer_names if heartbeats.get(c) is None or heartbeats[c] < deadline}
+
+    def _claim_stale(self, queue_names, count) -> list:
+        msgs = []
+        for queue_name in queue_names:
+            pending = self._redis.queue_consumers(queue_name, self._group_name)
+            others = [c for c, n in (pending or {}).items() if n > 0 and c != self._consumer_name]
+            if not others:
+                continue
+            for consumer_name in self._expired_consumers(others):
+                if len(msgs) >= count:
+                    return msgs
+                claimed = self._redis.queue_claim(queue_name, self._group_name, self._consumer_name, consumer_name,
+                                                  int(self._heartbeat_timeout * 1000), count - len(msgs))
+                if claimed:
+                    logging.info(f"{self._consumer_name} claimed {len(claimed)} messages of {consumer_name} on {queue_name}")
+                msgs.extend(claimed)
+        return msgs
+
+    def fetch(self, count: int):
+        """
+        Makes `count` messages ready to be taken if there are, waiting up to `block_ms` for one if there's
+        nothing to do. Blocks, to be run in a thread.
+        """
+        queue_names = self.queue_names()
+        fetched = []
+        if self._unacked is None:
+            for queue_name in queue_names:
+                self._redis.queue_create_group(queue_name, self._group_name)
+            self._unacked = {queue_name: "0" for queue_name in queue_names}
+        elif self._prefetched:
+            # New high priority messages go before those read ahead.
+            msgs = self._read([self._high_priority_queue], count)
+            self._track(msgs)
+            self._prefetched.extendleft(reversed(msgs))
+
+        def missing():
+            return count - len(self._prefetched) - len(fetched)
+
+        # Messages delivered to this consumer before it restarted.
+        while self._unacked and missing() > 0:
+            queue_name, last_id = next(iter(self._unacked.items()))
+            msgs = self._read([queue_name], count, msg_id=last_id)
+            if not msgs:
+                del self._unacked[queue_name]
+                continue
+            self._unacked[queue_name] = msgs[-1].get_msg_id()
+            fetched.extend(msgs)
+
+        # Messages of the executors that stopped reporting heartbeats.
+        if missing() > 0 and time.time() - self._claimed_at > self._heartbeat_timeout / 4:
+            self._claimed_at = time.time()
+            fetched.extend(self._claim_stale(queue_names, missing()))
+
+        if missing() > 0 and self._fair_scheduler is not None:
+            # High priority first, then the tenants' turns.
+            fetched.extend(self._read([self._high_priority_queue], missing()))
+            if missing() > 0:
+                fetched.extend(self._fair_scheduler.fetch(missing()))
+            if not self._prefetched and not fetched:
+                # Wake up on the first message of any queue. Tenants that become active meanwhile are
+                # only seen on the next call, hence the short wait.
+                fetched.extend(self._read(queue_names, 1, min(self._block_ms, 2000)))
+        elif missing() > 0:
+            # Block for new messages only if there is nothing to do.
+            block_ms = None if self._prefetched or fetched else self._block_ms
+            fetched.extend(self._read(queue_names, missing(), block_ms))
+
+        self._track(fetched)
+        self._prefetched.extend(fetched)
+
+    def _track(self, msgs):
+        for msg in msgs:
+            self._inflight[msg.get_msg_id()] = msg.get_queue_name()
+
+    def pop(self):
+        """The next message fetched, None if there's none left."""
+        return self._prefetched.popleft() if self._prefetched else None
+
+    def push_back(self, msg):
+        """Puts `msg`, just popped, back to be taken first."""
+        self._prefetched.appendleft(msg)
+
+    def ack(self, msg):
+        msg.ack()
+        self._inflight.pop(msg.get_msg_id(), None)
+
+    def touch(self):
+        """Resets the idle time of the messages delivered to this consumer and not acked yet."""
+        by_queue = {}
+        for msg_id, queue_name in list(self._inflight.items()):
+            by_queue.setdefault(queue_name, []).append(msg_id)
+        for queue_name, msg_ids in by_queue.items():
+            self._redis.queue_touch(queue_name, self._group_name, self._consumer_name, msg_ids)
@@ -26,15 +26,17 @@ import json_repair
 from api.db.services.canvas_service import UserCanvasService
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.pipeline_operation_log_service import PipelineOperationLogService
-from common.connection_utils import timeout
+from common.connection_utils import run_sync_with_timeout, timeout, timeout_stats
 from common.base64_image import image2id
+from common.misc_utils import LazyModule
 from common.log_utils import init_root_logger
 from common.file_utils import get_project_base_directory
 from common.config_utils import show_configs
 from graphrag.general.index import run_graphrag_for_kb
-from graphrag.utils import get_llm_cache, set_llm_cache, get_tags_from_cache, set_tags_to_cache
+from graphrag.utils import get_llm_cache_many, set_llm_cache, set_llm_cache_many, get_tags_from_cache, set_tags_to_cache
 from rag.flow.pipeline import Pipeline
-from rag.prompts.generator import keyword_extraction, question_proposal, content_tagging, run_toc_from_text
+from rag.prompts.generator import keyword_extraction, question_proposal, content_tagging, run_toc_from_text, \
+    keyword_extraction_many, question_proposal_many, content_tagging_many
 import logging
 import os
 from datetime import datetime
@@ -60,35 +62,40 @@ from api.db.services.file2document_service import File2DocumentService
 from api import settings
 from api.versions import get_ragflow_version
 from api.db.db_models import close_connection
-from rag.app import laws, paper, presentation, manual, qa, table, book, resume, picture, naive, one, audio, \
-    email, tag
 from rag.nlp import search, rag_tokenizer, add_positions
 from rag.raptor import RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor
-from rag.settings import DOC_MAXIMUM_SIZE, DOC_BULK_SIZE, EMBEDDING_BATCH_SIZE, SVR_CONSUMER_GROUP_NAME, get_svr_queue_name, get_svr_queue_names, print_rag_settings, TAG_FLD, PAGERANK_FLD
-from common.token_utils import num_tokens_from_string, truncate
+from rag.svr.chunk_pool import CHUNK_WORKERS, ChunkPool
+from rag.svr.task_consumer import TaskConsumer
+from rag.settings import DOC_MAXIMUM_SIZE, DOC_BULK_SIZE, DOC_BULK_MAX_BYTES, EMBEDDING_BATCH_SIZE, SVR_CONSUMER_GROUP_NAME, get_svr_queue_name, print_rag_settings, TAG_FLD, PAGERANK_FLD
+from common.token_utils import num_tokens_from_string, truncate, pack_by_tokens
+from rag.utils.fair_queue import FAIR_SCHEDULING, FairScheduler
+from rag.utils.llm_cache import LLM_CACHE
 from rag.utils.redis_conn import REDIS_CONN, RedisDistributedLock
 from rag.utils.storage_factory import STORAGE_IMPL
 from graphrag.utils import chat_limiter
 
 BATCH_SIZE = 64
+TAG_BATCH_SIZE = 256
 
+# Parser modules are imported when a task first needs them.
+naive = LazyModule("rag.app.naive")
 FACTORY = {
     "general": naive,
     ParserType.NAIVE.value: naive,
-    ParserType.PAPER.value: paper,
-    ParserType.BOOK.value: book,
-    ParserType.PRESENTATION.value: presentation,
-    ParserType.MANUAL.value: manual,
-    ParserType.LAWS.value: laws,
-    ParserType.QA.value: qa,
-    ParserType.TABLE.value: table,
-    ParserType.RESUME.value: resume,
-    ParserType.PICTURE.value: picture,
-    ParserType.ONE.value: one,
-    ParserType.AUDIO.value: audio,
-    ParserType.EMAIL.value: email,
+    ParserType.PAPER.value: LazyModule("rag.app.paper"),
+    ParserType.BOOK.value: LazyModule("rag.app.book"),
+    ParserType.PRESENTATION.value: LazyModule("rag.app.presentation"),
+    ParserType.MANUAL.value: LazyModule("rag.app.manual"),
+    ParserType.LAWS.value: LazyModule("rag.app.laws"),
+    ParserType.QA.value: LazyModule("rag.app.qa"),
+    ParserType.TABLE.value: LazyModule("rag.app.table"),
+    ParserType.RESUME.value: LazyModule("rag.app.resume"),
+    ParserType.PICTURE.value: LazyModule("rag.app.picture"),
+    ParserType.ONE.value: LazyModule("rag.app.one"),
+    ParserType.AUDIO.value: LazyModule("rag.app.audio"),
+    ParserType.EMAIL.value: LazyModule("rag.app.email"),
     ParserType.KG.value: naive,
-    ParserType.TAG.value: tag
+    ParserType.TAG.value: LazyModule("rag.app.tag"),
 }
 
 TASK_TYPE_TO_PIPELINE_TASK_TYPE = {
@@ -98,7 +105,9 @@ TASK_TYPE_TO_PIPELINE_TASK_TYPE = {
     "mindmap": PipelineTaskType.MINDMAP,
 }
 
-UNACKED_ITERATOR = None
+# (index, knowledge base, vector size) -> when init_kb made sure it exists.
+CREATED_INDICES = {}
+CREATED_INDEX_TTL = 600
 
 CONSUMER_NO = "0" if len(sys.argv) < 2 else sys.argv[1]
 CONSUMER_NAME = "task_executor_" + CONSUMER_NO
@@ -113,18 +122,31 @@ CURRENT_TASKS = {}
 MAX_CONCURRENT_TASKS = int(os.environ.get('MAX_CONCURRENT_TASKS', "5"))
 MAX_CONCURRENT_CHUNK_BUILDERS = int(os.environ.get('MAX_CONCURRENT_CHUNK_BUILDERS', "1"))
 MAX_CONCURRENT_MINIO = int(os.environ.get('MAX_CONCURRENT_MINIO', '10'))
+MAX_CONCURRENT_BULKS = int(os.environ.get('MAX_CONCURRENT_BULKS', '4'))
+DOC_BULK_RETRIES = 3
 task_limiter = trio.Semaphore(MAX_CONCURRENT_TASKS)
-chunk_limiter = trio.CapacityLimiter(MAX_CONCURRENT_CHUNK_BUILDERS)
+# With chunk worker processes, as many documents as workers are chunked at once.
+chunk_limiter = trio.CapacityLimiter(max(MAX_CONCURRENT_CHUNK_BUILDERS, CHUNK_WORKERS))
 embed_limiter = trio.CapacityLimiter(MAX_CONCURRENT_CHUNK_BUILDERS)
 minio_limiter = trio.CapacityLimiter(MAX_CONCURRENT_MINIO)
+bulk_limiter = trio.CapacityLimiter(MAX_CONCURRENT_BULKS)
 kg_limiter = trio.CapacityLimiter(2)
 WORKER_HEARTBEAT_TIMEOUT = int(os.environ.get('WORKER_HEARTBEAT_TIMEOUT', '120'))
+COLLECT_BLOCK_MS = int(os.environ.get('COLLECT_BLOCK_MS', '10000'))
+# Chunks enriched (keywords, questions, tags) per chat completion, 1 one by one.
+ENRICH_BATCH_SIZE = int(os.environ.get('ENRICH_BATCH_SIZE', '1'))
 stop_event = threading.Event()
+CHUNK_POOL = None
+FAIR_SCHEDULER = FairScheduler(SVR_CONSUMER_GROUP_NAME, CONSUMER_NAME) if FAIR_SCHEDULING else None
+TASK_CONSUMER = TaskConsumer(REDIS_CONN, SVR_CONSUMER_GROUP_NAME, CONSUMER_NAME, get_svr_queue_name(1),
+                             get_svr_queue_name(0), WORKER_HEARTBEAT_TIMEOUT, COLLECT_BLOCK_MS, FAIR_SCHEDULER)
 
 
 def signal_handler(sig, frame):
     logging.info("Received interrupt signal, shutting down...")
     stop_event.set()
+    if CHUNK_POOL is not None:
+        CHUNK_POOL.shutdown()
     time.sleep(1)
     sys.exit(0)
 
@@ -200,32 +222,17 @@ def set_progress(task_id, from_page=0, to_page=-1, prog=None, msg="Processing...
         logging.exception(f"set_progress({task_id}), progress: {prog}, progress_msg: {msg}, got exception")
 
 
-async def collect():
-    global CONSUMER_NAME, DONE_TASKS, FAILED_TASKS
-    global UNACKED_ITERATOR
+def ack_message(redis_msg):
+    TASK_CONSUMER.ack(redis_msg)
 
-    svr_queue_names = get_svr_queue_names()
-    try:
-        if not UNACKED_ITERATOR:
-            UNACKED_ITERATOR = REDIS_CONN.get_unacked_iterator(svr_queue_names, SVR_CONSUMER_GROUP_NAME, CONSUMER_NAME)
-        try:
-            redis_msg = next(UNACKED_ITERATOR)
-        except StopIteration:
-            for svr_queue_name in svr_queue_names:
-                redis_msg = REDIS_CONN.queue_consumer(svr_queue_name, SVR_CONSUMER_GROUP_NAME, CONSUMER_NAME)
-                if redis_msg:
-                    break
-    except Exception:
-        logging.exception("collect got exception")
-        return None, None
 
-    if not redis_msg:
-        return None, None
+def get_task(redis_msg):
+    global FAILED_TASKS
     msg = redis_msg.get_message()
     if not msg:
         logging.error(f"collect got empty message of {redis_msg.get_msg_id()}")
-        redis_msg.ack()
-        return None, None
+        ack_message(redis_msg)
+        return None
 
     canceled = False
     if msg.get("doc_id", "") in [GRAPH_RAPTOR_FAKE_DOC_ID, CANVAS_DEBUG_DOC_ID]:
@@ -244,8 +251,8 @@ async def collect():
         state = "is unknown" if not task else "has been cancelled"
         FAILED_TASKS += 1
         logging.warning(f"collect task {msg['id']} {state}")
-        redis_msg.ack()
-        return None, None
+        ack_message(redis_msg)
+        return None
 
     task_type = msg.get("task_type", "")
     task["task_type"] = task_type
@@ -253,13 +260,100 @@ async def collect():
         task["tenant_id"] = msg["tenant_id"]
         task["dataflow_id"] = msg["dataflow_id"]
         task["kb_id"] = msg.get("kb_id", "")
-    return redis_msg, task
+    return task
+
+
+async def collect(count=1):
+    """
+    Up to `count` tasks to run, waiting up to COLLECT_BLOCK_MS for one if there is none.
+    XREADGROUP's count applies to each queue, the messages fetched beyond `count` are kept for the next call.
+    """
+    try:
+        await trio.to_thread.run_sync(TASK_CONSUMER.fetch, count)
+    except Exception:
+        logging.exception("collect got exception")
+        await trio.sleep(5)
+        return []
+
+    collected = []
+    while len(collected) < count:
+        redis_msg = TASK_CONSUMER.pop()
+        if redis_msg is None:
+            break
+        try:
+            task = get_task(redis_msg)
+        except Exception:
+            logging.exception(f"collect got exception for message {redis_msg.get_msg_id()}")
+            TASK_CONSUMER.push_back(redis_msg)
+            if not collected:
+                await trio.sleep(5)
+            break
+        if task:
+            collected.append((redis_msg, task))
+    return collected
 
 
 async def get_storage_binary(bucket, name):
     return await trio.to_thread.run_sync(lambda: STORAGE_IMPL.get(bucket, name))
 
 
+async def enrich_chunks(chat_mdl, docs, cache_args, enrich_one, enrich_many, apply, prompt_tokens=0):
+    """
+    `apply(d, result)` to each chunk `d` of `enrich_one(content)`, or with ENRICH_BATCH_SIZE over 1, of
+    `enrich_many(contents)` over as many chunks as fit in half the context of the chat model beside
+    `prompt_tokens`. Results are cached per chunk either way, and looked up for all the chunks at once;
+    the chunks a batch got no result for are enriched one by one.
+    """
+    pending = []
+    cached = await trio.to_thread.run_sync(lambda: get_llm_cache_many(chat_mdl.llm_name, [d["content_with_weight"] for d in docs], *cache_args, "enrichment"))
+    for d, result in zip(docs, cached):
+        if result:
+            apply(d, result)
+        else:
+            pending.append(d)
+
+    async def one(d):
+        async with chat_limiter:
+            result = await trio.to_thread.run_sync(lambda: enrich_one(d["content_with_weight"]))
+        if result:
+            await trio.to_thread.run_sync(lambda: set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], result, *cache_args, "enrichment"))
+            apply(d, result)
+
+    async def many(batch):
+        try:
+            async with chat_limiter:
+                results = await trio.to_thread.run_sync(lambda: enrich_many([d["content_with_weight"] for d in batch]))
+        except Exception:
+            logging.exception(f"Enriching {len(batch)} chunks at once got exception, enriching them one by one")
+            results = [None] * len(batch)
+        missed = []
+        to_cache = {}
+        for d, result in zip(batch, results):
+            if result is None:
+                missed.append(d)
+            elif result:
+                to_cache[d["content_with_weight"]] = result
+                apply(d, result)
+        await trio.to_thread.run_sync(lambda: set_llm_cache_many(chat_mdl.llm_name, to_cache, *cache_args, "enrichment"))
+        if missed:
+            logging.info(f"Enriching {len(batch)} chunks at once missed {len(missed)}, enriching them one by one")
+        async with trio.open_nursery() as nursery:
+            for d in missed:
+                nursery.start_soon(one, d)
+
+    async with trio.open_nursery() as nursery:
+        if ENRICH_BATCH_SIZE <= 1:
+            for d in pending:
+                nursery.start_soon(one, d)
+            return
+        max_tokens = chat_mdl.max_length // 2 - prompt_tokens
+        for group in pack_by_tokens([d["content_with_weight"] for d in pending], max_tokens, ENRICH_BATCH_SIZE):
+            if len(group) == 1:
+                nursery.start_soon(one, pending[group[0]])
+            else:
+                nursery.start_soon(many, [pending[i] for i in group])
+
+
 @timeout(60*80, 1)
 async def build_chunks(task, progress_callback):
     if task["size"] > DOC_MAXIMUM_SIZE:
@@ -287,10 +381,14 @@ async def build_chunks(task, progress_callback):
         raise
 
     try:
+        chunk_kwargs = dict(from_page=task["from_page"], to_page=task["to_page"], lang=task["language"],
+                            kb_id=task["kb_id"], parser_config=task["parser_config"], tenant_id=task["tenant_id"])
         async with chunk_limiter:
-            cks = await trio.to_thread.run_sync(lambda: chunker.chunk(task["name"], binary=binary, from_page=task["from_page"],
-                                to_page=task["to_page"], lang=task["language"], callback=progress_callback,
-                                kb_id=task["kb_id"], parser_config=task["parser_config"], tenant_id=task["tenant_id"]))
+            if CHUNK_POOL is not None:
+                cks = await CHUNK_POOL.chunk(chunker.module_name, task["name"], binary, progress_callback,
+                                             task_id=task["id"], **chunk_kwargs)
+            else:
+                cks = await trio.to_thread.run_sync(lambda: chunker.chunk(task["name"], binary=binary, callback=progress_callback, **chunk_kwargs))
         logging.info("Chunking({}) {}/{} done".format(timer() - st, task["location"], task["name"]))
     except TaskCanceledException:
         raise
@@ -339,39 +437,30 @@ async def build_chunks(task, progress_callback):
         st = timer()
         progress_callback(msg="Start to generate keywords for every chunk ...")
         chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
-
-        async def doc_keyword_extraction(chat_mdl, d, topn):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "keywords", {"topn": topn})
-            if not cached:
-                async with chat_limiter:
-                    cached = await trio.to_thread.run_sync(lambda: keyword_extraction(chat_mdl, d["content_with_weight"], topn))
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, "keywords", {"topn": topn})
-            if cached:
-                d["important_kwd"] = cached.split(",")
-                d["important_tks"] = rag_tokenizer.tokenize(" ".join(d["important_kwd"]))
-            return
-        async with trio.open_nursery() as nursery:
-            for d in docs:
-                nursery.start_soon(doc_keyword_extraction, chat_mdl, d, task["parser_config"]["auto_keywords"])
+        topn = task["parser_config"]["auto_keywords"]
+
+        def set_keywords(d, cached):
+            d["important_kwd"] = cached.split(",")
+            d["important_tks"] = rag_tokenizer.tokenize(" ".join(d["important_kwd"]))
+        await enrich_chunks(chat_mdl, docs, ("keywords", {"topn": topn}),
+                            lambda content: keyword_extraction(chat_mdl, content, topn),
+                            lambda contents: keyword_extraction_many(chat_mdl, contents, topn),
+                            set_keywords)
         progress_callback(msg="Keywords generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
     if task["parser_config"].get("auto_questions", 0):
         st = timer()
         progress_callback(msg="Start to generate questions for every chunk ...")
         chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
-
-        async def doc_question_proposal(chat_mdl, d, topn):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "question", {"topn": topn})
-            if not cached:
-                async with chat_limiter:
-                    cached = await trio.to_thread.run_sync(lambda: question_proposal(chat_mdl, d["content_with_weight"], topn))
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, "question", {"topn": topn})
-            if cached:
-                d["question_kwd"] = cached.split("\n")
-                d["question_tks"] = rag_tokenizer.tokenize("\n".join(d["question_kwd"]))
-        async with trio.open_nursery() as nursery:
-            for d in docs:
-                nursery.start_soon(doc_question_proposal, chat_mdl, d, task["parser_config"]["auto_questions"])
+        topn = task["parser_config"]["auto_questions"]
+
+        def set_questions(d, cached):
+            d["question_kwd"] = cached.split("\n")
+            d["question_tks"] = rag_tokenizer.tokenize("\n".join(d["question_kwd"]))
+        await enrich_chunks(chat_mdl, docs, ("question", {"topn": topn}),
+                            lambda content: question_proposal(chat_mdl, content, topn),
+                            lambda contents: question_proposal_many(chat_mdl, contents, topn),
+                            set_questions)
         progress_callback(msg="Question generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
     if task["kb_parser_config"].get("tag_kb_ids", []):
@@ -392,37 +481,113 @@ async def build_chunks(task, progress_callback):
         chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
 
         docs_to_tag = []
-        for d in docs:
+        for b in range(0, len(docs), TAG_BATCH_SIZE):
             task_canceled = has_canceled(task["id"])
             if task_canceled:
                 progress_callback(-1, msg="Task has been canceled.")
                 return
-            if settings.retriever.tag_content(tenant_id, kb_ids, d, all_tags, topn_tags=topn_tags, S=S) and len(d[TAG_FLD]) > 0:
-                examples.append({"content": d["content_with_weight"], TAG_FLD: d[TAG_FLD]})
-            else:
-                docs_to_tag.append(d)
-
-        async def doc_content_tagging(chat_mdl, d, topn_tags):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], all_tags, {"topn": topn_tags})
-            if not cached:
-                picked_examples = random.choices(examples, k=2) if len(examples)>2 else examples
-                if not picked_examples:
-                    picked_examples.append({"content": "This is an example", TAG_FLD: {'example': 1}})
-                async with chat_limiter:
-                    cached = await trio.to_thread.run_sync(lambda: content_tagging(chat_mdl, d["content_with_weight"], all_tags, picked_examples, topn=topn_tags))
-                if cached:
-                    cached = json.dumps(cached)
-            if cached:
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, all_tags, {"topn": topn_tags})
-                d[TAG_FLD] = json.loads(cached)
-        async with trio.open_nursery() as nursery:
-            for d in docs_to_tag:
-                nursery.start_soon(doc_content_tagging, chat_mdl, d, topn_tags)
+            batch = docs[b:b + TAG_BATCH_SIZE]
+            tagged = await trio.to_thread.run_sync(lambda: settings.retriever.tag_content_many(tenant_id, kb_ids, batch, all_tags, topn_tags=topn_tags, S=S))
+            for d, ok in zip(batch, tagged):
+                if ok and len(d[TAG_FLD]) > 0:
+                    examples.append({"content": d["content_with_weight"], TAG_FLD: d[TAG_FLD]})
+                else:
+                    docs_to_tag.append(d)
+
+        def pick_examples():
+            picked_examples = random.choices(examples, k=2) if len(examples)>2 else examples
+            if not picked_examples:
+                picked_examples.append({"content": "This is an example", TAG_FLD: {'example': 1}})
+            return picked_examples
+
+        def doc_content_tagging(content):
+            tags = content_tagging(chat_mdl, content, all_tags, pick_examples(), topn=topn_tags)
+            return json.dumps(tags) if tags else tags
+
+        def doc_content_tagging_many(contents):
+            return [json.dumps(tags) if tags else tags for tags in content_tagging_many(chat_mdl, contents, all_tags, pick_examples(), topn=topn_tags)]
+
+        # The tag set and two examples are in every prompt.
+        prompt_tokens = num_tokens_from_string(", ".join(all_tags)) + \
+            2 * max([num_tokens_from_string(ex["content"]) for ex in examples], default=0)
+        await enrich_chunks(chat_mdl, docs_to_tag, (all_tags, {"topn": topn_tags}),
+                            doc_content_tagging, doc_content_tagging_many,
+                            lambda d, cached: search.set_tag_features(d, json.loads(cached)),
+                            prompt_tokens=prompt_tokens)
         progress_callback(msg="Tagging {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
     return docs
 
 
+async def copy_parsed_chunks(task, progress_callback):
+    """
+    Parsing and embedding only depend on the file content and the chunking configuration, so
+    when another document with the same bytes was already parsed the same way, its chunks are
+    copied over instead.
+    Returns (chunks, token_count), or None when there is nothing to reuse.
+    """
+    if not task.get("content_digest"):
+        return None
+    src = TaskService.get_reusable_task(task["content_digest"], task["doc_id"])
+    if not src:
+        return None
+
+    st = timer()
+    src_chunk_ids = src["chunk_ids"].split()
+
+    def fetch_chunks():
+        # The fields of the chunks, vectors included, are those of any one of them.
+        first = settings.docStoreConn.get(src_chunk_ids[0], search.index_name(src["tenant_id"]), [src["kb_id"]])
+        if first is None:
+            return []
+        fields = [f for f in first.keys() if f not in ("id", "_score")]
+        # Other tasks of the source document, e.g. other page ranges, have chunks of their own.
+        wanted = set(src_chunk_ids)
+        found = {ck["id"]: ck for batch in settings.retriever.iter_chunks(src["doc_id"], src["tenant_id"], [src["kb_id"]], fields)
+                 for ck in batch if ck["id"] in wanted}
+        return [found[chunk_id] for chunk_id in src_chunk_ids if chunk_id in found]
+
+    src_chunks = await trio.to_thread.run_sync(fetch_chunks)
+    if len(src_chunks) < len(src_chunk_ids):
+        # The source document was re-parsed or deleted meanwhile.
+        logging.info("Chunks of task {} are gone, parse {} instead".format(src["id"], task["name"]))
+        return None
+
+    title_tks = rag_tokenizer.tokenize(re.sub(r"\.[a-zA-Z]+$", "", task["name"]))
+    title_sm_tks = rag_tokenizer.fine_grained_tokenize(title_tks)
+    chunks, tk_count = [], 0
+
+    async def copy_image(src_img_id, chunk_id):
+        bkt, nm = src_img_id.split("-")
+        async with minio_limiter:
+            binary = await trio.to_thread.run_sync(lambda: STORAGE_IMPL.get(bkt, nm))
+            await trio.to_thread.run_sync(
+                lambda: STORAGE_IMPL.put(task["kb_id"], chunk_id, binary, tenant_id=task["tenant_id"]))
+
+    async with trio.open_nursery() as nursery:
+        for ck in src_chunks:
+            ck.pop("_score", None)
+            ck.pop(PAGERANK_FLD, None)
+            ck["doc_id"] = task["doc_id"]
+            ck["kb_id"] = str(task["kb_id"])
+            ck["docnm_kwd"] = task["name"]
+            ck["title_tks"] = title_tks
+            ck["title_sm_tks"] = title_sm_tks
+            if task["pagerank"]:
+                ck[PAGERANK_FLD] = int(task["pagerank"])
+            ck["id"] = xxhash.xxh64((ck["content_with_weight"] + str(ck["doc_id"])).encode("utf-8", "surrogatepass")).hexdigest()
+            ck["create_time"] = str(datetime.now()).replace("T", " ")[:19]
+            ck["create_timestamp_flt"] = datetime.now().timestamp()
+            if ck.get("img_id"):
+                nursery.start_soon(copy_image, ck["img_id"], ck["id"])
+                ck["img_id"] = f"{task['kb_id']}-{ck['id']}"
+            tk_count += num_tokens_from_string(ck["content_with_weight"])
+            chunks.append(ck)
+
+    progress_callback(msg="Reused {} chunks of a document with identical content ({:.2f}s)".format(len(chunks), timer() - st))
+    return chunks, tk_count
+
+
 def build_TOC(task, docs, progress_callback):
     progress_callback(msg="Start to generate table of content ...")
     chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
@@ -458,7 +623,14 @@ def build_TOC(task, docs, progress_callback):
 
 def init_kb(row, vector_size: int):
     idxnm = search.index_name(row["tenant_id"])
-    return settings.docStoreConn.createIdx(idxnm, row.get("kb_id", ""), vector_size)
+    key = (idxnm, row.get("kb_id", ""), vector_size)
+    # Remembered for a while only, in case the index is dropped meanwhile.
+    if time.time() - CREATED_INDICES.get(key, 0) < CREATED_INDEX_TTL:
+        return True
+    created = settings.docStoreConn.createIdx(idxnm, row.get("kb_id", ""), vector_size)
+    if created:
+        CREATED_INDICES[key] = time.time()
+    return created
 
 
 async def embedding(docs, mdl, parser_config=None, callback=None):
@@ -480,8 +652,6 @@ async def embedding(docs, mdl, parser_config=None, callback=None):
         vts, c = await trio.to_thread.run_sync(lambda: mdl.encode(tts[0: 1]))
         tts = np.concatenate([vts[0] for _ in range(len(tts))], axis=0)
         tk_count += c
-
-    @timeout(60)
     def batch_encode(txts):
         nonlocal mdl
         return mdl.encode([truncate(c, mdl.max_length-10) for c in txts])
@@ -489,7 +659,7 @@ async def embedding(docs, mdl, parser_config=None, callback=None):
     cnts_ = np.array([])
     for i in range(0, len(cnts), EMBEDDING_BATCH_SIZE):
         async with embed_limiter:
-            vts, c = await trio.to_thread.run_sync(lambda: batch_encode(cnts[i: i + EMBEDDING_BATCH_SIZE]))
+            vts, c = await run_sync_with_timeout(120, batch_encode, cnts[i: i + EMBEDDING_BATCH_SIZE])
         if len(cnts_) == 0:
             cnts_ = vts
         else:
@@ -557,7 +727,6 @@ async def run_dataflow(task: dict):
             e, kb = KnowledgebaseService.get_by_id(task["kb_id"])
             embedding_id = kb.embd_id
             embedding_model = LLMBundle(task["tenant_id"], LLMType.EMBEDDING, llm_name=embedding_id)
-            @timeout(60)
             def batch_encode(txts):
                 nonlocal embedding_model
                 return embedding_model.encode([truncate(c, embedding_model.max_length - 10) for c in txts])
@@ -567,7 +736,7 @@ async def run_dataflow(task: dict):
             prog = 0.8
             for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
                 async with embed_limiter:
-                    vts, c = await trio.to_thread.run_sync(lambda: batch_encode(texts[i : i + EMBEDDING_BATCH_SIZE]))
+                    vts, c = await run_sync_with_timeout(120, batch_encode, texts[i : i + EMBEDDING_BATCH_SIZE])
                 if len(vects) == 0:
                     vects = vts
                 else:
@@ -679,13 +848,23 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
 
     raptor_config = kb_parser_config.get("raptor", {})
 
-    chunks = []
     vctr_nm = "q_%d_vec"%vector_size
+    kb_ids = [str(row["kb_id"])]
+    # Vectors are filled in one matrix sized up front, instead of an array per chunk.
+    texts = []
+    vectors = np.zeros((sum(settings.retriever.chunk_count(doc_id, row["tenant_id"], kb_ids) for doc_id in doc_ids), vector_size), dtype=np.float32)
     for doc_id in doc_ids:
-        for d in settings.retriever.chunk_list(doc_id, row["tenant_id"], [str(row["kb_id"])],
-                                                 fields=["content_with_weight", vctr_nm],
-                                                 sort_by_position=True):
-            chunks.append((d["content_with_weight"], np.array(d[vctr_nm])))
+        for batch in settings.retriever.iter_chunks(doc_id, row["tenant_id"], kb_ids,
+                                                    fields=["content_with_weight", vctr_nm],
+                                                    sort_by_position=True):
+            batch = [d for d in batch if d.get(vctr_nm) is not None and len(d[vctr_nm]) == vector_size]
+            if len(texts) + len(batch) > len(vectors):
+                # Chunks added since they were counted.
+                vectors = np.concatenate([vectors, np.zeros((len(texts) + len(batch) - len(vectors), vector_size), dtype=np.float32)])
+            for d in batch:
+                vectors[len(texts)] = d[vctr_nm]
+                texts.append(d["content_with_weight"])
+    chunks = list(zip(texts, vectors[:len(texts)]))
 
     raptor = Raptor(
         raptor_config.get("max_cluster", 64),
@@ -731,31 +910,112 @@ async def delete_image(kb_id, chunk_id):
         raise
 
 
-async def insert_es(task_id, task_tenant_id, task_dataset_id, chunks, progress_callback):
-    for b in range(0, len(chunks), DOC_BULK_SIZE):
-        doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b:b + DOC_BULK_SIZE], search.index_name(task_tenant_id), task_dataset_id))
-        task_canceled = has_canceled(task_id)
-        if task_canceled:
-            progress_callback(-1, msg="Task has been canceled.")
-            return
-        if b % 128 == 0:
-            progress_callback(prog=0.8 + 0.1 * (b + 1) / len(chunks), msg="")
-        if doc_store_result:
-            error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
-            progress_callback(-1, msg=error_message)
-            raise Exception(error_message)
-        chunk_ids = [chunk["id"] for chunk in chunks[:b + DOC_BULK_SIZE]]
-        chunk_ids_str = " ".join(chunk_ids)
+def chunk_payload_size(chunk: dict) -> int:
+    """Rough size of `chunk` once JSON encoded, good enough to cut bulks by payload."""
+    size = 2
+    for k, v in chunk.items():
+        size += len(k) + 4
+        if isinstance(v, str):
+            size += len(v.encode("utf-8"))
+        elif isinstance(v, (list, tuple, np.ndarray)):
+            size += 12 * len(v)
+        else:
+            size += 16
+    return size
+
+
+async def insert_es(task_id, task_tenant_id, task_dataset_id, chunks, progress_callback, prev_chunk_ids=()):
+    """
+    Indexes `chunks` in bulks cut by payload size, with up to MAX_CONCURRENT_BULKS bulks in flight.
+    Only the chunks the doc store rejected are retried; a bulk failing as a whole (timeout, too large)
+    also halves the payload of the bulks cut after it. The task's chunk ids, after `prev_chunk_ids`,
+    are written once indexing stops.
+    """
+    if not chunks:
+        return True
+    index_name = search.index_name(task_tenant_id)
+    sizes = [chunk_payload_size(ck) for ck in chunks]
+    indexed, errors = set(), []
+    bulk_bytes, bulk_num, done, canceled = DOC_BULK_MAX_BYTES, 0, 0, False
+    start_ts = timer()
+
+    async def index_bulk(bulk, token, cancel_scope):
+        nonlocal bulk_bytes, done, canceled
         try:
-            TaskService.update_chunk_ids(task_id, chunk_ids_str)
-        except DoesNotExist:
-            logging.warning(f"do_handle_task update_chunk_ids failed since task {task_id} is unknown.")
-            doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"id": chunk_ids}, search.index_name(task_tenant_id), task_dataset_id))
-            async with trio.open_nursery() as nursery:
-                for chunk_id in chunk_ids:
-                    nursery.start_soon(delete_image, task_dataset_id, chunk_id)
-            progress_callback(-1, msg=f"Chunk updates failed since task {task_id} is unknown.")
+            pending, res = bulk, []
+            for attempt in range(DOC_BULK_RETRIES + 1):
+                if attempt:
+                    await trio.sleep(2 ** (attempt - 1))
+                try:
+                    res = await trio.to_thread.run_sync(settings.docStoreConn.insert, pending, index_name, task_dataset_id)
+                except Exception as e:
+                    logging.exception(f"insert_es: bulk of {len(pending)} chunks failed")
+                    res = [str(e)]
+                failed_ids = {str(r).split(":", 1)[0] for r in res}
+                failed = [ck for ck in pending if ck["id"] in failed_ids]
+                if res and not failed:
+                    # The request failed as a whole, e.g. it timed out or was too large.
+                    failed = pending
+                    bulk_bytes = max(bulk_bytes // 2, 1)
+                failed_ids = {ck["id"] for ck in failed}
+                indexed.update(ck["id"] for ck in pending if ck["id"] not in failed_ids)
+                pending = failed
+                if not pending:
+                    break
+                logging.warning(f"insert_es: retry {len(pending)} of {len(bulk)} chunks, attempt {attempt + 1}: {res[:3]}")
+        finally:
+            bulk_limiter.release_on_behalf_of(token)
+        if pending:
+            errors.append(res)
+            cancel_scope.cancel()
             return
+        done += len(bulk)
+        if has_canceled(task_id):
+            canceled = True
+            cancel_scope.cancel()
+            return
+        progress_callback(prog=0.8 + 0.1 * done / len(chunks), msg="")
+
+    async with trio.open_nursery() as nursery:
+        i = 0
+        while i < len(chunks) and not errors and not canceled:
+            token = object()
+            await bulk_limiter.acquire_on_behalf_of(token)
+            j, size = i, 0
+            while j < len(chunks) and j - i < DOC_BULK_SIZE and (j == i or size + sizes[j] <= bulk_bytes):
+                size += sizes[j]
+                j += 1
+            bulk_num += 1
+            if i == 0:
+                # The first bulk may create the index, the others wait for it.
+                await index_bulk(chunks[i:j], token, nursery.cancel_scope)
+            else:
+                nursery.start_soon(index_bulk, chunks[i:j], token, nursery.cancel_scope)
+            i = j
+
+    chunk_ids = list(prev_chunk_ids) + [ck["id"] for ck in chunks if ck["id"] in indexed]
+    try:
+        TaskService.update_chunk_ids(task_id, " ".join(chunk_ids))
+    except DoesNotExist:
+        logging.warning(f"do_handle_task update_chunk_ids failed since task {task_id} is unknown.")
+        chunk_ids = [ck["id"] for ck in chunks if ck["id"] in indexed]
+        await trio.to_thread.run_sync(lambda: settings.docStoreConn.delete({"id": chunk_ids}, search.index_name(task_tenant_id), task_dataset_id))
+        async with trio.open_nursery() as nursery:
+            for chunk_id in chunk_ids:
+                nursery.start_soon(delete_image, task_dataset_id, chunk_id)
+        progress_callback(-1, msg=f"Chunk updates failed since task {task_id} is unknown.")
+        return
+    if canceled:
+        progress_callback(-1, msg="Task has been canceled.")
+        return
+    if errors:
+        error_message = f"Insert chunk error: {errors[0]}, please check log file and Elasticsearch/Infinity status!"
+        progress_callback(-1, msg=error_message)
+        raise Exception(error_message)
+
+    elapsed = max(timer() - start_ts, 1e-6)
+    mb = sum(sizes) / 2**20
+    progress_callback(msg=f"Indexed {len(chunks)} chunks in {bulk_num} bulks, {mb:.1f} MB ({len(chunks) / elapsed:.0f} chunks/s, {mb / elapsed:.1f} MB/s)")
     return True
 
 
@@ -800,8 +1060,7 @@ async def do_handle_task(task):
     try:
         # bind embedding model
         embedding_model = LLMBundle(task_tenant_id, LLMType.EMBEDDING, llm_name=task_embedding_id, lang=task_language)
-        vts, _ = embedding_model.encode(["ok"])
-        vector_size = len(vts[0])
+        vector_size = embedding_model.embedding_dimension()
     except Exception as e:
         error_message = f'Fail to bind embedding model: {str(e)}'
         progress_callback(-1, msg=error_message)
@@ -905,6 +1164,8 @@ async def do_handle_task(task):
         progress_callback(1, "place holder")
         pass
         return
+    elif (copied := await copy_parsed_chunks(task, progress_callback)) is not None:
+        chunks, token_count = copied
     else:
         # Standard chunking methods
         start_ts = timer()
@@ -946,7 +1207,8 @@ async def do_handle_task(task):
     if toc_thread:
         d = toc_thread.result()
         if d:
-            e = await insert_es(task_id, task_tenant_id, task_dataset_id, [d], progress_callback)
+            e = await insert_es(task_id, task_tenant_id, task_dataset_id, [d], progress_callback,
+                                prev_chunk_ids=[chunk["id"] for chunk in chunks])
             if not e:
                 return
             DocumentService.increment_chunk_num(task_doc_id, task_dataset_id, 0, 1, 0)
@@ -959,13 +1221,8 @@ async def do_handle_task(task):
                                                                                    token_count, task_time_cost))
 
 
-async def handle_task():
+async def handle_task(redis_msg, task):
     global DONE_TASKS, FAILED_TASKS
-    redis_msg, task = await collect()
-    if not task:
-        await trio.sleep(5)
-        return
-
     task_type = task["task_type"]
     pipeline_task_type = TASK_TYPE_TO_PIPELINE_TASK_TYPE.get(task_type, PipelineTaskType.PARSE) or PipelineTaskType.PARSE
 
@@ -995,7 +1252,7 @@ async def handle_task():
         if not task.get("dataflow_id", ""):
             PipelineOperationLogService.record_pipeline_operation(document_id=task["doc_id"], pipeline_id="", task_type=pipeline_task_type, fake_document_ids=task_document_ids)
 
-    redis_msg.ack()
+    ack_message(redis_msg)
 
 
 async def report_status():
@@ -1005,10 +1262,13 @@ async def report_status():
     while True:
         try:
             now = datetime.now()
-            group_info = REDIS_CONN.queue_info(get_svr_queue_name(0), SVR_CONSUMER_GROUP_NAME)
-            if group_info is not None:
-                PENDING_TASKS = int(group_info.get("pending", 0))
-                LAG_TASKS = int(group_info.get("lag", 0))
+            # With fair scheduling, the normal priority tasks are spread over the queues of the tenants.
+            queue_names = FAIR_SCHEDULER.queue_names() if FAIR_SCHEDULER is not None else [get_svr_queue_name(0)]
+            group_infos = [info for info in REDIS_CONN.queue_infos(queue_names, SVR_CONSUMER_GROUP_NAME).values()
+                           if info is not None]
+            if group_infos:
+                PENDING_TASKS = sum(int(info.get("pending", 0) or 0) for info in group_infos)
+                LAG_TASKS = sum(int(info.get("lag", 0) or 0) for info in group_infos)
 
             current = copy.deepcopy(CURRENT_TASKS)
             heartbeat = json.dumps({
@@ -1020,10 +1280,16 @@ async def report_status():
                 "done": DONE_TASKS,
                 "failed": FAILED_TASKS,
                 "current": current,
+                "timeouts": timeout_stats(),
+                "tenants": FAIR_SCHEDULER.stats() if FAIR_SCHEDULER is not None else {},
+                "llm_cache": LLM_CACHE.stats(),
             })
             REDIS_CONN.zadd(CONSUMER_NAME, heartbeat, now.timestamp())
             logging.info(f"{CONSUMER_NAME} reported heartbeat: {heartbeat}")
 
+            # Keep the messages being worked on from looking stale to the other executors.
+            TASK_CONSUMER.touch()
+
             expired = REDIS_CONN.zcount(CONSUMER_NAME, 0, now.timestamp() - 60 * 30)
             if expired > 0:
                 REDIS_CONN.zpopmin(CONSUMER_NAME, expired)
@@ -1048,9 +1314,9 @@ async def report_status():
         await trio.sleep(30)
 
 
-async def task_manager():
+async def task_manager(redis_msg, task):
     try:
-        await handle_task()
+        await handle_task(redis_msg, task)
     finally:
         task_limiter.release()
 
@@ -1080,11 +1346,27 @@ async def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
+    global CHUNK_POOL
+    if CHUNK_WORKERS > 0:
+        CHUNK_POOL = ChunkPool(CHUNK_WORKERS, f"{CONSUMER_NAME}_chunker", TaskCanceledException)
+
     async with trio.open_nursery() as nursery:
         nursery.start_soon(report_status)
         while not stop_event.is_set():
+            # Fetch as many tasks as there are free slots.
             await task_limiter.acquire()
-            nursery.start_soon(task_manager)
+            slots = 1
+            while True:
+                try:
+                    task_limiter.acquire_nowait()
+                    slots += 1
+                except trio.WouldBlock:
+                    break
+            collected = await collect(slots)
+            for redis_msg, task in collected:
+                nursery.start_soon(task_manager, redis_msg, task)
+            for _ in range(slots - len(collected)):
+                task_limiter.release()
     logging.error("BUG!!! You should not reach here!!!")
 
 if __name__ == "__main__":
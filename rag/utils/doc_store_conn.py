@@ -15,9 +15,20 @@
 #
 
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Iterator
 from dataclasses import dataclass
+import json
+import threading
 import numpy as np
 
+from common.float_utils import get_float
+
+try:
+    import orjson
+except ImportError:  # only makes (de)serialization faster
+    orjson = None
+
 DEFAULT_MATCH_VECTOR_TOPN = 10
 DEFAULT_MATCH_SPARSE_TOPN = 10
 VEC = list | np.ndarray
@@ -260,6 +271,31 @@ class DocStoreConnection(ABC):
     def getAggregation(self, res, fieldnm: str):
         raise NotImplementedError("Not implemented")
 
+    def aggregateMany(self, matchExprs: list[MatchExpr], indexNames: str | list[str], knowledgebaseIds: list[str], fieldnm: str) -> list[list[tuple[str, int]]]:
+        """
+        The aggregation of `fieldnm` over the matches of each of `matchExprs`.
+        Engines able to run several searches in one request override this.
+        """
+        return [self.getAggregation(self.search([], [], {}, [m], OrderByExpr(), 0, 0, indexNames, knowledgebaseIds, [fieldnm]), fieldnm)
+                for m in matchExprs]
+
+    def iterChunks(self, selectFields: list[str], condition: dict, indexName: str, knowledgebaseIds: list[str],
+                   orderBy: OrderByExpr | None = None, batchSize: int = 1024) -> Iterator[dict[str, dict]]:
+        """
+        All the chunks matching `condition`, in batches of `batchSize` shaped like `getFields` results.
+        This pages by offset; engines able to resume a search where the previous page ended override it.
+        """
+        offset = 0
+        while True:
+            res = self.search(selectFields, [], dict(condition), [], orderBy or OrderByExpr(), offset, batchSize,
+                              indexName, knowledgebaseIds)
+            batch = self.getFields(res, selectFields)
+            if batch:
+                yield batch
+            if len(self.getChunkIds(res)) < batchSize:
+                return
+            offset += batchSize
+
     """
     SQL
     """
@@ -269,3 +305,111 @@ class DocStoreConnection(ABC):
         Run the sql generated by text-to-sql
         """
         raise NotImplementedError("Not implemented")
+
+
+class ShardLatency:
+    """
+    Latency of each index/table queried by a scatter-gather search, kept for the most recently used
+    `capacity` shards and reported by the connection's health().
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._shards = OrderedDict()
+
+    def record(self, shard: str, seconds: float | None):
+        """Records one query of `shard`, `seconds` is None when it timed out."""
+        with self._lock:
+            st = self._shards.pop(shard, None) or {"count": 0, "timeouts": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": None}
+            st["count"] += 1
+            if seconds is None:
+                st["timeouts"] += 1
+            else:
+                ms = seconds * 1000
+                st["total_ms"] += ms
+                st["max_ms"] = max(st["max_ms"], ms)
+                st["last_ms"] = ms
+            self._shards[shard] = st
+            while len(self._shards) > self.capacity:
+                self._shards.popitem(last=False)
+
+    def snapshot(self, top: int = 20) -> list[dict]:
+        """The `top` slowest shards by average latency."""
+        with self._lock:
+            rows = []
+            for shard, st in self._shards.items():
+                answered = st["count"] - st["timeouts"]
+                rows.append({"shard": shard, "count": st["count"], "timeouts": st["timeouts"],
+                             "avg_ms": round(st["total_ms"] / answered, 1) if answered else None,
+                             "max_ms": round(st["max_ms"], 1),
+                             "last_ms": None if st["last_ms"] is None else round(st["last_ms"], 1)})
+        rows.sort(key=lambda r: (r["timeouts"], r["avg_ms"] or 0), reverse=True)
+        return rows[:top]
+
+
+"""
+JSON encoding shared by the Elasticsearch and OpenSearch connections
+"""
+
+
+def _json_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_json(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, default=_json_default).encode("utf-8")
+
+
+def loads_json(data: bytes | str):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def bulk_index_lines(documents: list[dict], indexName: str, **fields) -> list[bytes]:
+    """
+    NDJSON lines of a bulk index request, built straight from the chunk dicts: each source is a
+    shallow copy without `id` and with `fields` set. Vectors (`*_vec`) are written as float32,
+    which is how the engines store them, so they are about half the size of float64 text.
+    """
+    lines = []
+    for d in documents:
+        assert "_id" not in d
+        assert "id" in d
+        src = {k: v for k, v in d.items() if k != "id"}
+        src.update(fields)
+        if orjson is not None:
+            for k, v in src.items():
+                if k.endswith("_vec") and isinstance(v, (list, tuple, np.ndarray)):
+                    src[k] = np.asarray(v, dtype=np.float32)
+        lines.append(dumps_json({"index": {"_index": indexName, "_id": d["id"]}}))
+        lines.append(dumps_json(src))
+    return lines
+
+
+def vector_matrix(vectors: list, dim: int) -> np.ndarray:
+    """
+    Stacks the vectors read back from a doc store into a (len(vectors), dim) float32 matrix.
+    Vectors may be float lists or tab separated strings; missing or malformed ones are zero rows.
+    """
+    matrix = np.zeros((len(vectors), dim), dtype=np.float32)
+    for i, v in enumerate(vectors):
+        if v is None or len(v) == 0:
+            continue
+        if isinstance(v, str):
+            try:
+                v = np.array(v.split("\t"), dtype=np.float32)
+            except ValueError:
+                v = np.array([get_float(t) for t in v.split("\t")], dtype=np.float32)
+        if len(v) == dim:
+            matrix[i] = v
+    return matrix
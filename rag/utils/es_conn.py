@@ -23,6 +23,7 @@ import os
 import copy
 from elasticsearch import Elasticsearch, NotFoundError
 from elasticsearch_dsl import UpdateByQuery, Q, Search, Index
+from elasticsearch.serializer import JsonSerializer
 from elastic_transport import ConnectionTimeout
 from rag import settings
 from rag.settings import TAG_FLD, PAGERANK_FLD
@@ -30,15 +31,24 @@ from common.decorator import singleton
 from common.file_utils import get_project_base_directory
 from common.misc_utils import convert_bytes
 from rag.utils.doc_store_conn import DocStoreConnection, MatchExpr, OrderByExpr, MatchTextExpr, MatchDenseExpr, \
-    FusionExpr
+    FusionExpr, bulk_index_lines, loads_json
 from rag.nlp import is_english, rag_tokenizer
 from common.float_utils import get_float
 
 ATTEMPT_TIME = 2
+MSEARCH_BATCH_SIZE = 64
+# How long a point in time iterChunks pages through is kept between two pages.
+ITER_KEEP_ALIVE = "5m"
 
 logger = logging.getLogger('ragflow.es_conn')
 
 
+class _Serializer(JsonSerializer):
+    # Search responses carrying vectors are decoded much faster by orjson when it is installed.
+    def json_loads(self, data: bytes):
+        return loads_json(data)
+
+
 @singleton
 class ESConnection(DocStoreConnection):
     def __init__(self):
@@ -76,6 +86,7 @@ class ESConnection(DocStoreConnection):
             basic_auth=(settings.ES["username"], settings.ES[
                 "password"]) if "username" in settings.ES and "password" in settings.ES else None,
             verify_certs= settings.ES.get("verify_certs", False),
+            serializer=_Serializer(),
             timeout=600 )
         if self.es:
             self.info = self.es.info()
@@ -139,25 +150,8 @@ class ESConnection(DocStoreConnection):
     CRUD operations
     """
 
-    def search(
-            self, selectFields: list[str],
-            highlightFields: list[str],
-            condition: dict,
-            matchExprs: list[MatchExpr],
-            orderBy: OrderByExpr,
-            offset: int,
-            limit: int,
-            indexNames: str | list[str],
-            knowledgebaseIds: list[str],
-            aggFields: list[str] = [],
-            rank_feature: dict | None = None
-    ):
-        """
-        Refers to https://www.elastic.co/guide/en/elasticsearch/reference/current/query-dsl.html
-        """
-        if isinstance(indexNames, str):
-            indexNames = indexNames.split(",")
-        assert isinstance(indexNames, list) and len(indexNames) > 0
+    def _search_body(self, selectFields, highlightFields, condition, matchExprs, orderBy, offset, limit,
+                     knowledgebaseIds, aggFields=[], rank_feature=None) -> dict:
         assert "_id" not in condition
 
         bqry = Q("bool", must=[])
@@ -243,7 +237,29 @@ class ESConnection(DocStoreConnection):
 
         if limit > 0:
             s = s[offset:offset + limit]
-        q = s.to_dict()
+        return s.to_dict()
+
+    def search(
+            self, selectFields: list[str],
+            highlightFields: list[str],
+            condition: dict,
+            matchExprs: list[MatchExpr],
+            orderBy: OrderByExpr,
+            offset: int,
+            limit: int,
+            indexNames: str | list[str],
+            knowledgebaseIds: list[str],
+            aggFields: list[str] = [],
+            rank_feature: dict | None = None
+    ):
+        """
+        Refers to https://www.elastic.co/guide/en/elasticsearch/reference/current/query-dsl.html
+        """
+        if isinstance(indexNames, str):
+            indexNames = indexNames.split(",")
+        assert isinstance(indexNames, list) and len(indexNames) > 0
+        q = self._search_body(selectFields, highlightFields, condition, matchExprs, orderBy, offset, limit,
+                              knowledgebaseIds, aggFields, rank_feature)
         logger.debug(f"ESConnection.search {str(indexNames)} query: " + json.dumps(q))
 
         for i in range(ATTEMPT_TIME):
@@ -270,6 +286,72 @@ class ESConnection(DocStoreConnection):
         logger.error(f"ESConnection.search timeout for {ATTEMPT_TIME} times!")
         raise Exception("ESConnection.search timeout.")
 
+    def aggregateMany(self, matchExprs: list[MatchExpr], indexNames: str | list[str], knowledgebaseIds: list[str], fieldnm: str) -> list[list[tuple[str, int]]]:
+        """
+        Runs the searches with _msearch, MSEARCH_BATCH_SIZE of them per request.
+        """
+        if isinstance(indexNames, str):
+            indexNames = indexNames.split(",")
+        aggs = []
+        for b in range(0, len(matchExprs), MSEARCH_BATCH_SIZE):
+            searches = []
+            for m in matchExprs[b:b + MSEARCH_BATCH_SIZE]:
+                searches.append({"index": indexNames})
+                searches.append(self._search_body([], [], {}, [m], OrderByExpr(), 0, 0, knowledgebaseIds, [fieldnm]))
+            for i in range(ATTEMPT_TIME):
+                try:
+                    res = self.es.msearch(searches=searches)
+                    break
+                except ConnectionTimeout:
+                    logger.exception("ES request timeout")
+                    self._connect()
+                    continue
+            else:
+                raise Exception("ESConnection.aggregateMany timeout.")
+            for r in res["responses"]:
+                if "error" in r:
+                    raise Exception(f"ESConnection.aggregateMany got error: {r['error']}")
+                aggs.append(self.getAggregation(r, fieldnm))
+        return aggs
+
+    def iterChunks(self, selectFields: list[str], condition: dict, indexName: str, knowledgebaseIds: list[str],
+                   orderBy: OrderByExpr | None = None, batchSize: int = 1024):
+        """
+        Pages with search_after through a point in time: deep pages cost what the first does, and chunks
+        indexed or deleted meanwhile don't shift them. Only `selectFields` are fetched.
+        Refers to https://www.elastic.co/guide/en/elasticsearch/reference/current/paginate-search-results.html
+        """
+        q = self._search_body([], [], dict(condition), [], orderBy or OrderByExpr(), 0, 0, knowledgebaseIds)
+        q["sort"] = q.get("sort", []) + ["_shard_doc"]
+        q["size"] = batchSize
+        q["_source"] = selectFields
+        pit_id = self.es.open_point_in_time(index=indexName, keep_alive=ITER_KEEP_ALIVE)["id"]
+        try:
+            while True:
+                q["pit"] = {"id": pit_id, "keep_alive": ITER_KEEP_ALIVE}
+                for i in range(ATTEMPT_TIME):
+                    try:
+                        res = self.es.search(body=q, track_total_hits=False)
+                        break
+                    except ConnectionTimeout:
+                        logger.exception("ES request timeout")
+                        self._connect()
+                else:
+                    raise Exception("ESConnection.iterChunks timeout.")
+                pit_id = res.get("pit_id", pit_id)
+                hits = res["hits"]["hits"]
+                batch = self.getFields(res, selectFields)
+                if batch:
+                    yield batch
+                if len(hits) < batchSize:
+                    return
+                q["search_after"] = hits[-1]["sort"]
+        finally:
+            try:
+                self.es.close_point_in_time(id=pit_id)
+            except Exception:
+                logger.warning(f"ESConnection.iterChunks can't close point in time {pit_id}")
+
     def get(self, chunkId: str, indexName: str, knowledgebaseIds: list[str]) -> dict | None:
         for i in range(ATTEMPT_TIME):
             try:
@@ -290,16 +372,7 @@ class ESConnection(DocStoreConnection):
 
     def insert(self, documents: list[dict], indexName: str, knowledgebaseId: str = None) -> list[str]:
         # Refers to https://www.elastic.co/guide/en/elasticsearch/reference/current/docs-bulk.html
-        operations = []
-        for d in documents:
-            assert "_id" not in d
-            assert "id" in d
-            d_copy = copy.deepcopy(d)
-            d_copy["kb_id"] = knowledgebaseId
-            meta_id = d_copy.pop("id", "")
-            operations.append(
-                {"index": {"_index": indexName, "_id": meta_id}})
-            operations.append(d_copy)
+        operations = bulk_index_lines(documents, indexName, kb_id=knowledgebaseId)
 
         res = []
         for _ in range(ATTEMPT_TIME):
@@ -500,6 +573,9 @@ class ESConnection(DocStoreConnection):
                 if n == "available_int" and isinstance(v, (int, float)):
                     m[n] = v
                     continue
+                if n == TAG_FLD and isinstance(v, dict):
+                    m[n] = v
+                    continue
                 if not isinstance(v, str):
                     m[n] = str(m[n])
                 # if n.find("tks") > 0:
@@ -0,0 +1,209 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Per-tenant fair scheduling of the parsing tasks.
+
+With FAIR_SCHEDULING on, the normal priority tasks of a tenant are queued on a stream of its own instead of
+the shared one, and the tenant is recorded in a sorted set of active tenants. Task executors pick from those
+streams by deficit round robin, so a tenant with 10,000 queued documents gets its share of the executors,
+weighted by the `ResourceQuota` of its plan, but can't hold back the others. High priority tasks and the tasks
+of the shared queue keep being served first and as one more tenant respectively.
+
+Plans are set per RAGFlow tenant through the admin API (`PUT /api/v1/admin/users/<email>/plan`); tenants
+without one weigh as the default quota.
+"""
+import logging
+import os
+import threading
+import time
+
+from api.multi_tenancy import ResourceQuota, SubscriptionPlan
+from rag.settings import SVR_QUEUE_NAME, get_svr_queue_name
+from rag.utils.redis_conn import REDIS_CONN
+
+FAIR_SCHEDULING = int(os.environ.get("FAIR_SCHEDULING", "0"))
+# Tenants that queued nothing and had nothing left to parse for that long are forgotten.
+TENANT_QUEUE_IDLE = int(os.environ.get("TENANT_QUEUE_IDLE", str(24 * 3600)))
+
+ACTIVE_TENANTS_KEY = f"{SVR_QUEUE_NAME}_tenants"
+TENANT_PLAN_KEY_PREFIX = "ragflow_tenant_plan_"
+# The shared normal priority queue takes part in the round robin under this name.
+SHARED_QUEUE_TENANT = ""
+
+
+def tenant_queue_name(tenant_id: str) -> str:
+    if tenant_id == SHARED_QUEUE_TENANT:
+        return get_svr_queue_name(0)
+    return f"{SVR_QUEUE_NAME}_tenant_{tenant_id}"
+
+
+def queue_svr_tasks(messages: list[dict], priority: int, tenant_id: str | None = None) -> bool:
+    """Queue parsing tasks, on the tenant's own queue if fair scheduling is on and the priority is normal."""
+    if FAIR_SCHEDULING and priority == 0 and tenant_id:
+        queue_name = tenant_queue_name(tenant_id)
+        if messages and not REDIS_CONN.zadd(ACTIVE_TENANTS_KEY, tenant_id, time.time()):
+            return False
+    else:
+        queue_name = get_svr_queue_name(priority)
+    for message in messages:
+        if not REDIS_CONN.queue_product(queue_name, message=message):
+            return False
+    return True
+
+
+def publish_tenant_plan(tenant_id: str, plan: SubscriptionPlan) -> bool:
+    """Make the plan of a tenant, and so its scheduling weight, known to the task executors."""
+    return REDIS_CONN.set(TENANT_PLAN_KEY_PREFIX + tenant_id, plan.value, None)
+
+
+def plan_weight(plan: str | None) -> float:
+    try:
+        return ResourceQuota.from_plan(SubscriptionPlan(plan)).scheduling_weight
+    except ValueError:
+        return ResourceQuota().scheduling_weight
+
+
+class FairScheduler:
+    """
+    Deficit round robin over the queues of the active tenants, for one task executor.
+
+    Visiting a tenant credits it with its weight and each task taken from its queue costs 1; the visit ends
+    when its credit falls below 1 or its queue is empty, which also clears the credit. The position in the
+    round and the credits carry over from one `fetch` to the next, so weights hold however few slots an
+    executor has free at a time.
+    """
+
+    def __init__(self, group_name: str, consumer_name: str, refresh_interval: float = 2):
+        self._group_name = group_name
+        self._consumer_name = consumer_name
+        self._refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._tenants = []
+        self._weights = {}
+        self._refreshed_at = 0
+        self._groups = set()
+        self._order = []
+        self._pos = 0
+        self._credits = {}
+        self._stats = {}
+
+    def _refresh(self):
+        now = time.time()
+        if now - self._refreshed_at < self._refresh_interval:
+            return
+        self._refreshed_at = now
+        tenants = REDIS_CONN.zrangebyscore(ACTIVE_TENANTS_KEY, now - TENANT_QUEUE_IDLE, "+inf")
+        if tenants is None:
+            return
+        self._tenants = [SHARED_QUEUE_TENANT] + [t for t in tenants if t != SHARED_QUEUE_TENANT]
+        plans = REDIS_CONN.mget([TENANT_PLAN_KEY_PREFIX + t for t in self._tenants[1:]])
+        self._weights = {t: plan_weight(p) for t, p in zip(self._tenants[1:], plans)}
+        self._weights[SHARED_QUEUE_TENANT] = ResourceQuota().scheduling_weight
+        # Forget the stats of the tenants gone idle.
+        for tenant_id in set(self._stats) - set(self._tenants):
+            del self._stats[tenant_id]
+        for tenant_id in self._tenants:
+            queue_name = tenant_queue_name(tenant_id)
+            if queue_name not in self._groups and REDIS_CONN.queue_create_group(queue_name, self._group_name):
+                self._groups.add(queue_name)
+
+    def queue_names(self) -> list[str]:
+        """The queues of the tenants seen active, the shared normal priority queue included."""
+        with self._lock:
+            self._refresh()
+            return [tenant_queue_name(t) for t in self._tenants]
+
+    def _allot(self, count: int, backlog: dict) -> dict:
+        active = set(t for t, n in backlog.items() if n > 0)
+        self._order = [t for t in self._order if t in active] + [t for t in backlog if t in active and t not in self._order]
+        for tenant_id in list(self._credits.keys()):
+            if tenant_id not in active:
+                del self._credits[tenant_id]
+        allotted = {}
+        if not self._order:
+            return allotted
+        self._pos %= len(self._order)
+        while count > 0 and any(allotted.get(t, 0) < backlog[t] for t in self._order):
+            tenant_id = self._order[self._pos]
+            credit = self._credits.get(tenant_id, 0)
+            if credit >= 1 and allotted.get(tenant_id, 0) < backlog[tenant_id]:
+                allotted[tenant_id] = allotted.get(tenant_id, 0) + 1
+                self._credits[tenant_id] = credit - 1
+                count -= 1
+                continue
+            if allotted.get(tenant_id, 0) >= backlog[tenant_id]:
+                self._credits[tenant_id] = 0
+            self._pos = (self._pos + 1) % len(self._order)
+            next_tenant = self._order[self._pos]
+            self._credits[next_tenant] = self._credits.get(next_tenant, 0) + self._weights.get(next_tenant, 1)
+        return allotted
+
+    def fetch(self, count: int) -> list:
+        """Up to `count` new messages from the tenants' queues, shared by deficit round robin. Doesn't wait."""
+        with self._lock:
+            self._refresh()
+            queue_names = {t: tenant_queue_name(t) for t in self._tenants}
+            lags = REDIS_CONN.queue_lags(list(queue_names.values()), self._group_name)
+            # An unknown lag is worth a try.
+            backlog = {t: count if lags.get(q) is None else int(lags[q]) for t, q in queue_names.items()}
+            busy = [t for t, n in backlog.items() if n > 0 and t != SHARED_QUEUE_TENANT]
+            if busy:
+                # Keep the tenants with work left from being forgotten.
+                with REDIS_CONN.pipeline(raise_on_error=False) as pipe:
+                    pipe.zadd(ACTIVE_TENANTS_KEY, {t: time.time() for t in busy})
+                    pipe.zremrangebyscore(ACTIVE_TENANTS_KEY, 0, time.time() - TENANT_QUEUE_IDLE)
+            allotted = self._allot(count, backlog)
+            msgs = REDIS_CONN.queue_consumer_many({queue_names[t]: n for t, n in allotted.items()},
+                                                  self._group_name, self._consumer_name)
+            self._record(backlog, msgs)
+            return msgs
+
+    def _record(self, backlog: dict, msgs: list):
+        now_ms = time.time() * 1000
+        tenant_of = {tenant_queue_name(t): t for t in backlog}
+        for tenant_id, n in backlog.items():
+            stat = self._stats.setdefault(tenant_id, {"depth": 0, "dispatched": 0, "wait_total_s": 0.0, "max_wait_s": 0.0})
+            stat["depth"] = n
+        for msg in msgs:
+            tenant_id = tenant_of.get(msg.get_queue_name())
+            if tenant_id is None:
+                continue
+            try:
+                # Stream ids start with the time the message was added, in milliseconds.
+                wait = max(now_ms - int(str(msg.get_msg_id()).split("-")[0]), 0) / 1000
+            except ValueError:
+                logging.warning(f"FairScheduler can't tell the wait of message {msg.get_msg_id()}")
+                continue
+            stat = self._stats[tenant_id]
+            stat["depth"] = max(stat["depth"] - 1, 0)
+            stat["dispatched"] += 1
+            stat["wait_total_s"] += wait
+            stat["max_wait_s"] = max(stat["max_wait_s"], wait)
+
+    def stats(self, top: int = 20) -> dict:
+        """Queue depth and wait of the tasks dispatched by this executor, for the tenants with the deepest queues."""
+        with self._lock:
+            stats = sorted(self._stats.items(), key=lambda kv: (-kv[1]["depth"], -kv[1]["dispatched"]))[:top]
+            return {
+                tenant_id or "shared": {
+                    "depth": s["depth"],
+                    "weight": self._weights.get(tenant_id, 1),
+                    "dispatched": s["dispatched"],
+                    "avg_wait_s": round(s["wait_total_s"] / s["dispatched"], 3) if s["dispatched"] else 0,
+                    "max_wait_s": round(s["max_wait_s"], 3),
+                }
+                for tenant_id, s in stats
+            }
@@ -20,6 +20,8 @@ import re
 import json
 import time
 import copy
+import heapq
+from concurrent.futures import ThreadPoolExecutor, wait
 import infinity
 from infinity.common import ConflictType, InfinityException, SortType
 from infinity.index import IndexInfo, IndexType
@@ -39,10 +41,18 @@ from rag.utils.doc_store_conn import (
     MatchDenseExpr,
     FusionExpr,
     OrderByExpr,
+    ShardLatency,
 )
 
 logger = logging.getLogger("ragflow.infinity_conn")
 
+# Tables of a search are queried concurrently by up to INFINITY_SEARCH_WORKERS threads, a table
+# answering later than INFINITY_SHARD_TIMEOUT seconds is left out of the results.
+INFINITY_SEARCH_WORKERS = int(os.environ.get("INFINITY_SEARCH_WORKERS", 8))
+INFINITY_SHARD_TIMEOUT = float(os.environ.get("INFINITY_SHARD_TIMEOUT", 30))
+# Chunk ids listed per query by iterChunks.
+INFINITY_ITER_ID_PAGE = 10000
+
 
 def field_keyword(field_name: str):
     # The "docnm_kwd" field is always a string, not list.
@@ -127,6 +137,23 @@ def concat_dataframes(df_list: list[pd.DataFrame], selectFields: list[str]) -> p
     return pd.DataFrame(columns=schema)
 
 
+def merge_top_k(df_list: list[pd.DataFrame], score_column: str, limit: int) -> pd.DataFrame:
+    """
+    Merges per-table results into the `limit` best rows by score plus pagerank, without
+    concatenating the tables: only the selected rows are gathered into the result.
+    """
+    candidates = []
+    for t, df in enumerate(df_list):
+        scores = (df[score_column] + df[PAGERANK_FLD]).tolist()
+        candidates.extend((sc, t, r) for r, sc in enumerate(scores))
+    # NaN scores go last, ties keep the table order.
+    top = heapq.nlargest(limit, candidates, key=lambda c: (c[0] == c[0], c[0]))
+    columns = list(dict.fromkeys(col for df in df_list for col in df.columns))
+    data = {col: [df_list[t][col].iat[r] if col in df_list[t] else None for _, t, r in top] for col in columns}
+    data["_score"] = [sc for sc, _, _ in top]
+    return pd.DataFrame(data)
+
+
 @singleton
 class InfinityConnection(DocStoreConnection):
     def __init__(self):
@@ -157,6 +184,8 @@ class InfinityConnection(DocStoreConnection):
             msg = f"Infinity {infinity_uri} is unhealthy in 120s."
             logger.error(msg)
             raise Exception(msg)
+        self.searchPool = ThreadPoolExecutor(max_workers=INFINITY_SEARCH_WORKERS, thread_name_prefix="infinity_search")
+        self.shardLatency = ShardLatency()
         logger.info(f"Infinity {infinity_uri} is healthy.")
 
     def _migrate_db(self, inf_conn):
@@ -206,6 +235,7 @@ class InfinityConnection(DocStoreConnection):
             "type": "infinity",
             "status": "green" if res.error_code == 0 and res.server_status in ["started", "alive"] else "red",
             "error": res.error_msg,
+            "shards": self.shardLatency.snapshot(),
         }
         return res2
 
@@ -253,6 +283,7 @@ class InfinityConnection(DocStoreConnection):
             )
         self.connPool.release_conn(inf_conn)
         logger.info(f"INFINITY created table {table_name}, vector size {vectorSize}")
+        return True
 
     def deleteIdx(self, indexName: str, knowledgebaseId: str):
         table_name = f"{indexName}_{knowledgebaseId}"
@@ -300,8 +331,6 @@ class InfinityConnection(DocStoreConnection):
         assert isinstance(indexNames, list) and len(indexNames) > 0
         inf_conn = self.connPool.get_conn()
         db_instance = inf_conn.get_database(self.dbName)
-        df_list = list()
-        table_list = list()
         output = selectFields.copy()
         for essential_field in ["id"] + aggFields:
             if essential_field not in output:
@@ -399,58 +428,124 @@ class InfinityConnection(DocStoreConnection):
                 else:
                     order_by_expr_list.append((order_field[0], SortType.Desc))
 
-        total_hits_count = 0
         # Scatter search tables and gather the results
-        for indexName in indexNames:
-            for knowledgebaseId in knowledgebaseIds:
-                table_name = f"{indexName}_{knowledgebaseId}"
-                try:
-                    table_instance = db_instance.get_table(table_name)
-                except Exception:
-                    continue
-                table_list.append(table_name)
-                builder = table_instance.output(output)
-                if len(matchExprs) > 0:
-                    for matchExpr in matchExprs:
-                        if isinstance(matchExpr, MatchTextExpr):
-                            fields = ",".join(matchExpr.fields)
-                            builder = builder.match_text(
-                                fields,
-                                matchExpr.matching_text,
-                                matchExpr.topn,
-                                matchExpr.extra_options.copy(),
-                            )
-                        elif isinstance(matchExpr, MatchDenseExpr):
-                            builder = builder.match_dense(
-                                matchExpr.vector_column_name,
-                                matchExpr.embedding_data,
-                                matchExpr.embedding_data_type,
-                                matchExpr.distance_type,
-                                matchExpr.topn,
-                                matchExpr.extra_options.copy(),
-                            )
-                        elif isinstance(matchExpr, FusionExpr):
-                            builder = builder.fusion(matchExpr.method, matchExpr.topn, matchExpr.fusion_params)
-                else:
-                    if filter_cond and len(filter_cond) > 0:
-                        builder.filter(filter_cond)
-                if orderBy.fields:
-                    builder.sort(order_by_expr_list)
-                builder.offset(offset).limit(limit)
-                kb_res, extra_result = builder.option({"total_hits_count": True}).to_df()
-                if extra_result:
-                    total_hits_count += int(extra_result["total_hits_count"])
-                logger.debug(f"INFINITY search table: {str(table_name)}, result: {str(kb_res)}")
-                df_list.append(kb_res)
         self.connPool.release_conn(inf_conn)
-        res = concat_dataframes(df_list, output)
-        if matchExprs:
-            res["_score"] = res[score_column] + res[PAGERANK_FLD]
-            res = res.sort_values(by="_score", ascending=False).reset_index(drop=True)
-            res = res.head(limit)
+        table_names = [f"{indexName}_{knowledgebaseId}" for indexName in indexNames for knowledgebaseId in knowledgebaseIds]
+        futures = [self.searchPool.submit(self._search_table, table_name, output, matchExprs, filter_cond, order_by_expr_list, offset, limit)
+                   for table_name in table_names]
+        _, not_done = wait(futures, timeout=INFINITY_SHARD_TIMEOUT)
+        total_hits_count = 0
+        df_list = list()
+        for table_name, future in zip(table_names, futures):
+            if future in not_done:
+                future.cancel()
+                self.shardLatency.record(table_name, None)
+                logger.warning(f"INFINITY search table: {table_name} timed out after {INFINITY_SHARD_TIMEOUT}s, left out of the results.")
+                continue
+            kb_res, hits_count = future.result()
+            if kb_res is None:
+                continue
+            total_hits_count += hits_count
+            df_list.append(kb_res)
+        if matchExprs and any(not df.empty for df in df_list):
+            res = merge_top_k([df for df in df_list if not df.empty], score_column, limit)
+        else:
+            res = concat_dataframes(df_list, output)
+            if matchExprs:
+                res["_score"] = res[score_column] + res[PAGERANK_FLD]
         logger.debug(f"INFINITY search final result: {str(res)}")
         return res, total_hits_count
 
+    def _search_table(self, table_name, output, matchExprs, filter_cond, order_by_expr_list, offset, limit):
+        """
+        Runs a search on one table with its own connection.
+        Returns (result, total hits count), or (None, 0) if the table doesn't exist.
+        """
+        st = time.perf_counter()
+        inf_conn = self.connPool.get_conn()
+        try:
+            db_instance = inf_conn.get_database(self.dbName)
+            try:
+                table_instance = db_instance.get_table(table_name)
+            except Exception:
+                return None, 0
+            builder = table_instance.output(output)
+            if len(matchExprs) > 0:
+                for matchExpr in matchExprs:
+                    if isinstance(matchExpr, MatchTextExpr):
+                        fields = ",".join(matchExpr.fields)
+                        builder = builder.match_text(
+                            fields,
+                            matchExpr.matching_text,
+                            matchExpr.topn,
+                            matchExpr.extra_options.copy(),
+                        )
+                    elif isinstance(matchExpr, MatchDenseExpr):
+                        builder = builder.match_dense(
+                            matchExpr.vector_column_name,
+                            matchExpr.embedding_data,
+                            matchExpr.embedding_data_type,
+                            matchExpr.distance_type,
+                            matchExpr.topn,
+                            matchExpr.extra_options.copy(),
+                        )
+                    elif isinstance(matchExpr, FusionExpr):
+                        builder = builder.fusion(matchExpr.method, matchExpr.topn, matchExpr.fusion_params)
+            else:
+                if filter_cond and len(filter_cond) > 0:
+                    builder.filter(filter_cond)
+            if order_by_expr_list:
+                builder.sort(order_by_expr_list)
+            builder.offset(offset).limit(limit)
+            kb_res, extra_result = builder.option({"total_hits_count": True}).to_df()
+            logger.debug(f"INFINITY search table: {str(table_name)}, result: {str(kb_res)}")
+            self.shardLatency.record(table_name, time.perf_counter() - st)
+            return kb_res, int(extra_result["total_hits_count"]) if extra_result else 0
+        finally:
+            self.connPool.release_conn(inf_conn)
+
+    def iterChunks(self, selectFields: list[str], condition: dict, indexName: str, knowledgebaseIds: list[str],
+                   orderBy: OrderByExpr | None = None, batchSize: int = 1024):
+        """
+        Infinity has no search_after: the ids of the matching chunks of a table are listed in order first,
+        which only reads the id and sort columns, then the selected fields are fetched by ids, a batch at a time.
+        """
+        order_by_expr_list = [(f, SortType.Asc if o == 0 else SortType.Desc) for f, o in (orderBy.fields if orderBy else [])]
+        if "id" not in [f for f, _ in order_by_expr_list]:
+            order_by_expr_list.append(("id", SortType.Asc))
+        output = [f for f in selectFields if f != "id"] + ["id"]
+        for knowledgebaseId in knowledgebaseIds:
+            table_name = f"{indexName}_{knowledgebaseId}"
+            inf_conn = self.connPool.get_conn()
+            try:
+                try:
+                    table_instance = inf_conn.get_database(self.dbName).get_table(table_name)
+                except Exception:
+                    continue
+                filter_cond = equivalent_condition_to_str(condition, table_instance)
+                ids = []
+                while True:
+                    df, _ = table_instance.output(["id"]).filter(filter_cond).sort(order_by_expr_list) \
+                        .offset(len(ids)).limit(INFINITY_ITER_ID_PAGE).to_df()
+                    ids.extend(df["id"].tolist())
+                    if len(df) < INFINITY_ITER_ID_PAGE:
+                        break
+            finally:
+                self.connPool.release_conn(inf_conn)
+            for b in range(0, len(ids), batchSize):
+                batch_ids = ids[b:b + batchSize]
+                id_list = ", ".join("'{}'".format(i.replace("'", "''")) for i in batch_ids)
+                inf_conn = self.connPool.get_conn()
+                try:
+                    table_instance = inf_conn.get_database(self.dbName).get_table(table_name)
+                    df, _ = table_instance.output(output).filter(f"id IN ({id_list})").to_df()
+                finally:
+                    self.connPool.release_conn(inf_conn)
+                chunks = self.getFields(df, selectFields)
+                batch = {i: chunks[i] for i in batch_ids if i in chunks}
+                if batch:
+                    yield batch
+
     def get(self, chunkId: str, indexName: str, knowledgebaseIds: list[str]) -> dict | None:
         inf_conn = self.connPool.get_conn()
         db_instance = inf_conn.get_database(self.dbName)
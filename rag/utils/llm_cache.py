@@ -0,0 +1,188 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Cache of LLM responses, shared by GraphRAG and RAPTOR extraction and the chunk enrichments.
+
+Responses are looked up in a byte-bounded LRU of the process first, then in Redis. In Redis, responses longer
+than LLM_CACHE_COMPRESS_MIN bytes are stored compressed, base85 encoded since the connection decodes replies,
+behind a NUL marker no response starts with; anything else is the response as is, which is also how the
+entries written before compression read. Each use case has its own TTL and responses over
+LLM_CACHE_MAX_VALUE_BYTES once compressed stay out of Redis.
+"""
+import base64
+import logging
+import os
+import threading
+import time
+import zlib
+
+import xxhash
+from cachetools import LRUCache
+
+from rag.utils.redis_conn import REDIS_CONN
+
+try:
+    import zstandard
+except ImportError:  # zlib is used instead, it only compresses less
+    zstandard = None
+
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_TTLS = {
+    "extraction": int(os.environ.get("LLM_CACHE_TTL_EXTRACTION", str(LLM_CACHE_TTL))),
+    "enrichment": int(os.environ.get("LLM_CACHE_TTL_ENRICHMENT", str(LLM_CACHE_TTL))),
+}
+# Responses kept in the process, in bytes; 0 goes straight to Redis.
+LLM_CACHE_LOCAL_BYTES = int(os.environ.get("LLM_CACHE_LOCAL_BYTES", str(64 * 1024 * 1024)))
+# How long a response is trusted in the process, since Redis may have expired it.
+LLM_CACHE_LOCAL_TTL = int(os.environ.get("LLM_CACHE_LOCAL_TTL", "600"))
+LLM_CACHE_COMPRESS_MIN = int(os.environ.get("LLM_CACHE_COMPRESS_MIN", "512"))
+LLM_CACHE_MAX_VALUE_BYTES = int(os.environ.get("LLM_CACHE_MAX_VALUE_BYTES", str(1024 * 1024)))
+
+_ZSTD = "\x00z"
+_ZLIB = "\x00d"
+
+
+def llm_cache_key(llmnm, txt, history, genconf) -> str:
+    hasher = xxhash.xxh64()
+    hasher.update((str(llmnm) + str(txt) + str(history) + str(genconf)).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def encode_value(v: str) -> str:
+    raw = v.encode("utf-8")
+    if len(raw) < LLM_CACHE_COMPRESS_MIN:
+        return v
+    if zstandard is not None:
+        encoded = _ZSTD + base64.b85encode(zstandard.ZstdCompressor(level=3).compress(raw)).decode("ascii")
+    else:
+        encoded = _ZLIB + base64.b85encode(zlib.compress(raw, 6)).decode("ascii")
+    return encoded if len(encoded) < len(raw) else v
+
+
+def decode_value(v: str) -> str:
+    if v.startswith(_ZSTD):
+        if zstandard is None:
+            raise ValueError("LLM cache entry is zstd compressed, zstandard isn't installed")
+        return zstandard.ZstdDecompressor().decompress(base64.b85decode(v[len(_ZSTD):])).decode("utf-8")
+    if v.startswith(_ZLIB):
+        return zlib.decompress(base64.b85decode(v[len(_ZLIB):])).decode("utf-8")
+    return v
+
+
+class LLMCache:
+    def __init__(self, local_bytes: int = LLM_CACHE_LOCAL_BYTES, local_ttl: int = LLM_CACHE_LOCAL_TTL):
+        self._local_ttl = local_ttl
+        self._local = LRUCache(maxsize=local_bytes, getsizeof=lambda e: len(e[1])) if local_bytes > 0 else None
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "sets": 0,
+                       "bytes_set": 0, "bytes_stored": 0, "bytes_served_locally": 0, "too_large": 0}
+
+    def _count(self, **counts):
+        with self._lock:
+            for k, n in counts.items():
+                self._stats[k] += n
+
+    def _get_local(self, key):
+        if self._local is None:
+            return None
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._local.pop(key, None)
+                return None
+            return entry[1]
+
+    def _set_local(self, key, v, ttl):
+        if self._local is None or len(v) > self._local.maxsize:
+            return
+        with self._lock:
+            self._local[key] = (time.time() + min(ttl, self._local_ttl), v)
+
+    def _decode(self, key, stored, ttl):
+        try:
+            v = decode_value(stored)
+        except Exception:
+            logging.exception(f"LLM cache entry {key} can't be decoded")
+            return None
+        self._set_local(key, v, ttl)
+        return v
+
+    def get(self, key: str, use_case: str | None = None):
+        v = self._get_local(key)
+        if v is not None:
+            self._count(local_hits=1, bytes_served_locally=len(v))
+            return v
+        stored = REDIS_CONN.get(key)
+        v = self._decode(key, stored, LLM_CACHE_TTLS.get(use_case, LLM_CACHE_TTL)) if stored else None
+        if v is None:
+            self._count(misses=1)
+        else:
+            self._count(redis_hits=1)
+        return v
+
+    def get_many(self, keys: list[str], use_case: str | None = None) -> list:
+        """`get` of every key, with a single round trip to Redis for the ones not in the process."""
+        values = [self._get_local(k) for k in keys]
+        self._count(local_hits=sum(1 for v in values if v is not None),
+                    bytes_served_locally=sum(len(v) for v in values if v is not None))
+        missing = [i for i, v in enumerate(values) if v is None]
+        if not missing:
+            return values
+        ttl = LLM_CACHE_TTLS.get(use_case, LLM_CACHE_TTL)
+        stored = REDIS_CONN.mget([keys[i] for i in missing])
+        for i, s in zip(missing, stored):
+            if s:
+                values[i] = self._decode(keys[i], s, ttl)
+        hits = sum(1 for i in missing if values[i] is not None)
+        self._count(redis_hits=hits, misses=len(missing) - hits)
+        return values
+
+    def _encode(self, key, v, ttl):
+        self._set_local(key, v, ttl)
+        encoded = encode_value(v)
+        if len(encoded) > LLM_CACHE_MAX_VALUE_BYTES:
+            self._count(sets=1, too_large=1)
+            return None
+        self._count(sets=1, bytes_set=len(v.encode("utf-8")), bytes_stored=len(encoded))
+        return encoded
+
+    def set(self, key: str, v: str, use_case: str | None = None):
+        ttl = LLM_CACHE_TTLS.get(use_case, LLM_CACHE_TTL)
+        encoded = self._encode(key, v, ttl)
+        if encoded is not None:
+            REDIS_CONN.set(key, encoded, ttl)
+
+    def set_many(self, mapping: dict, use_case: str | None = None):
+        """`set` of every key and value of `mapping`, in a single round trip to Redis."""
+        ttl = LLM_CACHE_TTLS.get(use_case, LLM_CACHE_TTL)
+        encoded = {k: self._encode(k, v, ttl) for k, v in mapping.items()}
+        REDIS_CONN.mset_with_ttl({k: e for k, e in encoded.items() if e is not None}, ttl)
+
+    def stats(self) -> dict:
+        """Hit rate of each tier and the bytes compression and the local tier kept off Redis, for this process."""
+        with self._lock:
+            s = dict(self._stats)
+            s["local_bytes"] = self._local.currsize if self._local is not None else 0
+        lookups = s["local_hits"] + s["redis_hits"] + s["misses"]
+        s["hit_rate"] = round((s["local_hits"] + s["redis_hits"]) / lookups, 3) if lookups else 0
+        s["local_hit_rate"] = round(s["local_hits"] / lookups, 3) if lookups else 0
+        s["bytes_saved"] = s["bytes_set"] - s["bytes_stored"] + s["bytes_served_locally"]
+        return s
+
+
+LLM_CACHE = LLMCache()
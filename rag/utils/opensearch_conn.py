@@ -23,13 +23,13 @@ import os
 import copy
 from opensearchpy import OpenSearch, NotFoundError
 from opensearchpy import UpdateByQuery, Q, Search, Index
-from opensearchpy import ConnectionTimeout
+from opensearchpy import ConnectionTimeout, JSONSerializer
 from rag import settings
 from rag.settings import TAG_FLD, PAGERANK_FLD
 from common.decorator import singleton
 from common.file_utils import get_project_base_directory
 from rag.utils.doc_store_conn import DocStoreConnection, MatchExpr, OrderByExpr, MatchTextExpr, MatchDenseExpr, \
-    FusionExpr
+    FusionExpr, bulk_index_lines, loads_json
 from rag.nlp import is_english, rag_tokenizer
 
 ATTEMPT_TIME = 2
@@ -37,6 +37,12 @@ ATTEMPT_TIME = 2
 logger = logging.getLogger('ragflow.opensearch_conn')
 
 
+class _Serializer(JSONSerializer):
+    # Search responses carrying vectors are decoded much faster by orjson when it is installed.
+    def loads(self, s):
+        return loads_json(s)
+
+
 @singleton
 class OSConnection(DocStoreConnection):
     def __init__(self):
@@ -49,6 +55,7 @@ class OSConnection(DocStoreConnection):
                     http_auth=(settings.OS["username"], settings.OS[
                         "password"]) if "username" in settings.OS and "password" in settings.OS else None,
                     verify_certs=False,
+                    serializer=_Serializer(),
                     timeout=600
                 )
                 if self.os:
@@ -287,15 +294,7 @@ class OSConnection(DocStoreConnection):
 
     def insert(self, documents: list[dict], indexName: str, knowledgebaseId: str = None) -> list[str]:
         # Refers to https://opensearch.org/docs/latest/api-reference/document-apis/bulk/
-        operations = []
-        for d in documents:
-            assert "_id" not in d
-            assert "id" in d
-            d_copy = copy.deepcopy(d)
-            meta_id = d_copy.pop("id", "")
-            operations.append(
-                {"index": {"_index": indexName, "_id": meta_id}})
-            operations.append(d_copy)
+        operations = b"\n".join(bulk_index_lines(documents, indexName))
 
         res = []
         for _ in range(ATTEMPT_TIME):
@@ -481,6 +480,9 @@ class OSConnection(DocStoreConnection):
                 if isinstance(v, list):
                     m[n] = v
                     continue
+                if n == TAG_FLD and isinstance(v, dict):
+                    m[n] = v
+                    continue
                 if not isinstance(v, str):
                     m[n] = str(m[n])
                 # if n.find("tks") > 0:
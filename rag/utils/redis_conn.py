@@ -16,14 +16,25 @@
 
 import logging
 import json
+import os
+import threading
+import time
 import uuid
+from contextlib import contextmanager
 
 import valkey as redis
 from rag import settings
 from common.decorator import singleton
+from valkey.backoff import ExponentialBackoff
 from valkey.lock import Lock
+from valkey.retry import Retry
 import trio
 
+# Connections shared by all threads of a process; a thread waits up to REDIS_POOL_TIMEOUT seconds for a free one.
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "64"))
+REDIS_POOL_TIMEOUT = int(os.environ.get("REDIS_POOL_TIMEOUT", "20"))
+REDIS_RECONNECT_BACKOFF_MAX = float(os.environ.get("REDIS_RECONNECT_BACKOFF_MAX", "30"))
+
 class RedisMsg:
     def __init__(self, consumer, queue_name, group_name, msg_id, message):
         self.__consumer = consumer
@@ -46,6 +57,59 @@ class RedisMsg:
     def get_msg_id(self):
         return self.__msg_id
 
+    def get_queue_name(self):
+        return self.__queue_name
+
+
+class CommandStats:
+    """
+    Call count, error count and latency of every Redis command issued by a process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, command: str, seconds: float, failed: bool = False):
+        with self._lock:
+            stat = self._stats.get(command)
+            if stat is None:
+                stat = self._stats[command] = [0, 0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += int(failed)
+            stat[2] += seconds
+            stat[3] = max(stat[3], seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                command: {
+                    "calls": calls,
+                    "errors": errors,
+                    "avg_ms": round(total * 1000 / calls, 3),
+                    "max_ms": round(slowest * 1000, 3),
+                }
+                for command, (calls, errors, total, slowest) in sorted(self._stats.items())
+            }
+
+
+class _TimedRedis(redis.StrictRedis):
+    """StrictRedis that records the latency of each command it sends."""
+
+    def __init__(self, *args, command_stats: CommandStats, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.command_stats = command_stats
+
+    def execute_command(self, *args, **options):
+        st = time.perf_counter()
+        failed = True
+        try:
+            res = super().execute_command(*args, **options)
+            failed = False
+            return res
+        finally:
+            self.command_stats.record(str(args[0]).upper(), time.perf_counter() - st, failed)
+
 
 @singleton
 class RedisDB:
@@ -62,6 +126,10 @@ class RedisDB:
     def __init__(self):
         self.REDIS = None
         self.config = settings.REDIS
+        self.command_stats = CommandStats()
+        self._reconnect_lock = threading.Lock()
+        self._reconnect_at = 0.0
+        self._reconnect_backoff = 0.5
         self.__open__()
 
     def register_scripts(self) -> None:
@@ -81,13 +149,46 @@ class RedisDB:
             if password:
                 conn_params["password"] = password
 
-            self.REDIS = redis.StrictRedis(**conn_params)
+            # One pool sized for every thread of the process; transient connection errors are retried
+            # by the client with exponential backoff before a call gives up.
+            pool = redis.BlockingConnectionPool(
+                max_connections=int(self.config.get("max_connections", REDIS_MAX_CONNECTIONS)),
+                timeout=REDIS_POOL_TIMEOUT,
+                health_check_interval=30,
+                retry=Retry(ExponentialBackoff(cap=2, base=0.05), 3),
+                retry_on_error=[redis.exceptions.ConnectionError, redis.exceptions.TimeoutError],
+                **conn_params,
+            )
+            self.REDIS = _TimedRedis(connection_pool=pool, command_stats=self.command_stats)
 
             self.register_scripts()
         except Exception as e:
             logging.warning(f"Redis can't be connected. Error: {str(e)}")
         return self.REDIS
 
+    def _reconnect(self):
+        """
+        Drop the connections of the pool after a failed call so that the next commands reconnect.
+        Attempts are spaced by an exponential backoff so that a Redis outage doesn't turn every failed
+        call of every thread into a reconnection.
+        """
+        with self._reconnect_lock:
+            now = time.monotonic()
+            if now < self._reconnect_at:
+                return self.REDIS
+            self._reconnect_at = now + self._reconnect_backoff
+            self._reconnect_backoff = min(self._reconnect_backoff * 2, REDIS_RECONNECT_BACKOFF_MAX)
+        if self.REDIS is None:
+            return self.__open__()
+        try:
+            self.REDIS.connection_pool.disconnect()
+            self.REDIS.ping()
+            with self._reconnect_lock:
+                self._reconnect_backoff = 0.5
+        except Exception as e:
+            logging.warning(f"Redis can't be reconnected. Error: {str(e)}")
+        return self.REDIS
+
     def health(self):
         self.REDIS.ping()
         a, b = "xx", "yy"
@@ -107,9 +208,14 @@ class RedisDB:
             'connected_clients': info["connected_clients"],
             'blocked_clients': info["blocked_clients"],
             'instantaneous_ops_per_sec': info["instantaneous_ops_per_sec"],
-            'total_commands_processed': info["total_commands_processed"]
+            'total_commands_processed': info["total_commands_processed"],
+            'commands': self.latency_stats(),
         }
 
+    def latency_stats(self) -> dict:
+        """Calls, errors and latency per command sent by this process."""
+        return self.command_stats.snapshot()
+
     def is_alive(self):
         return self.REDIS is not None
 
@@ -120,7 +226,7 @@ class RedisDB:
             return self.REDIS.exists(k)
         except Exception as e:
             logging.warning("RedisDB.exist " + str(k) + " got exception: " + str(e))
-            self.__open__()
+            self._reconnect()
 
     def get(self, k):
         if not self.REDIS:
@@ -129,7 +235,7 @@ class RedisDB:
             return self.REDIS.get(k)
         except Exception as e:
             logging.warning("RedisDB.get " + str(k) + " got exception: " + str(e))
-            self.__open__()
+            self._reconnect()
 
     def set_obj(self, k, obj, exp=3600):
         try:
@@ -137,7 +243,7 @@ class RedisDB:
             return True
         except Exception as e:
             logging.warning("RedisDB.set_obj " + str(k) + " got exception: " + str(e))
-            self.__open__()
+            self._reconnect()
         return False
 
     def set(self, k, v, exp=3600):
@@ -146,16 +252,71 @@ class RedisDB:
             return True
         except Exception as e:
             logging.warning("RedisDB.set " + str(k) + " got exception: " + str(e))
-            self.__open__()
+            self._reconnect()
         return False
 
+    def mget(self, keys: list) -> list:
+        """Values of `keys` in one round trip, None for the missing ones and for all of them on error."""
+        if not keys:
+            return []
+        if not self.REDIS:
+            return [None] * len(keys)
+        try:
+            return self.REDIS.mget(keys)
+        except Exception as e:
+            logging.warning("RedisDB.mget " + str(len(keys)) + " keys got exception: " + str(e))
+            self._reconnect()
+        return [None] * len(keys)
+
+    def mset_with_ttl(self, mapping: dict, exp=3600) -> bool:
+        """SET every key of `mapping` with the same expiry, in one round trip."""
+        if not mapping:
+            return True
+        try:
+            with self.pipeline() as pipe:
+                for k, v in mapping.items():
+                    pipe.set(k, v, exp)
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.mset_with_ttl " + str(len(mapping)) + " keys got exception: " + str(e))
+            self._reconnect()
+        return False
+
+    @contextmanager
+    def pipeline(self, transaction=False, raise_on_error=True):
+        """
+        Buffer the commands issued on the yielded pipeline and send them in one round trip when the block exits.
+        Nothing is sent if the block raises. Errors are raised to the caller, or with `raise_on_error=False`
+        returned in place of the results of the commands that failed.
+
+            with REDIS_CONN.pipeline() as pipe:
+                for k in keys:
+                    pipe.expire(k, 60)
+            results = pipe.results
+        """
+        pipe = self.REDIS.pipeline(transaction=transaction)
+        pipe.results = []
+        try:
+            yield pipe
+            if not len(pipe):
+                return
+            st = time.perf_counter()
+            failed = True
+            try:
+                pipe.results = pipe.execute(raise_on_error=raise_on_error)
+                failed = False
+            finally:
+                self.command_stats.record("PIPELINE", time.perf_counter() - st, failed)
+        finally:
+            pipe.reset()
+
     def sadd(self, key: str, member: str):
         try:
             self.REDIS.sadd(key, member)
             return True
         except Exception as e:
             logging.warning("RedisDB.sadd " + str(key) + " got exception: " + str(e))
-            self.__open__()
+            self._reconnect()
         return False
 
     def srem(self, key: str, member: str):
@@ -164,7 +325,7 @@ class RedisDB:
             return True
         except Exception as e:
             logging.warning("RedisDB.srem " + str(key) + " got exception: " + str(e))
-            self.__open__()
+            self._reconnect()
         return False
 
     def smembers(self, key: str):
@@ -175,7 +336,7 @@ class RedisDB:
             logging.warning(
                 "RedisDB.smembers " + str(key) + " got exception: " + str(e)
             )
-            self.__open__()
+            self._reconnect()
         return None
 
     def zadd(self, key: str, member: str, score: float):
@@ -184,7 +345,7 @@ class RedisDB:
             return True
         except Exception as e:
             logging.warning("RedisDB.zadd " + str(key) + " got exception: " + str(e))
-            self.__open__()
+            self._reconnect()
         return False
 
     def zcount(self, key: str, min: float, max: float):
@@ -193,7 +354,7 @@ class RedisDB:
             return res
         except Exception as e:
             logging.warning("RedisDB.zcount " + str(key) + " got exception: " + str(e))
-            self.__open__()
+            self._reconnect()
         return 0
 
     def zpopmin(self, key: str, count: int):
@@ -202,7 +363,7 @@ class RedisDB:
             return res
         except Exception as e:
             logging.warning("RedisDB.zpopmin " + str(key) + " got exception: " + str(e))
-            self.__open__()
+            self._reconnect()
         return None
 
     def zrangebyscore(self, key: str, min: float, max: float):
@@ -213,7 +374,7 @@ class RedisDB:
             logging.warning(
                 "RedisDB.zrangebyscore " + str(key) + " got exception: " + str(e)
             )
-            self.__open__()
+            self._reconnect()
         return None
 
     def transaction(self, key, value, exp=3600):
@@ -226,7 +387,7 @@ class RedisDB:
             logging.warning(
                 "RedisDB.transaction " + str(key) + " got exception: " + str(e)
             )
-            self.__open__()
+            self._reconnect()
         return False
 
     def queue_product(self, queue, message) -> bool:
@@ -239,7 +400,7 @@ class RedisDB:
                 logging.exception(
                     "RedisDB.queue_product " + str(queue) + " got exception: " + str(e)
                 )
-                self.__open__()
+                self._reconnect()
         return False
 
     def queue_consumer(self, queue_name, group_name, consumer_name, msg_id=b">") -> RedisMsg:
@@ -286,9 +447,157 @@ class RedisDB:
                         + " got exception: "
                         + str(e)
                     )
-                    self.__open__()
+                    self._reconnect()
         return None
 
+    def queue_create_group(self, queue_name, group_name) -> bool:
+        """Create the consumer group, and the stream, if they don't exist yet."""
+        try:
+            self.REDIS.xgroup_create(queue_name, group_name, id="0", mkstream=True)
+            return True
+        except redis.exceptions.ResponseError as e:
+            if "busygroup" in str(e).lower():
+                return True
+            logging.warning("RedisDB.queue_create_group " + str(queue_name) + " got exception: " + str(e))
+        except Exception as e:
+            logging.warning("RedisDB.queue_create_group " + str(queue_name) + " got exception: " + str(e))
+            self._reconnect()
+        return False
+
+    def _to_msgs(self, streams, group_name) -> list[RedisMsg]:
+        msgs = []
+        for queue_name, element_list in streams or []:
+            for msg_id, payload in element_list or []:
+                if msg_id is None:
+                    continue
+                if not payload:
+                    # Deleted from the stream while pending.
+                    self.REDIS.xack(queue_name, group_name, msg_id)
+                    continue
+                msgs.append(RedisMsg(self.REDIS, queue_name, group_name, msg_id, payload))
+        return msgs
+
+    def queue_consumer_batch(self, queue_names: list[str], group_name, consumer_name, count=1, block_ms=None, msg_id=">") -> list[RedisMsg]:
+        """
+        Up to `count` messages of each of `queue_names`, in that order, with one XREADGROUP.
+        Waits `block_ms` milliseconds for new messages if there is none, doesn't wait if None.
+        `msg_id` other than ">" reads the messages already delivered to this consumer, after that id.
+        The groups are expected to exist, see `queue_create_group`; they are created again if they vanished.
+        """
+        streams = {queue_name: msg_id for queue_name in queue_names}
+        for _ in range(2):
+            try:
+                res = self.REDIS.xreadgroup(group_name, consumer_name, streams, count=count, block=block_ms)
+                return self._to_msgs(res, group_name)
+            except redis.exceptions.ResponseError as e:
+                if "nogroup" not in str(e).lower():
+                    logging.warning("RedisDB.queue_consumer_batch " + str(queue_names) + " got exception: " + str(e))
+                    return []
+                for queue_name in queue_names:
+                    self.queue_create_group(queue_name, group_name)
+            except Exception as e:
+                logging.warning("RedisDB.queue_consumer_batch " + str(queue_names) + " got exception: " + str(e))
+                self._reconnect()
+                return []
+        return []
+
+    def queue_consumer_many(self, counts: dict, group_name, consumer_name) -> list[RedisMsg]:
+        """Up to `counts[queue_name]` new messages of each queue, in one round trip. Doesn't wait."""
+        if not counts:
+            return []
+        try:
+            with self.pipeline(raise_on_error=False) as pipe:
+                for queue_name, count in counts.items():
+                    pipe.xreadgroup(group_name, consumer_name, {queue_name: ">"}, count=count)
+            msgs = []
+            for queue_name, res in zip(counts.keys(), pipe.results):
+                if isinstance(res, Exception):
+                    if "nogroup" in str(res).lower():
+                        self.queue_create_group(queue_name, group_name)
+                    else:
+                        logging.warning("RedisDB.queue_consumer_many " + str(queue_name) + " got exception: " + str(res))
+                    continue
+                msgs.extend(self._to_msgs(res, group_name))
+            return msgs
+        except Exception as e:
+            logging.warning("RedisDB.queue_consumer_many " + str(list(counts.keys())) + " got exception: " + str(e))
+            self._reconnect()
+        return []
+
+    def queue_infos(self, queue_names: list[str], group_name) -> dict:
+        """The info of the group on each queue, in one round trip; {} if there's no such queue, None no such group."""
+        infos = {}
+        if not queue_names:
+            return infos
+        try:
+            with self.pipeline(raise_on_error=False) as pipe:
+                for queue_name in queue_names:
+                    pipe.xinfo_groups(queue_name)
+            for queue_name, groups in zip(queue_names, pipe.results):
+                if isinstance(groups, Exception):
+                    # No such stream.
+                    infos[queue_name] = {}
+                    continue
+                infos[queue_name] = next((group for group in groups if group["name"] == group_name), None)
+        except Exception as e:
+            logging.warning("RedisDB.queue_infos " + str(queue_names) + " got exception: " + str(e))
+            self._reconnect()
+        return infos
+
+    def queue_lags(self, queue_names: list[str], group_name) -> dict:
+        """Number of messages not delivered to the group yet, of each queue, in one round trip; None if unknown."""
+        return {queue_name: None if info is None else info.get("lag", 0)
+                for queue_name, info in self.queue_infos(queue_names, group_name).items()}
+
+    def queue_consumers(self, queue_name, group_name) -> dict | None:
+        """Number of messages delivered to each consumer of the group and not acked yet; None if unknown."""
+        try:
+            info = self.REDIS.xpending(queue_name, group_name)
+            return {c["name"]: int(c["pending"]) for c in info.get("consumers") or []}
+        except Exception as e:
+            if "nogroup" not in str(e).lower() and "no such key" not in str(e).lower():
+                logging.warning("RedisDB.queue_consumers " + str(queue_name) + " got exception: " + str(e))
+                self._reconnect()
+        return None
+
+    def queue_claim(self, queue_name, group_name, consumer_name, from_consumer, min_idle_ms: int, count=1) -> list[RedisMsg]:
+        """Take over up to `count` messages delivered to `from_consumer` and not acked for `min_idle_ms`."""
+        try:
+            pending = self.REDIS.xpending_range(queue_name, group_name, "-", "+", count,
+                                                consumername=from_consumer, idle=min_idle_ms)
+            msg_ids = [p["message_id"] for p in pending]
+            if not msg_ids:
+                return []
+            res = self.REDIS.xclaim(queue_name, group_name, consumer_name, min_idle_ms, msg_ids)
+            return self._to_msgs([(queue_name, res)], group_name)
+        except Exception as e:
+            logging.warning("RedisDB.queue_claim " + str(queue_name) + " got exception: " + str(e))
+            self._reconnect()
+        return []
+
+    def last_heartbeats(self, consumer_names: list[str]) -> dict | None:
+        """Time of the latest heartbeat of each consumer, None if it has none, in one round trip; None on error."""
+        try:
+            with self.pipeline() as pipe:
+                for consumer_name in consumer_names:
+                    pipe.zrange(consumer_name, -1, -1, withscores=True)
+            return {c: res[0][1] if res else None for c, res in zip(consumer_names, pipe.results)}
+        except Exception as e:
+            logging.warning("RedisDB.last_heartbeats " + str(consumer_names) + " got exception: " + str(e))
+            self._reconnect()
+        return None
+
+    def queue_touch(self, queue_name, group_name, consumer_name, msg_ids: list) -> bool:
+        """Reset the idle time of messages this consumer is working on, so that `queue_claim` leaves them alone."""
+        if not msg_ids:
+            return True
+        try:
+            self.REDIS.xclaim(queue_name, group_name, consumer_name, 0, msg_ids, justid=True)
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.queue_touch " + str(queue_name) + " got exception: " + str(e))
+        return False
+
     def get_unacked_iterator(self, queue_names: list[str], group_name, consumer_name):
         try:
             for queue_name in queue_names:
@@ -313,7 +622,7 @@ class RedisDB:
             logging.exception(
                 "RedisDB.get_unacked_iterator got exception: "
             )
-            self.__open__()
+            self._reconnect()
 
     def get_pending_msg(self, queue, group_name):
         try:
@@ -337,7 +646,7 @@ class RedisDB:
                 logging.warning(
                     "RedisDB.get_pending_msg " + str(queue) + " got exception: " + str(e)
                 )
-                self.__open__()
+                self._reconnect()
 
     def queue_info(self, queue, group_name) -> dict | None:
         for _ in range(3):
@@ -350,7 +659,7 @@ class RedisDB:
                 logging.warning(
                     "RedisDB.queue_info " + str(queue) + " got exception: " + str(e)
                 )
-                self.__open__()
+                self._reconnect()
         return None
 
     def delete_if_equal(self, key: str, expected_value: str) -> bool:
@@ -366,7 +675,7 @@ class RedisDB:
             return True
         except Exception as e:
             logging.warning("RedisDB.delete " + str(key) + " got exception: " + str(e))
-            self.__open__()
+            self._reconnect()
         return False
 
 
@@ -0,0 +1,60 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Files/sec of the dataset upload API, per-file vs. bulk mode.
+
+Uploads `--files` small synthetic text files to an existing dataset of a running
+server in requests of `--batch` files each, once per mode.
+
+    python test/benchmark/bench_bulk_upload.py --host http://127.0.0.1:9380 \\
+        --api-key <YOUR_API_KEY> --dataset-id <DATASET_ID> --files 2000
+"""
+import argparse
+import io
+import time
+
+import requests
+
+
+def upload(args, bulk, prefix):
+    url = f"{args.host}/api/v1/datasets/{args.dataset_id}/documents"
+    headers = {"Authorization": f"Bearer {args.api_key}"}
+    failed = 0
+    st = time.perf_counter()
+    for b in range(0, args.files, args.batch):
+        files = [("file", (f"{prefix}_{i}.txt", io.BytesIO(f"benchmark document {i}\n".encode("utf-8") * args.lines), "text/plain"))
+                 for i in range(b, min(b + args.batch, args.files))]
+        res = requests.post(url, headers=headers, files=files, data={"bulk": "true"} if bulk else None).json()
+        if res.get("code") != 0:
+            failed += len(files)
+        elif bulk:
+            failed += sum(1 for r in res["data"] if r["error"])
+    return time.perf_counter() - st, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dataset upload benchmark")
+    parser.add_argument("--host", default="http://127.0.0.1:9380")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--dataset-id", required=True)
+    parser.add_argument("--files", type=int, default=2000, help="files uploaded per mode")
+    parser.add_argument("--batch", type=int, default=200, help="files per request")
+    parser.add_argument("--lines", type=int, default=200, help="lines per synthetic file")
+    args = parser.parse_args()
+
+    for name, bulk in [("per-file", False), ("bulk", True)]:
+        elapsed, failed = upload(args, bulk, f"bench_{name}_{int(time.time())}")
+        print(f"{name:>8}: {args.files / elapsed:.1f} files/s ({elapsed:.1f}s, {failed} failed)")
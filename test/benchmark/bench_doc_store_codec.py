@@ -0,0 +1,112 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Client side cost of bulk inserting chunks into, and reading vectors back from, Elasticsearch/OpenSearch.
+
+Encodes `--chunks` synthetic chunks the former way (deep copy of every chunk, then the client's
+json serializer) and with `bulk_index_lines`, and decodes a search response carrying `--hits`
+vectors with json + per-float lists versus `loads_json` + `vector_matrix`. No server is needed.
+
+    PYTHONPATH=. python test/benchmark/bench_doc_store_codec.py --chunks 2000 --dim 1024
+"""
+import argparse
+import copy
+import json
+import random
+import time
+
+import numpy as np
+
+from common.float_utils import get_float
+from rag.utils.doc_store_conn import bulk_index_lines, dumps_json, loads_json, orjson, vector_matrix
+
+
+def synthetic_chunks(n, dim):
+    rnd = np.random.default_rng(0)
+    words = ["retrieval", "augmented", "generation", "document", "chunk", "vector", "index", "search"]
+    for i in range(n):
+        text = " ".join(random.choice(words) for _ in range(200))
+        yield {
+            "id": f"{i:016x}",
+            "doc_id": "d" * 32,
+            "docnm_kwd": "bench.pdf",
+            "content_with_weight": text,
+            "content_ltks": text,
+            "content_sm_ltks": text,
+            "page_num_int": [1],
+            "position_int": [[1, 0, 100, 0, 100]],
+            f"q_{dim}_vec": rnd.standard_normal(dim).tolist(),
+        }
+
+
+def former_encoding(documents, index_name, kb_id):
+    lines = []
+    for d in documents:
+        d_copy = copy.deepcopy(d)
+        d_copy["kb_id"] = kb_id
+        meta_id = d_copy.pop("id", "")
+        lines.append(json.dumps({"index": {"_index": index_name, "_id": meta_id}}).encode("utf-8"))
+        lines.append(json.dumps(d_copy).encode("utf-8"))
+    return lines
+
+
+def best_of(rounds, func):
+    best, res = float("inf"), None
+    for _ in range(rounds):
+        st = time.perf_counter()
+        res = func()
+        best = min(best, time.perf_counter() - st)
+    return best, res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=2000)
+    ap.add_argument("--hits", type=int, default=64)
+    ap.add_argument("--dim", type=int, default=1024)
+    ap.add_argument("--rounds", type=int, default=3)
+    args = ap.parse_args()
+    print(f"orjson: {'yes' if orjson is not None else 'no (json fallback)'}")
+
+    chunks = list(synthetic_chunks(args.chunks, args.dim))
+    for name, func in [("deepcopy + json", lambda: former_encoding(chunks, "ragflow_bench", "kb")),
+                       ("bulk_index_lines", lambda: bulk_index_lines(chunks, "ragflow_bench", kb_id="kb"))]:
+        elapsed, lines = best_of(args.rounds, func)
+        size = sum(len(line) + 1 for line in lines)
+        print(f"{name:<24} {elapsed * 1000:9.1f} ms  {size / 2**20:8.1f} MB body  {size / 2**20 / elapsed:8.1f} MB/s")
+
+    vector_column = f"q_{args.dim}_vec"
+    response = dumps_json({"hits": {"total": {"value": args.hits}, "hits": [
+        {"_id": c["id"], "_score": 1.0, "_source": {k: c[k] for k in ["content_ltks", vector_column]}}
+        for c in chunks[:args.hits]]}})
+
+    def former_decoding():
+        res = json.loads(response)
+        return [[get_float(v) for v in h["_source"][vector_column]] for h in res["hits"]["hits"]]
+
+    def decoding():
+        res = loads_json(response)
+        return vector_matrix([h["_source"].get(vector_column) for h in res["hits"]["hits"]], args.dim)
+
+    elapsed, ref = best_of(args.rounds, former_decoding)
+    print(f"{'json + float lists':<24} {elapsed * 1000:9.2f} ms  for {args.hits} hits, {len(response) / 2**20:.1f} MB response")
+    elapsed, matrix = best_of(args.rounds, decoding)
+    print(f"{'loads_json + matrix':<24} {elapsed * 1000:9.2f} ms")
+    print(f"max |diff|: {np.max(np.abs(np.array(ref) - matrix)):.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Import-time audit of the API server and the task executor.
+
+Imports each module in a fresh interpreter under `python -X importtime` and
+reports the wall time together with the imports that cost the most, by their
+own time and by cumulative time (themselves plus what they pulled in).
+
+    python test/benchmark/bench_import_time.py
+    python test/benchmark/bench_import_time.py rag.svr.task_executor --top 40
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+DEFAULT_MODULES = ["api.ragflow_server", "rag.svr.task_executor"]
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_time(module: str, python: str = sys.executable):
+    """
+    Returns (wall seconds, [(self us, cumulative us, depth, module name), ...]) of `import module`.
+    Raises RuntimeError when the import fails.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_ROOT, os.environ.get("PYTHONPATH")])))
+    st = time.perf_counter()
+    proc = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=PROJECT_ROOT, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - st
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n" + "\n".join(proc.stderr.splitlines()[-20:]))
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2, m.group(4)))
+    return wall, rows
+
+
+def report(module: str, wall: float, rows, top: int):
+    print(f"== {module}: {wall:.2f}s wall, {len(rows)} modules imported")
+    print(f"{'self ms':>10} {'cumul ms':>10}  module")
+    print("-- by cumulative time, top level packages")
+    for self_us, cum_us, depth, name in sorted((r for r in rows if r[2] <= 1), key=lambda r: -r[1])[:top]:
+        print(f"{self_us / 1000:10.1f} {cum_us / 1000:10.1f}  {name}")
+    print("-- by self time")
+    for self_us, cum_us, depth, name in sorted(rows, key=lambda r: -r[0])[:top]:
+        print(f"{self_us / 1000:10.1f} {cum_us / 1000:10.1f}  {name}")
+    print()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    ap.add_argument("--top", type=int, default=25)
+    ap.add_argument("--budget", type=float, default=0, help="exit with 1 if any import takes longer (seconds)")
+    args = ap.parse_args()
+
+    over = False
+    for module in args.modules:
+        wall, rows = import_time(module)
+        report(module, wall, rows, args.top)
+        if args.budget and wall > args.budget:
+            print(f"!! {module} took {wall:.2f}s, budget is {args.budget:.2f}s")
+            over = True
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Cost of clustering one RAPTOR layer, on synthetic embeddings.
+
+Draws `--chunks` embeddings of `--dim` dimensions around `--topics` centers, reduces them with
+UMAP like RAPTOR does, and searches the cluster count fitting a Gaussian mixture for every count
+below `--max-cluster` (the former path) versus `_get_optimal_clusters`, reporting the count each
+picks and its BIC. Then times the whole labelling of the layer with UMAP and Gaussian mixtures
+versus `_cluster_large_layer` (PCA and mini-batch k-means). No model or server is needed.
+
+    PYTHONPATH=. python test/benchmark/bench_raptor_clustering.py --chunks 20000 --dim 1024
+"""
+import argparse
+import time
+
+import numpy as np
+import umap
+from sklearn.mixture import GaussianMixture
+
+from rag.raptor import RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor, _bic
+
+
+def synthetic_embeddings(n, dim, topics, seed=0):
+    rnd = np.random.default_rng(seed)
+    centers = rnd.normal(size=(topics, dim))
+    X = centers[rnd.integers(0, topics, n)] + rnd.normal(scale=0.6, size=(n, dim))
+    return (X / np.linalg.norm(X, axis=1, keepdims=True)).astype(np.float32)
+
+
+def reduce(X):
+    return umap.UMAP(n_neighbors=max(2, int((len(X) - 1) ** 0.8)), n_components=min(12, len(X) - 2),
+                     metric="cosine").fit_transform(X)
+
+
+def exhaustive_search(reduced, max_cluster, seed):
+    n_clusters = list(range(1, min(max_cluster, len(reduced))))
+    bics = [_bic(reduced, n, seed) for n in n_clusters]
+    return n_clusters[int(np.argmin(bics))]
+
+
+def umap_gmm_labels(raptor, X, seed):
+    reduced = reduce(X)
+    n = raptor._get_optimal_clusters(reduced, seed)
+    if n == 1:
+        return np.zeros(len(X), dtype=int)
+    return GaussianMixture(n_components=n, random_state=seed).fit(reduced).predict(reduced)
+
+
+def timed(f):
+    st = time.perf_counter()
+    res = f()
+    return res, time.perf_counter() - st
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=3000)
+    ap.add_argument("--dim", type=int, default=1024)
+    ap.add_argument("--topics", type=int, default=24)
+    ap.add_argument("--max-cluster", type=int, default=64)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    raptor = Raptor(args.max_cluster, None, None, "")
+    X = synthetic_embeddings(args.chunks, args.dim, args.topics, args.seed)
+    reduced, t_umap = timed(lambda: reduce(X))
+    print(f"{args.chunks} chunks, {args.dim} dims, {args.topics} topics; UMAP: {t_umap:.2f} s")
+
+    n_full, t_full = timed(lambda: exhaustive_search(reduced, args.max_cluster, args.seed))
+    n_fast, t_fast = timed(lambda: raptor._get_optimal_clusters(reduced, args.seed))
+    print(f"exhaustive BIC search:     {t_full:8.2f} s  -> {n_full} clusters, BIC {_bic(reduced, n_full, args.seed):.1f}")
+    print(f"coarse-to-fine BIC search: {t_fast:8.2f} s  -> {n_fast} clusters, BIC {_bic(reduced, n_fast, args.seed):.1f}"
+          f"  ({t_full / t_fast:.1f}x)")
+
+    lbls, t_layer = timed(lambda: umap_gmm_labels(raptor, X, args.seed))
+    print(f"UMAP + Gaussian mixture layer:  {t_layer:8.2f} s  -> {len(np.unique(lbls))} clusters")
+    lbls, t_large = timed(lambda: raptor._cluster_large_layer(X, args.seed))
+    print(f"PCA + mini-batch k-means layer: {t_large:8.2f} s  -> {len(np.unique(lbls))} clusters"
+          f"  ({t_layer / t_large:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
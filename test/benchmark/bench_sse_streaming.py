@@ -0,0 +1,74 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Server CPU spent framing one streamed chat answer as SSE.
+
+Replays the cumulative answers `dialog_service.chat` yields for an answer of
+`--tokens` tokens and compares the legacy path (full-answer frames, a token
+count per update) with the `delta` protocol (`api.utils.stream_utils.DeltaEncoder`),
+where the flush decision is mostly length based.
+
+    PYTHONPATH=. python test/benchmark/bench_sse_streaming.py --tokens 2000
+"""
+import argparse
+import random
+import string
+import time
+
+from api.utils.stream_utils import DeltaEncoder, sse_frame
+from common.token_utils import num_tokens_from_string
+
+
+def cumulative_answers(tokens, step_tokens=16, seed=0):
+    rnd = random.Random(seed)
+    words = ["".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(2, 8))) for _ in range(tokens)]
+    answer = ""
+    for i in range(0, tokens, step_tokens):
+        answer += " " + " ".join(words[i:i + step_tokens])
+        yield {"answer": answer, "reference": {}, "audio_binary": None}
+    yield {"answer": answer, "reference": {"chunks": [], "doc_aggs": []}, "prompt": "...", "audio_binary": None}
+
+
+def run(answers, delta, count_tokens):
+    encoder = DeltaEncoder() if delta else None
+    sent = 0
+    last = ""
+    st = time.process_time()
+    for ans in answers:
+        if count_tokens:
+            num_tokens_from_string(ans["answer"][len(last):])
+            last = ans["answer"]
+        if encoder:
+            ans = encoder.encode(ans)
+        sent += len(sse_frame({"code": 0, "message": "", "data": ans}).encode("utf-8"))
+    if encoder:
+        sent += len(sse_frame({"code": 0, "message": "", "data": encoder.finish(answers[-1])}).encode("utf-8"))
+    return time.process_time() - st, sent
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SSE chat streaming benchmark")
+    parser.add_argument("--tokens", type=int, default=2000, help="answer length in tokens")
+    parser.add_argument("--rounds", type=int, default=20, help="answers streamed per protocol")
+    args = parser.parse_args()
+
+    answers = list(cumulative_answers(args.tokens))
+    for name, delta, count_tokens in [("legacy", False, True), ("delta", True, False)]:
+        cpu, sent = 0.0, 0
+        for _ in range(args.rounds):
+            c, sent = run(answers, delta, count_tokens)
+            cpu += c
+        print(f"{name:>6}: {len(answers)} frames, {sent / 1024:.1f} KiB sent, {cpu / args.rounds * 1000:.2f} ms CPU per answer")
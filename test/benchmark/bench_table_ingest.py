@@ -0,0 +1,98 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Ingestion cost of a large table, the way the task executor splits it.
+
+Generates a synthetic `--rows` row xlsx and csv, then times `row_number` (done once per
+document when tasks are queued) and the parse of the first and the last `--window` rows
+(one task each), with peak traced memory.
+
+    PYTHONPATH=. python test/benchmark/bench_table_ingest.py --rows 500000
+"""
+import argparse
+import io
+import random
+import time
+import tracemalloc
+
+from openpyxl import Workbook
+
+from deepdoc.parser.excel_parser import RAGFlowExcelParser
+from rag.app import table
+
+HEADERS = ["name", "city", "amount", "quantity", "comment"]
+
+
+def synthetic_rows(n):
+    rnd = random.Random(0)
+    cities = ["Paris", "Berlin", "Madrid", "Rome", "Vienna", "Prague"]
+    for i in range(n):
+        yield [f"item {i}", rnd.choice(cities), round(rnd.random() * 1000, 2), rnd.randint(1, 100), f"comment for row {i}"]
+
+
+def make_xlsx(n):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Data")
+    ws.append(HEADERS)
+    for row in synthetic_rows(n):
+        ws.append(row)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def make_csv(n):
+    lines = ["\t".join(HEADERS)] + ["\t".join(str(v) for v in row) for row in synthetic_rows(n)]
+    return "\n".join(lines).encode("utf-8")
+
+
+def measure(label, func):
+    tracemalloc.start()
+    st = time.perf_counter()
+    res = func()
+    elapsed = time.perf_counter() - st
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<40} {elapsed:9.2f} s  {peak / 2**20:9.1f} MB peak")
+    return res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=500000)
+    ap.add_argument("--window", type=int, default=3000)
+    args = ap.parse_args()
+
+    # Chunking would record the field map of the knowledge base.
+    table.KnowledgebaseService.update_parser_config = lambda *a, **kw: None
+
+    def callback(prog=None, msg=""):
+        pass
+
+    xlsx = make_xlsx(args.rows)
+    csv = make_csv(args.rows)
+    print(f"{args.rows} rows: xlsx {len(xlsx) / 2**20:.1f} MB, csv {len(csv) / 2**20:.1f} MB")
+
+    measure("row_number(xlsx)", lambda: RAGFlowExcelParser.row_number("bench.xlsx", xlsx))
+    for name, st in [("first", 0), ("last", max(0, args.rows - args.window))]:
+        dfs = measure(f"Excel() {name} {args.window} rows", lambda: table.Excel()("bench.xlsx", xlsx, st, st + args.window, callback))
+        assert sum(len(df) for df in dfs) == min(args.window, args.rows - st)
+        measure(f"chunk(xlsx) {name} {args.window} rows", lambda: table.chunk("bench.xlsx", xlsx, st, st + args.window, lang="English", callback=callback, kb_id=""))
+        measure(f"chunk(csv) {name} {args.window} rows", lambda: table.chunk("bench.csv", csv, st, st + args.window, lang="English", callback=callback, kb_id=""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import os
+
+import pytest
+from bench_import_time import import_time
+
+# Seconds, generous on purpose: the test is there to catch a model or torch creeping back into import time.
+BUDGETS = {
+    "api.ragflow_server": float(os.environ.get("RAGFLOW_SERVER_IMPORT_BUDGET", "20")),
+    "rag.svr.task_executor": float(os.environ.get("TASK_EXECUTOR_IMPORT_BUDGET", "20")),
+}
+# Only imported once something actually needs them.
+DEFERRED = ["torch", "rag.app.paper", "rag.app.laws", "rag.app.resume"]
+
+
+@pytest.mark.parametrize("module", list(BUDGETS.keys()))
+def test_import_within_budget(module):
+    try:
+        wall, rows = import_time(module)
+    except RuntimeError as e:
+        pytest.skip(str(e))
+    top = sorted(rows, key=lambda r: -r[0])[:10]
+    assert wall < BUDGETS[module], f"import {module} took {wall:.2f}s, slowest imports: {top}"
+
+
+@pytest.mark.parametrize("module", ["rag.svr.task_executor"])
+def test_parsers_are_deferred(module):
+    try:
+        _, rows = import_time(module)
+    except RuntimeError as e:
+        pytest.skip(str(e))
+    imported = {name for _, _, _, name in rows}
+    assert not imported.intersection(DEFERRED)
@@ -0,0 +1,110 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import threading
+import time
+
+import pytest
+
+from agent.scheduler import BatchScheduler, component_executor
+
+
+class FakeCanvas:
+    """The `upstream` links of the components, all a BatchScheduler reads from the canvas."""
+
+    def __init__(self, upstream: dict[str, list[str]]):
+        self.upstream = upstream
+
+    def get_component(self, cpn_id):
+        return {"upstream": self.upstream.get(cpn_id, [])}
+
+
+class Recorder:
+    """Invokes components by sleeping, and records when each started and finished."""
+
+    def __init__(self, delay=0.05, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.lock = threading.Lock()
+        self.started = {}
+        self.finished = {}
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, cpn_id):
+        with self.lock:
+            self.started.setdefault(cpn_id, []).append(time.perf_counter())
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if cpn_id in self.fail:
+                raise ValueError(cpn_id)
+        finally:
+            with self.lock:
+                self.finished.setdefault(cpn_id, []).append(time.perf_counter())
+                self.running -= 1
+
+
+class TestBatchScheduler:
+    """Test cases for the dependency ordering of BatchScheduler"""
+
+    def test_dependent_starts_after_its_upstream(self):
+        canvas = FakeCanvas({"b": ["a"], "c": ["b"]})
+        invoke = Recorder()
+        batch = BatchScheduler(canvas, ["a", "b", "c"], invoke).start()
+        batch.join()
+        assert invoke.started["b"][0] >= invoke.finished["a"][0]
+        assert invoke.started["c"][0] >= invoke.finished["b"][0]
+        assert invoke.max_running == 1
+
+    def test_independent_components_overlap(self):
+        canvas = FakeCanvas({"join": ["left", "right"]})
+        invoke = Recorder(delay=0.2)
+        batch = BatchScheduler(canvas, ["left", "right", "join"], invoke).start()
+        batch.join()
+        assert invoke.max_running == 2
+        assert invoke.started["join"][0] >= max(invoke.finished["left"][0], invoke.finished["right"][0])
+
+    def test_upstream_outside_the_batch_is_ignored(self):
+        canvas = FakeCanvas({"a": ["begin"], "b": ["begin"]})
+        invoke = Recorder(delay=0.2)
+        BatchScheduler(canvas, ["a", "b"], invoke).start().join()
+        assert invoke.max_running == 2
+
+    def test_same_component_twice_is_serialized(self):
+        invoke = Recorder()
+        BatchScheduler(FakeCanvas({}), ["a", "a"], invoke).start().join()
+        first_finished, second_started = invoke.finished["a"][0], invoke.started["a"][1]
+        assert second_started >= first_finished
+
+    def test_wait_raises_the_error_of_the_component(self):
+        canvas = FakeCanvas({"b": ["a"]})
+        batch = BatchScheduler(canvas, ["a", "b"], Recorder(fail={"a"})).start()
+        with pytest.raises(ValueError, match="a"):
+            batch.wait(0)
+        assert batch.wait(1)["run_time"] > 0
+
+    def test_batch_started_from_a_worker_completes(self):
+        canvas = FakeCanvas({"b": ["a"], "c": ["a"], "d": ["b", "c"]})
+        invoke = Recorder(delay=0.01)
+
+        def nested():
+            BatchScheduler(canvas, ["a", "b", "c", "d"], invoke).start().join()
+            return threading.current_thread()
+
+        worker = component_executor.dispatch(nested).result(timeout=5)
+        assert invoke.started["d"][0] >= max(invoke.finished["b"][0], invoke.finished["c"][0])
+        assert worker.name.startswith("canvas_cpn")
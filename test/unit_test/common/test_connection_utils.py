@@ -0,0 +1,143 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import threading
+import time
+
+import pytest
+import trio
+
+from common.connection_utils import current_cancellation_token, run_sync_with_timeout, timeout, timeout_stats
+
+
+@pytest.fixture
+def enforced(monkeypatch):
+    monkeypatch.setenv("ENABLE_TIMEOUT_ASSERTION", "1")
+
+
+class TestSyncTimeout:
+    """Test cases for the sync branch of the timeout decorator"""
+
+    def test_runs_inline_when_not_enforced(self, monkeypatch):
+        """Test that no thread is involved when timeouts are not enforced"""
+        monkeypatch.delenv("ENABLE_TIMEOUT_ASSERTION", raising=False)
+
+        @timeout(0.01)
+        def caller_thread():
+            time.sleep(0.05)
+            return threading.current_thread()
+
+        assert caller_thread() is threading.current_thread()
+
+    def test_returns_result(self, enforced):
+        """Test that a call within its deadline returns its result"""
+
+        @timeout(1)
+        def add(a, b):
+            return a + b
+
+        assert add(1, b=2) == 3
+
+    def test_propagates_exception(self, enforced):
+        """Test that an exception raised by the call reaches the caller"""
+
+        @timeout(1)
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError, match="boom"):
+            fail()
+
+    def test_timeout_cancels_token(self, enforced):
+        """Test that a timed out call sees its token cancelled and is counted as leaked until it returns"""
+        started, seen = threading.Event(), threading.Event()
+        release = threading.Event()
+
+        @timeout(0.05, attempts=1)
+        def slow():
+            token = current_cancellation_token()
+            started.set()
+            release.wait(5)
+            if token.cancelled:
+                seen.set()
+
+        before = timeout_stats()
+        with pytest.raises(TimeoutError):
+            slow()
+        assert started.is_set()
+        stats = timeout_stats()
+        assert stats["timed_out"] == before["timed_out"] + 1
+        assert stats["leaked"] == before["leaked"] + 1
+
+        release.set()
+        assert seen.wait(5)
+        deadline = time.time() + 5
+        while timeout_stats()["leaked"] != before["leaked"] and time.time() < deadline:
+            time.sleep(0.01)
+        assert timeout_stats()["leaked"] == before["leaked"]
+
+    def test_nested_calls_do_not_deadlock(self, enforced):
+        """Test that timed calls made from a timed call run inline"""
+
+        @timeout(1)
+        def inner():
+            return threading.current_thread()
+
+        @timeout(1)
+        def outer():
+            return threading.current_thread(), inner()
+
+        outer_thread, inner_thread = outer()
+        assert outer_thread is inner_thread
+
+
+class TestRunSyncWithTimeout:
+    """Test cases for run_sync_with_timeout"""
+
+    def test_returns_result(self, enforced):
+        """Test that the blocking call's result is returned"""
+
+        async def main():
+            return await run_sync_with_timeout(1, lambda a, b: a * b, 6, 7)
+
+        assert trio.run(main) == 42
+
+    def test_times_out(self, enforced):
+        """Test that a slow call raises TimeoutError without waiting for the thread"""
+        release = threading.Event()
+
+        async def main():
+            st = time.time()
+            with pytest.raises(TimeoutError):
+                await run_sync_with_timeout(0.05, release.wait, 5)
+            return time.time() - st
+
+        try:
+            assert trio.run(main) < 2
+        finally:
+            release.set()
+
+    def test_async_decorator_times_out(self, enforced):
+        """Test that the async branch is bounded by trio.fail_after"""
+
+        @timeout(0.05, attempts=1)
+        async def slow():
+            await trio.sleep(5)
+
+        async def main():
+            with pytest.raises(TimeoutError):
+                await slow()
+
+        trio.run(main)
@@ -0,0 +1,210 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from common.http_utils import RateLimitGate, get_with_rate_limit, map_concurrently, parse_delay
+
+
+class FakeAPI:
+    """State of the fake HTTP server: how many requests to reject and what it has seen."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reject = 0
+        self.retry_after = "0.2"
+        self.remaining = None
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+@pytest.fixture
+def fake_api():
+    api = FakeAPI()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with api.lock:
+                api.requests.append((time.monotonic(), self.path, self.headers.get("If-None-Match")))
+                api.in_flight += 1
+                api.max_in_flight = max(api.max_in_flight, api.in_flight)
+                rejected = api.reject > 0
+                api.reject -= rejected
+            try:
+                if self.path.startswith("/slow"):
+                    time.sleep(0.05)
+                if rejected:
+                    self.send_response(429)
+                    if api.retry_after is not None:
+                        self.send_header("Retry-After", api.retry_after)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self.path.startswith("/attachment") and self.headers.get("If-None-Match") == '"v1"':
+                    self.send_response(304)
+                    self.send_header("ETag", '"v1"')
+                    self.end_headers()
+                    return
+                body = self.path.encode("utf-8")
+                self.send_response(200)
+                self.send_header("ETag", '"v1"')
+                if api.remaining is not None:
+                    self.send_header("X-RateLimit-Remaining", api.remaining)
+                    self.send_header("X-RateLimit-Reset", "0.2")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with api.lock:
+                    api.in_flight -= 1
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    api.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield api
+    server.shutdown()
+    server.server_close()
+
+
+class TestParseDelay:
+    """Test cases for reading the rate limit headers"""
+
+    def test_seconds(self):
+        assert parse_delay("3") == 3
+        assert parse_delay("0.5") == 0.5
+
+    def test_epoch_seconds(self):
+        assert parse_delay(str(1_700_000_010), now=1_700_000_000) == 10
+
+    def test_http_date(self):
+        assert parse_delay("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480) == 10
+
+    def test_iso_time(self):
+        assert parse_delay("2015-10-21T07:28:10Z", now=1445412480) == 10
+
+    def test_past_time_waits_nothing(self):
+        assert parse_delay("2015-10-21T07:28:10+00:00", now=1445412490) == 0
+
+    def test_missing_or_unreadable(self):
+        assert parse_delay(None) is None
+        assert parse_delay("") is None
+        assert parse_delay("soon") is None
+
+
+class TestRateLimitedGet:
+    """Test cases for get_with_rate_limit against a fake HTTP server"""
+
+    def test_retries_after_the_delay_asked(self, fake_api):
+        fake_api.reject = 2
+        gate = RateLimitGate()
+        resp = get_with_rate_limit(requests.Session(), fake_api.url + "/page", gate)
+        assert resp.status_code == 200
+        times = [t for t, _, _ in fake_api.requests]
+        assert len(times) == 3
+        assert times[1] - times[0] >= 0.19 and times[2] - times[1] >= 0.19
+        assert gate.pauses == 2
+
+    def test_backs_off_without_retry_after(self, fake_api):
+        fake_api.reject, fake_api.retry_after = 1, None
+        resp = get_with_rate_limit(requests.Session(), fake_api.url + "/page", RateLimitGate(base_delay=0.1))
+        assert resp.status_code == 200
+        assert fake_api.requests[1][0] - fake_api.requests[0][0] >= 0.09
+
+    def test_gives_up_after_max_retries(self, fake_api):
+        fake_api.reject, fake_api.retry_after = 10, "0"
+        resp = get_with_rate_limit(requests.Session(), fake_api.url + "/page", RateLimitGate(), max_retries=2)
+        assert resp.status_code == 429
+        assert len(fake_api.requests) == 3
+
+    def test_rejection_pauses_every_thread(self, fake_api):
+        fake_api.reject = 1
+        gate = RateLimitGate()
+        session = requests.Session()
+        get_with_rate_limit(session, fake_api.url + "/first", gate, max_retries=0)
+        get_with_rate_limit(requests.Session(), fake_api.url + "/second", gate)
+        (t_first, _, _), (t_second, _, _) = fake_api.requests
+        assert t_second - t_first >= 0.19
+
+    def test_no_request_left_pauses_until_reset(self, fake_api):
+        fake_api.remaining = "0"
+        gate = RateLimitGate()
+        get_with_rate_limit(requests.Session(), fake_api.url + "/first", gate)
+        fake_api.remaining = None
+        get_with_rate_limit(requests.Session(), fake_api.url + "/second", gate)
+        (t_first, _, _), (t_second, _, _) = fake_api.requests
+        assert t_second - t_first >= 0.19
+
+    def test_unchanged_attachment_is_not_downloaded_again(self, fake_api):
+        session, gate = requests.Session(), RateLimitGate()
+        first = get_with_rate_limit(session, fake_api.url + "/attachment/1", gate)
+        assert first.status_code == 200 and first.headers["ETag"] == '"v1"'
+        again = get_with_rate_limit(session, fake_api.url + "/attachment/1", gate,
+                                    headers={"If-None-Match": first.headers["ETag"]})
+        assert again.status_code == 304 and not again.content
+        assert fake_api.requests[1][2] == '"v1"'
+
+
+class TestMapConcurrently:
+    """Test cases for map_concurrently"""
+
+    def test_keeps_order_and_bounds_concurrency(self, fake_api):
+        session, gate = requests.Session(), RateLimitGate()
+
+        def fetch(i):
+            return get_with_rate_limit(session, f"{fake_api.url}/slow/{i}", gate).text
+
+        st = time.monotonic()
+        assert list(map_concurrently(fetch, range(12), 4)) == [f"/slow/{i}" for i in range(12)]
+        assert fake_api.max_in_flight <= 4
+        assert time.monotonic() - st < 12 * 0.05
+
+    def test_reads_items_a_bounded_way_ahead(self):
+        taken = []
+
+        def items():
+            for i in range(100):
+                taken.append(i)
+                yield i
+
+        results = map_concurrently(lambda i: i * 2, items(), 3)
+        assert next(results) == 0
+        assert len(taken) <= 2 * 3 + 1
+        assert list(results) == [i * 2 for i in range(1, 100)]
+
+    def test_raises_in_place_of_the_failed_result(self):
+        def func(i):
+            if i == 3:
+                raise ValueError("boom")
+            return i
+
+        results = map_concurrently(func, range(10), 2)
+        assert [next(results) for _ in range(3)] == [0, 1, 2]
+        with pytest.raises(ValueError, match="boom"):
+            next(results)
+
+    def test_single_worker_runs_inline(self):
+        thread = []
+        assert list(map_concurrently(lambda i: thread.append(threading.current_thread()) or i, range(3), 1)) == [0, 1, 2]
+        assert set(thread) == {threading.current_thread()}
@@ -13,9 +13,11 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import sys
 import uuid
 import hashlib
-from common.misc_utils import get_uuid, download_img, hash_str2int, convert_bytes
+import pytest
+from common.misc_utils import get_uuid, download_img, hash_str2int, convert_bytes, LazyModule
 
 
 class TestGetUuid:
@@ -353,3 +355,35 @@ class TestConvertBytes:
         # Ensure we don't exceed available units
         huge_value = 100 * 1125899906842624  # 100 PB (still within PB range)
         assert "PB" in convert_bytes(huge_value)
+
+
+class TestLazyModule:
+    """Test cases for LazyModule class"""
+
+    def test_not_imported_before_use(self):
+        """Test that creating the proxy does not import the module"""
+        sys.modules.pop("colorsys", None)
+        mod = LazyModule("colorsys")
+        assert "colorsys" not in sys.modules
+        assert "colorsys" in repr(mod)
+        assert mod.module_name == "colorsys"
+        assert "colorsys" not in sys.modules
+
+    def test_attribute_access_imports(self):
+        """Test that the first attribute access imports the module and forwards to it"""
+        mod = LazyModule("colorsys")
+        assert mod.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+        assert "colorsys" in sys.modules
+        assert mod.rgb_to_hsv is sys.modules["colorsys"].rgb_to_hsv
+
+    def test_missing_module(self):
+        """Test that a missing module fails on use, not on creation"""
+        mod = LazyModule("no_such_module_for_lazy_test")
+        with pytest.raises(ModuleNotFoundError):
+            mod.anything
+
+    def test_missing_attribute(self):
+        """Test that a missing attribute raises AttributeError"""
+        mod = LazyModule("colorsys")
+        with pytest.raises(AttributeError):
+            mod.no_such_attribute
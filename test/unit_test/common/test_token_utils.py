@@ -14,7 +14,7 @@
 #  limitations under the License.
 #
 
-from common.token_utils import num_tokens_from_string, total_token_count_from_response, truncate, encoder
+from common.token_utils import num_tokens_from_string, total_token_count_from_response, truncate, encoder, pack_by_tokens
 import pytest
 
 
@@ -371,3 +371,29 @@ class TestTruncate:
 
         result = truncate(number_string, max_len)
         assert len(encoder.encode(result)) == max_len
+
+
+class TestPackByTokens:
+    """Test cases for pack_by_tokens function"""
+
+    def test_empty(self):
+        assert pack_by_tokens([], 100, 10) == []
+
+    def test_count_bound(self):
+        assert pack_by_tokens(["hello"] * 5, 100, 2) == [[0, 1], [2, 3], [4]]
+
+    def test_token_bound(self):
+        # "hello world" is 2 tokens
+        assert pack_by_tokens(["hello world"] * 4, 5, 10) == [[0, 1], [2, 3]]
+
+    def test_oversized_text_alone(self):
+        long_text = "hello " * 50
+        assert pack_by_tokens(["hello", long_text, "hello"], 10, 10) == [[0], [1], [2]]
+
+    def test_keeps_order_and_all_indices(self):
+        texts = ["word " * n for n in (3, 1, 7, 2, 2, 9, 1)]
+        groups = pack_by_tokens(texts, 10, 3)
+        assert [i for g in groups for i in g] == list(range(len(texts)))
+        for g in groups:
+            assert len(g) <= 3
+            assert len(g) == 1 or sum(num_tokens_from_string(texts[i]) for i in g) <= 10
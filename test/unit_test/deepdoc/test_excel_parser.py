@@ -0,0 +1,75 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import re
+import zipfile
+from io import BytesIO
+
+from openpyxl import Workbook
+
+from deepdoc.parser.excel_parser import RAGFlowExcelParser
+
+
+def xlsx(rows: list[list], dimension: str | None = None) -> bytes:
+    """An xlsx file of `rows`, with the `<dimension>` of its sheet replaced by `dimension` if given."""
+    wb = Workbook()
+    for row in rows:
+        wb.active.append(row)
+    buf = BytesIO()
+    wb.save(buf)
+    if dimension is None:
+        return buf.getvalue()
+    out = BytesIO()
+    with zipfile.ZipFile(BytesIO(buf.getvalue())) as src, zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            data = src.read(item.filename)
+            if item.filename == "xl/worksheets/sheet1.xml":
+                data, n = re.subn(rb'<dimension ref="[^"]*"', f'<dimension ref="{dimension}"'.encode(), data)
+                assert n == 1
+            dst.writestr(item, data)
+    return out.getvalue()
+
+
+ROWS = [["name", "age", "city"]] + [[f"n{i}", i, f"c{i}"] for i in range(50)]
+
+
+class TestReadOnlyWorkbook:
+    """Test cases for the workbooks opened in read-only mode"""
+
+    def test_reads_all_rows(self):
+        wb = RAGFlowExcelParser._load_excel_to_read_only_workbook(BytesIO(xlsx(ROWS)))
+        try:
+            assert [list(r) for r in wb.active.iter_rows(values_only=True)] == ROWS
+        finally:
+            wb.close()
+
+    def test_wrong_dimension_does_not_truncate(self):
+        wb = RAGFlowExcelParser._load_excel_to_read_only_workbook(BytesIO(xlsx(ROWS, "A1:A1")))
+        try:
+            assert [list(r) for r in wb.active.iter_rows(values_only=True)] == ROWS
+        finally:
+            wb.close()
+
+    def test_row_number_with_wrong_dimension(self):
+        assert RAGFlowExcelParser.row_number("data.xlsx", xlsx(ROWS, "A1:A1")) == len(ROWS)
+        assert RAGFlowExcelParser.row_number("data.xlsx", xlsx(ROWS, "A1:C3")) == len(ROWS)
+
+    def test_merged_cells_need_the_full_load(self):
+        wb = Workbook()
+        wb.active.append(["a", "b"])
+        wb.active.merge_cells("A1:B1")
+        buf = BytesIO()
+        wb.save(buf)
+        assert RAGFlowExcelParser._load_excel_to_read_only_workbook(BytesIO(buf.getvalue())) is None
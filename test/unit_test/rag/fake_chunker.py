@@ -0,0 +1,28 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""A parser module for the ChunkPool tests, which behaves after the name of the file it chunks."""
+import os
+import time
+
+
+def chunk(filename, binary=None, callback=None, **kwargs):
+    if filename == "crash":
+        os._exit(1)
+    callback(0.1, f"Chunking {filename}")
+    if filename == "slow":
+        time.sleep(2)
+    callback(0.5, "Half way")
+    return [{"content_with_weight": binary.decode("utf-8"), "pid": os.getpid(), **kwargs}]
@@ -0,0 +1,96 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+import trio
+
+from rag.svr.chunk_pool import ChunkPool
+
+
+class Canceled(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+class Progress:
+    def __init__(self, cancel_at=None):
+        self.cancel_at = cancel_at
+        self.calls = []
+
+    def __call__(self, prog=None, msg=""):
+        self.calls.append((prog, msg))
+        if self.cancel_at is not None and prog >= self.cancel_at:
+            raise Canceled(msg)
+
+
+@pytest.fixture
+def pool():
+    pool = ChunkPool(1, "chunk_pool_test", Canceled, preload=[], setup=False)
+    yield pool
+    pool.shutdown()
+
+
+def chunk(pool, filename, binary, callback, **kwargs):
+    return trio.run(lambda: pool.chunk("fake_chunker", filename, binary, callback, **kwargs))
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestChunkPool:
+    """Test cases for chunking in worker processes"""
+
+    def test_chunks_in_a_worker(self, pool):
+        cks = chunk(pool, "doc.txt", "hello".encode("utf-8"), Progress(), lang="English")
+        assert cks == [{"content_with_weight": "hello", "pid": cks[0]["pid"], "lang": "English"}]
+        assert cks[0]["pid"] != os.getpid()
+
+    def test_worker_is_reused(self, pool):
+        first = chunk(pool, "a.txt", b"a", Progress())
+        second = chunk(pool, "b.txt", b"b", Progress())
+        assert first[0]["pid"] == second[0]["pid"]
+
+    def test_progress_is_relayed(self, pool):
+        progress = Progress()
+        chunk(pool, "doc.txt", b"x", progress)
+        assert wait_for(lambda: len(progress.calls) == 2)
+        assert progress.calls == [(0.1, "Chunking doc.txt"), (0.5, "Half way")]
+        assert wait_for(lambda: not pool._callbacks)
+
+    def test_canceled_task_stops_waiting_for_its_worker(self, pool):
+        progress = Progress(cancel_at=0.1)
+        st = time.monotonic()
+        with pytest.raises(Canceled):
+            chunk(pool, "slow", b"x", progress)
+        assert time.monotonic() - st < 2
+        assert progress.calls == [(0.1, "Chunking slow")]
+        assert not pool._callbacks and not pool._canceled
+
+    def test_dead_worker_fails_its_task_and_the_pool_is_rebuilt(self, pool):
+        chunk(pool, "doc.txt", b"x", Progress())
+        broken = pool._executor
+        with pytest.raises(BrokenProcessPool):
+            chunk(pool, "crash", b"x", Progress())
+        assert pool._executor is None
+        assert chunk(pool, "doc.txt", b"again", Progress())[0]["content_with_weight"] == "again"
+        assert pool._executor is not broken
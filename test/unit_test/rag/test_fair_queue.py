@@ -0,0 +1,174 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import time
+
+import pytest
+
+from api.multi_tenancy import SubscriptionPlan
+from rag.utils import fair_queue
+from rag.utils.fair_queue import FairScheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = FairScheduler("group", "consumer")
+    scheduler._weights = {"heavy": 2, "light": 1}
+    return scheduler
+
+
+class TestAllot:
+    """Test cases for the deficit round robin of FairScheduler._allot"""
+
+    def test_shares_follow_the_weights(self, scheduler):
+        assert scheduler._allot(6, {"heavy": 100, "light": 100}) == {"heavy": 4, "light": 2}
+
+    def test_unknown_tenant_weighs_1(self, scheduler):
+        assert scheduler._allot(4, {"light": 100, "new": 100}) == {"light": 2, "new": 2}
+
+    def test_credits_carry_over_between_fetches(self, scheduler):
+        total = {"heavy": 0, "light": 0}
+        for _ in range(12):
+            for tenant_id, n in scheduler._allot(1, {"heavy": 100, "light": 100}).items():
+                total[tenant_id] += n
+        assert total == {"heavy": 8, "light": 4}
+
+    def test_exhausted_backlog_leaves_its_share_to_the_others(self, scheduler):
+        assert scheduler._allot(6, {"heavy": 1, "light": 100}) == {"heavy": 1, "light": 5}
+        assert scheduler._credits.get("heavy", 0) == 0
+
+    def test_empty_backlog_drops_the_tenant(self, scheduler):
+        scheduler._allot(3, {"heavy": 100, "light": 100})
+        assert scheduler._allot(3, {"heavy": 0, "light": 100}) == {"light": 3}
+        assert "heavy" not in scheduler._order and "heavy" not in scheduler._credits
+
+    def test_never_more_than_the_backlog(self, scheduler):
+        assert scheduler._allot(10, {"heavy": 1, "light": 2}) == {"heavy": 1, "light": 2}
+        assert scheduler._allot(10, {"heavy": 0, "light": 0}) == {}
+
+
+class FakeMessage:
+    def __init__(self, queue_name, msg_id):
+        self._queue_name = queue_name
+        self._msg_id = msg_id
+
+    def get_queue_name(self):
+        return self._queue_name
+
+    def get_msg_id(self):
+        return self._msg_id
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def zadd(self, key, mapping):
+        self._redis.zsets.setdefault(key, {}).update(mapping)
+
+    def zremrangebyscore(self, key, low, high):
+        zset = self._redis.zsets.get(key, {})
+        for member in [m for m, score in zset.items() if low <= score <= high]:
+            del zset[member]
+
+
+class FakeRedis:
+    """The part of RedisDB the fair scheduler uses, with `backlog` messages waiting on each queue."""
+
+    def __init__(self):
+        self.values = {}
+        self.zsets = {}
+        self.backlog = {}
+        self.seq = 0
+
+    def set(self, key, value, exp=3600):
+        self.values[key] = value
+        return True
+
+    def mget(self, keys):
+        return [self.values.get(k) for k in keys]
+
+    def zadd(self, key, member, score):
+        self.zsets.setdefault(key, {})[member] = score
+        return True
+
+    def zrangebyscore(self, key, low, high):
+        return [m for m, score in self.zsets.get(key, {}).items() if score >= low]
+
+    def pipeline(self, raise_on_error=True):
+        return FakePipeline(self)
+
+    def queue_create_group(self, queue_name, group_name):
+        return True
+
+    def queue_lags(self, queue_names, group_name):
+        return {q: self.backlog.get(q, 0) for q in queue_names}
+
+    def queue_consumer_many(self, counts, group_name, consumer_name):
+        msgs = []
+        for queue_name, n in counts.items():
+            n = min(n, self.backlog.get(queue_name, 0))
+            self.backlog[queue_name] = self.backlog.get(queue_name, 0) - n
+            for _ in range(n):
+                self.seq += 1
+                msgs.append(FakeMessage(queue_name, f"{int(time.time() * 1000)}-{self.seq}"))
+        return msgs
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(fair_queue, "REDIS_CONN", redis)
+    return redis
+
+
+class TestFetch:
+    """Test cases for FairScheduler.fetch with the plans published for the tenants"""
+
+    def test_published_plan_gets_its_share(self, redis):
+        for tenant_id in ("pro", "free"):
+            redis.zadd(fair_queue.ACTIVE_TENANTS_KEY, tenant_id, time.time())
+            redis.backlog[fair_queue.tenant_queue_name(tenant_id)] = 1000
+        assert fair_queue.publish_tenant_plan("pro", SubscriptionPlan.PROFESSIONAL)
+        scheduler = FairScheduler("group", "consumer")
+
+        taken = {"pro": 0, "free": 0}
+        for _ in range(10):
+            for msg in scheduler.fetch(6):
+                taken[msg.get_queue_name().rsplit("_", 1)[-1]] += 1
+
+        weight = fair_queue.plan_weight(SubscriptionPlan.PROFESSIONAL.value)
+        assert weight == 5
+        assert taken == {"pro": 50, "free": 10}
+        assert scheduler.stats()["pro"]["weight"] == weight
+
+    def test_stats_forget_idle_tenants(self, redis):
+        for tenant_id in ("a", "b"):
+            redis.zadd(fair_queue.ACTIVE_TENANTS_KEY, tenant_id, time.time())
+            redis.backlog[fair_queue.tenant_queue_name(tenant_id)] = 10
+        scheduler = FairScheduler("group", "consumer", refresh_interval=0.0)
+        scheduler.fetch(4)
+        assert {"a", "b"} <= set(scheduler.stats())
+
+        redis.backlog[fair_queue.tenant_queue_name("b")] = 0
+        del redis.zsets[fair_queue.ACTIVE_TENANTS_KEY]["b"]
+        scheduler.fetch(4)
+        assert "a" in scheduler.stats() and "b" not in scheduler.stats()
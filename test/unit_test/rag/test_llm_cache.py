@@ -0,0 +1,147 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import time
+
+import pytest
+
+from rag.utils import llm_cache
+from rag.utils.llm_cache import LLMCache, decode_value, encode_value
+
+
+class FakeRedis:
+    """The part of RedisDB the LLM cache uses, keeping the expiry each key was set with."""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def mget(self, keys):
+        return [self.values.get(k) for k in keys]
+
+    def set(self, key, value, exp=3600):
+        self.values[key] = value
+        self.ttls[key] = exp
+        return True
+
+    def mset_with_ttl(self, mapping, exp=3600):
+        for k, v in mapping.items():
+            self.set(k, v, exp)
+        return True
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(llm_cache, "REDIS_CONN", fake)
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_TTLS", {"extraction": 100, "enrichment": 10})
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_TTL", 1000)
+    return fake
+
+
+LONG = "entity<|>relation<|>description " * 100
+
+
+class TestEncoding:
+    """Test cases for the compressed form of the cached responses"""
+
+    def test_short_value_is_kept_as_is(self):
+        assert encode_value("yes") == "yes"
+        assert decode_value("yes") == "yes"
+
+    def test_zstd_round_trip(self):
+        if llm_cache.zstandard is None:
+            pytest.skip("zstandard isn't installed")
+        encoded = encode_value(LONG)
+        assert encoded.startswith(llm_cache._ZSTD) and len(encoded) < len(LONG)
+        assert decode_value(encoded) == LONG
+
+    def test_zlib_round_trip(self, monkeypatch):
+        monkeypatch.setattr(llm_cache, "zstandard", None)
+        encoded = encode_value(LONG)
+        assert encoded.startswith(llm_cache._ZLIB) and len(encoded) < len(LONG)
+        assert decode_value(encoded) == LONG
+
+    def test_unicode_round_trip(self):
+        value = "实体<|>关系 😀 " * 100
+        assert decode_value(encode_value(value)) == value
+
+    def test_incompressible_value_is_kept_as_is(self):
+        value = "".join(chr(0x4e00 + (i * 7919) % 20000) for i in range(400))
+        encoded = encode_value(value)
+        assert encoded == value or len(encoded) < len(value.encode("utf-8"))
+        assert decode_value(encoded) == value
+
+    def test_legacy_uncompressed_entry_reads_as_is(self, redis):
+        redis.values["legacy"] = LONG
+        assert LLMCache(local_bytes=0).get("legacy") == LONG
+
+
+class TestLLMCache:
+    """Test cases for the local tier in front of Redis"""
+
+    def test_set_then_get_many(self, redis):
+        cache = LLMCache()
+        cache.set_many({"a": LONG, "b": "short"})
+        assert redis.values["a"] != LONG and redis.values["b"] == "short"
+        assert LLMCache().get_many(["a", "b", "c"]) == [LONG, "short", None]
+        assert cache.get_many(["a", "b"]) == [LONG, "short"]
+        assert cache.stats()["local_hits"] == 2
+
+    def test_local_tier_is_bounded_in_bytes(self, redis):
+        cache = LLMCache(local_bytes=100)
+        for i in range(10):
+            cache.set(f"k{i}", str(i) * 30)
+        assert cache.stats()["local_bytes"] <= 100
+        assert cache._get_local("k0") is None
+        assert cache._get_local("k9") == "9" * 30
+        # Evicted locally, still in Redis.
+        assert cache.get("k0") == "0" * 30
+
+    def test_value_larger_than_the_local_tier_skips_it(self, redis):
+        cache = LLMCache(local_bytes=10)
+        cache.set("big", "x" * 50)
+        assert cache.stats()["local_bytes"] == 0
+        assert cache.get("big") == "x" * 50
+
+    def test_set_many_uses_the_ttl_of_the_use_case(self, redis):
+        cache = LLMCache()
+        cache.set_many({"a": "1", "b": "2"}, "enrichment")
+        cache.set("c", "3", "extraction")
+        cache.set("d", "4")
+        assert redis.ttls == {"a": 10, "b": 10, "c": 100, "d": 1000}
+
+    def test_get_many_keeps_entries_locally_for_the_ttl_of_the_use_case(self, redis):
+        redis.values.update({"a": "1", "b": "2"})
+        cache = LLMCache(local_ttl=600)
+        before = time.time()
+        assert cache.get_many(["a", "b"], "enrichment") == ["1", "2"]
+        assert all(before + 10 <= cache._local[k][0] <= time.time() + 10 for k in ("a", "b"))
+
+    def test_local_entry_expires(self, redis):
+        cache = LLMCache(local_ttl=0)
+        cache.set("a", "1")
+        redis.values.clear()
+        assert cache.get("a") is None
+
+    def test_value_too_large_stays_out_of_redis(self, redis, monkeypatch):
+        monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_VALUE_BYTES", 10)
+        cache = LLMCache()
+        cache.set_many({"big": "0123456789abcdef"})
+        assert "big" not in redis.values
+        assert cache.stats()["too_large"] == 1
@@ -0,0 +1,267 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import time
+
+import pytest
+
+from rag.svr.task_consumer import TaskConsumer
+
+GROUP = "group"
+HIGH, NORMAL = "queue_1", "queue"
+TIMEOUT = 60
+
+
+class FakeMsg:
+    def __init__(self, redis, queue_name, msg_id):
+        self.redis = redis
+        self.queue_name = queue_name
+        self.msg_id = msg_id
+
+    def ack(self):
+        self.redis.pending[self.queue_name].pop(self.msg_id, None)
+
+    def get_msg_id(self):
+        return self.msg_id
+
+    def get_queue_name(self):
+        return self.queue_name
+
+    def get_message(self):
+        return self.redis.streams[self.queue_name][self.msg_id]
+
+
+class FakeRedis:
+    """Streams with a single consumer group, the part of RedisDB a TaskConsumer uses."""
+
+    def __init__(self):
+        self.streams = {}
+        self.delivered = {}
+        # queue -> msg id -> [consumer, delivered at]
+        self.pending = {}
+        self.heartbeats = {}
+        self.seq = 0
+        self.reads = []
+
+    def add(self, queue_name, message):
+        self.seq += 1
+        msg_id = f"{self.seq}-0"
+        self.streams.setdefault(queue_name, {})[msg_id] = message
+        return msg_id
+
+    def queue_create_group(self, queue_name, group_name):
+        self.streams.setdefault(queue_name, {})
+        self.delivered.setdefault(queue_name, 0)
+        self.pending.setdefault(queue_name, {})
+        return True
+
+    def _msg(self, queue_name, msg_id):
+        return FakeMsg(self, queue_name, msg_id)
+
+    def queue_consumer_batch(self, queue_names, group_name, consumer_name, count=1, block_ms=None, msg_id=">"):
+        self.reads.append((tuple(queue_names), count, block_ms, msg_id))
+        msgs = []
+        for queue_name in queue_names:
+            if msg_id != ">":
+                after = int(msg_id.split("-")[0])
+                ids = [i for i, (c, _) in self.pending[queue_name].items() if c == consumer_name and int(i.split("-")[0]) > after]
+                msgs.extend(self._msg(queue_name, i) for i in sorted(ids, key=lambda i: int(i.split("-")[0]))[:count])
+                continue
+            new = [i for i in self.streams[queue_name] if int(i.split("-")[0]) > self.delivered[queue_name]][:count]
+            for i in new:
+                self.delivered[queue_name] = int(i.split("-")[0])
+                self.pending[queue_name][i] = [consumer_name, time.time()]
+                msgs.append(self._msg(queue_name, i))
+        return msgs
+
+    def queue_consumers(self, queue_name, group_name):
+        counts = {}
+        for consumer_name, _ in self.pending.get(queue_name, {}).values():
+            counts[consumer_name] = counts.get(consumer_name, 0) + 1
+        return counts
+
+    def queue_claim(self, queue_name, group_name, consumer_name, from_consumer, min_idle_ms, count=1):
+        now = time.time()
+        ids = [i for i, (c, at) in self.pending[queue_name].items() if c == from_consumer and (now - at) * 1000 >= min_idle_ms][:count]
+        for i in ids:
+            self.pending[queue_name][i] = [consumer_name, now]
+        return [self._msg(queue_name, i) for i in ids]
+
+    def last_heartbeats(self, consumer_names):
+        return {c: self.heartbeats.get(c) for c in consumer_names}
+
+    def queue_touch(self, queue_name, group_name, consumer_name, msg_ids):
+        for i in msg_ids:
+            self.pending[queue_name][i][1] = time.time()
+        return True
+
+    def deliver(self, queue_name, consumer_name, idle=0.0):
+        """Delivers the next message of the queue to `consumer_name`, `idle` seconds ago."""
+        msg = self.queue_consumer_batch([queue_name], GROUP, consumer_name)[0]
+        self.pending[queue_name][msg.msg_id][1] -= idle
+        return msg.msg_id
+
+
+class FakeFairScheduler:
+    def __init__(self, redis, tenant_queues):
+        self.redis = redis
+        self.tenant_queues = tenant_queues
+        self.asked = []
+
+    def queue_names(self):
+        return [NORMAL] + self.tenant_queues
+
+    def fetch(self, count):
+        self.asked.append(count)
+        return self.redis.queue_consumer_batch(self.queue_names(), GROUP, "me", count)[:count]
+
+
+@pytest.fixture
+def redis():
+    redis = FakeRedis()
+    for queue_name in (HIGH, NORMAL):
+        redis.queue_create_group(queue_name, GROUP)
+    return redis
+
+
+def consumer(redis, name="me", fair_scheduler=None):
+    return TaskConsumer(redis, GROUP, name, HIGH, NORMAL, TIMEOUT, 100, fair_scheduler)
+
+
+def take(c, count):
+    c.fetch(count)
+    msgs = []
+    while len(msgs) < count and (msg := c.pop()) is not None:
+        msgs.append(msg.get_msg_id())
+    return msgs
+
+
+class TestBatches:
+    """Test cases for reading the new messages by batches"""
+
+    def test_high_priority_first(self, redis):
+        normal = [redis.add(NORMAL, {"n": i}) for i in range(3)]
+        high = redis.add(HIGH, {"h": 0})
+        assert take(consumer(redis), 3) == [high] + normal[:2]
+
+    def test_messages_read_ahead_are_kept(self, redis):
+        ids = [redis.add(NORMAL, {"n": i}) for i in range(4)]
+        c = consumer(redis)
+        c.fetch(2)
+        reads = len(redis.reads)
+        assert [c.pop().get_msg_id(), c.pop().get_msg_id()] == ids[:2]
+        assert take(c, 1) == ids[2:3]
+        # Only the high priority queue was looked at for the message already read.
+        assert [r[0] for r in redis.reads[reads:]] == [(HIGH, NORMAL)]
+
+    def test_new_high_priority_goes_before_messages_read_ahead(self, redis):
+        ids = [redis.add(NORMAL, {"n": i}) for i in range(2)]
+        c = consumer(redis)
+        assert take(c, 1) == ids[:1]
+        high = redis.add(HIGH, {"h": 0})
+        assert take(c, 2) == [high, ids[1]]
+
+    def test_blocks_only_with_nothing_to_do(self, redis):
+        c = consumer(redis)
+        assert take(c, 2) == []
+        assert redis.reads[-1][2] == 100
+        redis.add(NORMAL, {"n": 0})
+        redis.add(NORMAL, {"n": 1})
+        c.fetch(1)
+        c.fetch(2)
+        assert redis.reads[-1][2] is None
+
+    def test_fair_scheduler_after_high_priority(self, redis):
+        redis.queue_create_group("tenant_a", GROUP)
+        tenant = redis.add("tenant_a", {"t": 0})
+        high = redis.add(HIGH, {"h": 0})
+        fair = FakeFairScheduler(redis, ["tenant_a"])
+        assert take(consumer(redis, fair_scheduler=fair), 2) == [high, tenant]
+        assert fair.asked == [1]
+
+    def test_ack_and_touch(self, redis):
+        ids = [redis.add(NORMAL, {"n": i}) for i in range(2)]
+        c = consumer(redis)
+        c.fetch(2)
+        first, second = c.pop(), c.pop()
+        c.ack(first)
+        assert list(redis.pending[NORMAL]) == [ids[1]]
+        redis.pending[NORMAL][ids[1]][1] -= 1000
+        c.touch()
+        assert time.time() - redis.pending[NORMAL][second.get_msg_id()][1] < 1
+
+
+class TestUnacked:
+    """Test cases for reading again the messages delivered before a restart"""
+
+    def test_unacked_messages_come_first(self, redis):
+        before = [redis.add(NORMAL, {"n": i}) for i in range(3)]
+        for _ in before:
+            redis.deliver(NORMAL, "me")
+        new = redis.add(NORMAL, {"n": 3})
+        c = consumer(redis)
+        assert take(c, 2) == before[:2]
+        assert take(c, 2) == [before[2], new]
+
+    def test_unacked_of_other_consumers_are_left(self, redis):
+        redis.add(NORMAL, {"n": 0})
+        redis.deliver(NORMAL, "other")
+        redis.heartbeats["other"] = time.time()
+        new = redis.add(NORMAL, {"n": 1})
+        assert take(consumer(redis), 2) == [new]
+
+
+class TestClaim:
+    """Test cases for taking over the messages of the executors that stopped"""
+
+    def test_claims_from_executor_without_heartbeat(self, redis):
+        redis.add(NORMAL, {"n": 0})
+        msg_id = redis.deliver(NORMAL, "gone", idle=2 * TIMEOUT)
+        assert take(consumer(redis), 1) == [msg_id]
+        assert redis.pending[NORMAL][msg_id][0] == "me"
+
+    def test_claims_from_executor_whose_heartbeat_expired(self, redis):
+        redis.add(NORMAL, {"n": 0})
+        msg_id = redis.deliver(NORMAL, "stopped", idle=2 * TIMEOUT)
+        redis.heartbeats["stopped"] = time.time() - 2 * TIMEOUT
+        assert take(consumer(redis), 1) == [msg_id]
+
+    def test_long_task_of_live_executor_is_left(self, redis):
+        redis.add(NORMAL, {"n": 0})
+        msg_id = redis.deliver(NORMAL, "busy", idle=10 * TIMEOUT)
+        redis.heartbeats["busy"] = time.time()
+        assert take(consumer(redis), 1) == []
+        assert redis.pending[NORMAL][msg_id][0] == "busy"
+
+    def test_recent_message_of_stopped_executor_is_left(self, redis):
+        redis.add(NORMAL, {"n": 0})
+        msg_id = redis.deliver(NORMAL, "gone")
+        assert take(consumer(redis), 1) == []
+        assert redis.pending[NORMAL][msg_id][0] == "gone"
+
+    def test_unknown_heartbeats_claim_nothing(self, redis, monkeypatch):
+        redis.add(NORMAL, {"n": 0})
+        redis.deliver(NORMAL, "gone", idle=2 * TIMEOUT)
+        monkeypatch.setattr(redis, "last_heartbeats", lambda consumer_names: None)
+        assert take(consumer(redis), 1) == []
+
+    def test_claims_at_most_every_quarter_of_the_timeout(self, redis):
+        c = consumer(redis)
+        assert take(c, 1) == []
+        redis.add(NORMAL, {"n": 0})
+        msg_id = redis.deliver(NORMAL, "gone", idle=2 * TIMEOUT)
+        assert take(c, 1) == []
+        c._claimed_at = 0
+        assert take(c, 1) == [msg_id]